@@ -0,0 +1,118 @@
+"""Compare the cost of the coverage collection modes.
+
+Runs the unittest executor over a project without coverage, and then
+with each coverage mode, reporting the best wall-clock time of several
+runs. By default, the sample unittest project is used; use --synthetic
+to generate a CPU-bound project where the cost of tracing dominates.
+
+Usage:
+
+    python benchmarks/coverage_modes.py [--repeat N] [--synthetic | PROJECT]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from cricket.coverage_data import COVERAGE_MODES
+
+
+SYNTHETIC_MODULE = '''
+def work(n):
+    total = 0
+    for i in range(n):
+        if i % 3:
+            total += i
+        else:
+            total -= 1
+    return total
+'''
+
+SYNTHETIC_TEST = '''
+import unittest
+
+from tests.work import work
+
+
+class WorkTests{index}(unittest.TestCase):
+{methods}
+'''
+
+SYNTHETIC_METHOD = '''
+    def test_work_{index}(self):
+        self.assertTrue(work(20000))
+'''
+
+
+def synthetic_project(path, modules=20, methods=20):
+    "Generate a project of CPU-bound tests."
+    os.makedirs(os.path.join(path, 'tests'))
+    with open(os.path.join(path, 'tests', '__init__.py'), 'w'):
+        pass
+    with open(os.path.join(path, 'tests', 'work.py'), 'w') as f:
+        f.write(SYNTHETIC_MODULE)
+    for index in range(modules):
+        with open(os.path.join(path, 'tests', 'test_work_{}.py'.format(index)), 'w') as f:
+            f.write(SYNTHETIC_TEST.format(
+                index=index,
+                methods=''.join(SYNTHETIC_METHOD.format(index=i) for i in range(methods))
+            ))
+
+
+def run(project, args):
+    "Run the unittest executor in project, returning the elapsed time."
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-m', 'cricket.unittest.executor'] + args,
+        cwd=project,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+    elapsed = time.perf_counter() - start
+
+    # Discard any coverage data that was written.
+    for filename in os.listdir(project):
+        if filename.startswith('.coverage'):
+            os.remove(os.path.join(project, filename))
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs of each mode.')
+    parser.add_argument('--synthetic', action='store_true', help='Benchmark a generated CPU-bound project.')
+    parser.add_argument(
+        'project', nargs='?',
+        default=os.path.join(os.path.dirname(__file__), '..', 'sample', 'unittest'),
+        help='The project to benchmark.'
+    )
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if options.synthetic:
+            project = tmpdir
+            synthetic_project(project)
+        else:
+            project = os.path.abspath(options.project)
+
+        configurations = [('no coverage', [])] + [
+            (mode, ['--coverage', '--coverage-mode={}'.format(mode)])
+            for mode in COVERAGE_MODES
+        ]
+
+        baseline = None
+        for name, args in configurations:
+            best = min(run(project, args) for i in range(options.repeat))
+            if baseline is None:
+                baseline = best
+                print('{:>12}: {:.3f}s'.format(name, best))
+            else:
+                print('{:>12}: {:.3f}s ({:+.0%})'.format(name, best, best / baseline - 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare the cost of flattening a nested test suite.
+
+Builds a synthetic suite shaped like the output of unittest discovery
+(a suite of modules, each a suite of test cases, each a suite of
+tests), and times the flattening used by discovery (consume) and by the
+executor (unroll_test_suite) against the implementations they replaced.
+By default, the suite contains 100,000 tests.
+
+Usage:
+
+    python benchmarks/flatten.py [--modules N] [--classes N] [--tests N] [--repeat N]
+"""
+import argparse
+import time
+import unittest
+from collections import OrderedDict
+
+from cricket.unittest.discoverer import consume
+from cricket.unittest.executor import unroll_test_suite
+
+
+def previous_consume(iterable):
+    "The list-based flattening previously used by discovery."
+    input = list(iterable)
+    while input:
+        item = input.pop(0)
+        try:
+            data = iter(item)
+            input = list(data) + input
+        except TypeError:
+            yield item
+
+
+def previous_unroll_test_suite(suite):
+    "The recursive flattening previously used by the executor."
+    flat = OrderedDict()
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            flat.update(previous_unroll_test_suite(test))
+        else:
+            flat[test] = None
+    return flat
+
+
+def synthetic_suite(modules, classes, tests):
+    "Build a suite of `modules` modules, each with `classes` test cases of `tests` tests."
+    def test():
+        pass
+
+    return unittest.TestSuite(
+        unittest.TestSuite(
+            unittest.TestSuite(
+                # Each test needs a distinct description, or they are all equal.
+                unittest.FunctionTestCase(test, description='{}.{}.{}'.format(m, c, t))
+                for t in range(tests)
+            )
+            for c in range(classes)
+        )
+        for m in range(modules)
+    )
+
+
+def best_time(function, suite, repeat):
+    "Return the best time of several calls to function(suite), and the number of tests found."
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        count = len(list(function(suite)))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', type=int, default=10000, help='Number of test modules in the suite.')
+    parser.add_argument('--classes', type=int, default=2, help='Number of test cases in each module.')
+    parser.add_argument('--tests', type=int, default=5, help='Number of tests in each test case.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each implementation.')
+    parser.add_argument(
+        '--skip-previous', action='store_true',
+        help="Don't time the previous implementations (which are quadratic)."
+    )
+    options = parser.parse_args()
+
+    suite = synthetic_suite(options.modules, options.classes, options.tests)
+
+    implementations = [
+        ('consume', consume, previous_consume),
+        ('unroll_test_suite', unroll_test_suite, previous_unroll_test_suite),
+    ]
+    for name, current, previous in implementations:
+        elapsed, count = best_time(current, suite, options.repeat)
+        print('{:>18}: {:.3f}s ({} tests)'.format(name, elapsed, count))
+        if not options.skip_previous:
+            previous_elapsed, previous_count = best_time(previous, suite, options.repeat)
+            print('{:>18}: {:.3f}s ({} tests, {:.0f}x slower)'.format(
+                'previous', previous_elapsed, previous_count, previous_elapsed / elapsed
+            ))
+
+
+if __name__ == '__main__':
+    main()
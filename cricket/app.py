@@ -6,8 +6,8 @@ to initiate the GUI main loop.
 from argparse import ArgumentParser
 
 import toga
+from cricket.coverage_data import COVERAGE_MODES
 from cricket.view import Cricket
-from cricket.model import ModelLoadError
 
 
 def main(Model):
@@ -19,6 +19,48 @@ def main(Model):
     parser = ArgumentParser()
 
     parser.add_argument("--version", help="Display version number and exit", action="store_true")
+    parser.add_argument(
+        "--failed-first",
+        help="Run tests that failed on their last run first, then tests in files "
+             "modified since the last run, then all other tests, quickest first",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--maxfail", metavar="N", type=int,
+        help="Stop a test run after N failures or errors"
+    )
+    parser.add_argument(
+        "-x", "--exitfirst", dest="maxfail", action="store_const", const=1,
+        help="Stop a test run after the first failure or error"
+    )
+    parser.add_argument(
+        "--coverage-mode", choices=COVERAGE_MODES, default='trace',
+        help="How coverage data should be collected: 'trace' uses coverage.py's "
+             "default tracer; 'sysmon' uses a lower overhead line collector "
+             "based on sys.monitoring (Python 3.12+)"
+    )
+    parser.add_argument(
+        "--resources",
+        help="Record the memory, time, open files and threads used by each test",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--static-discovery",
+        help="Discover tests by parsing test files, rather than importing them, "
+             "wherever possible (unittest and pytest only)",
+        action="store_true"
+    )
+    parser.add_argument(
+        "-m", "--marker", dest="markers", metavar="MARKER", action="append",
+        help="Only run tests with this marker (a pytest mark, or a Django tag). "
+             "Can be provided more than once, to run tests with any of the markers"
+    )
+    parser.add_argument(
+        "--watch",
+        help="Watch for changes to source files, and automatically re-run the "
+             "tests in the changed files, and the tests that execute them",
+        action="store_true"
+    )
 
     options = parser.parse_args()
 
@@ -34,26 +76,18 @@ def main(Model):
         app_id='org.pybee.cricket',
         app_name='cricket'
     )
+    app.watch = options.watch
+
+    # Create the test_suite objects. Tests are discovered
+    # once the GUI has started.
+    test_suite = Model(options)
 
-    # Try to load the test_suite. If any error occurs during
-    # test suite load, show an error dialog
-    test_suite = None
-    while test_suite is None:
-        try:
-            # Create the test_suite objects
-            test_suite = Model(options)
-            test_suite.refresh()
-        except ModelLoadError as e:
-            # Load failed; destroy the test_suite and show an error dialog.
-            #   If the user selects cancel, quit.
-            app.test_load_error = e.trace
-        else:
-            app.test_load_error = None
-
-    if test_suite.errors:
-        app.ignorable_test_load_error = '\n'.join(test_suite.errors)
-    else:
-        app.ignorable_test_load_error = None
+    test_suite.static_discovery = options.static_discovery
+    test_suite.markers = set(options.markers) if options.markers else None
+    test_suite.failed_first = options.failed_first
+    test_suite.maxfail = options.maxfail
+    test_suite.record_resources = options.resources
+    test_suite.coverage_mode = options.coverage_mode
 
     # Set the test_suite for the main window.
     # This populates the tree, and sets listeners for
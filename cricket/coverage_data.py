@@ -0,0 +1,350 @@
+"""Management of the coverage data gathered by test runs.
+
+Each test runner process writes coverage data to its own file, so that
+concurrent processes can't overwrite each other's data. Once a process
+has finished, its data is merged into the main coverage data file in
+the background.
+"""
+import asyncio
+import glob
+import os
+import sys
+import sysconfig
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from coverage import Coverage, CoverageData
+    from coverage.config import DEFAULT_EXCLUDE
+    from coverage.parser import PythonParser
+except ImportError:
+    Coverage = None
+    CoverageData = None
+
+
+# The ways in which coverage data can be collected:
+#   * trace: coverage.py, using its default measurement core.
+#   * sysmon: Cricket's own line collector, using sys.monitoring
+#     (Python 3.12+). Much cheaper, but only measures lines.
+COVERAGE_MODES = ('trace', 'sysmon')
+
+
+def create_collector(mode='trace'):
+    """Create a collector that will write coverage data to a per-process data file.
+
+    The collector provides the subset of the coverage.Coverage API
+    used by Cricket's executors: start(), stop(), save() and
+    switch_context(). If the requested mode isn't available in
+    this version of Python, or sys.monitoring is already being used
+    for coverage (e.g., by coverage.py measuring the test runner
+    itself), coverage.py will be used instead.
+    """
+    if mode == 'sysmon':
+        if hasattr(sys, 'monitoring'):
+            try:
+                return MonitoringCollector()
+            except ValueError as e:
+                warnings.warn("{}; using trace coverage mode.".format(e))
+        else:
+            warnings.warn("sys.monitoring isn't available; using trace coverage mode.")
+    return Coverage(data_suffix=True)
+
+
+class MonitoringCollector:
+    """A low-overhead line coverage collector, using sys.monitoring.
+
+    A line event is disabled as soon as it has been recorded, so each
+    line costs at most one callback per test, no matter how often it
+    is executed. Line events are re-enabled whenever the context
+    changes, so that every test records the lines it executes.
+
+    Only files in the current working directory (excluding installed
+    packages) are measured.
+
+    Raises ValueError if another tool is already using the coverage
+    tool ID of sys.monitoring.
+    """
+    def __init__(self, data_file='.coverage'):
+        self.data_file = data_file
+        self.tool_id = sys.monitoring.COVERAGE_ID
+
+        tool = sys.monitoring.get_tool(self.tool_id)
+        if tool is not None:
+            raise ValueError("sys.monitoring is already being used for coverage by {}".format(tool))
+
+        self._root = os.path.join(os.getcwd(), '')
+        self._excluded = tuple(
+            os.path.join(path, '')
+            for path in {
+                sysconfig.get_path(name)
+                for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')
+            }
+        )
+
+        # The measured filename for each code filename,
+        # or None if that file isn't being measured.
+        self._filenames = {}
+
+        # context -> {filename: set of line numbers}
+        self._lines = {}
+        self._current = self._lines.setdefault('', {})
+
+    def _measured_filename(self, filename):
+        # Code that wasn't loaded from a file (e.g., "<string>")
+        if filename.startswith('<'):
+            return None
+
+        filename = os.path.abspath(filename)
+        if filename.startswith(self._root) and not filename.startswith(self._excluded):
+            return filename
+        return None
+
+    def _line(self, code, line_number):
+        try:
+            filename = self._filenames[code.co_filename]
+        except KeyError:
+            filename = self._measured_filename(code.co_filename)
+            self._filenames[code.co_filename] = filename
+
+        if filename is not None:
+            try:
+                self._current[filename].add(line_number)
+            except KeyError:
+                self._current[filename] = {line_number}
+
+        return sys.monitoring.DISABLE
+
+    def start(self):
+        sys.monitoring.use_tool_id(self.tool_id, 'cricket')
+        sys.monitoring.register_callback(self.tool_id, sys.monitoring.events.LINE, self._line)
+        sys.monitoring.set_events(self.tool_id, sys.monitoring.events.LINE)
+
+    def stop(self):
+        sys.monitoring.set_events(self.tool_id, 0)
+        sys.monitoring.register_callback(self.tool_id, sys.monitoring.events.LINE, None)
+        sys.monitoring.free_tool_id(self.tool_id)
+
+    def switch_context(self, context):
+        self._current = self._lines.setdefault(context, {})
+        sys.monitoring.restart_events()
+
+    def save(self):
+        data = CoverageData(basename=self.data_file, suffix=True)
+        for context, lines in self._lines.items():
+            if lines:
+                data.set_context(context)
+                data.add_lines(lines)
+        data.write()
+
+
+def bitset(lines):
+    "Convert an iterable of line numbers into a bitset (an int with bit n set for line n)."
+    bits = bytearray()
+    for line in lines:
+        index = line >> 3
+        if index >= len(bits):
+            bits.extend(bytes(index - len(bits) + 1))
+        bits[index] |= 1 << (line & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bitset_lines(bits):
+    "Convert a bitset into a set of line numbers."
+    return {
+        line
+        for line, bit in enumerate(reversed(bin(bits)[2:]))
+        if bit == '1'
+    }
+
+
+def bitset_count(bits):
+    "Count the number of lines in a bitset."
+    return bin(bits).count('1')
+
+
+class CoverageIndex:
+    """An index of the lines executed in each measured file.
+
+    Lines are held as bitsets, so a summary of coverage can be computed
+    without re-reading the coverage data. Executable statements are
+    determined by parsing each file, and are cached until the file is
+    modified.
+    """
+    def __init__(self):
+        # filename -> bitset of executed lines
+        self.executed = {}
+
+        # filename -> (mtime, bitset of executable statements)
+        self._statements = {}
+
+    def clear(self):
+        "Discard all executed lines."
+        self.executed = {}
+
+    def update(self, data_file):
+        "Add the lines executed in a coverage data file to the index."
+        data = CoverageData(data_file)
+        data.read()
+
+        # The index is updated in the background, so build a new mapping
+        # and replace the old one, rather than modifying it in place.
+        executed = dict(self.executed)
+        for filename in data.measured_files():
+            executed[filename] = executed.get(filename, 0) | bitset(data.lines(filename) or [])
+
+            # Parse the file now, rather than when the summary is requested.
+            self.statements(filename)
+        self.executed = executed
+
+    def statements(self, filename):
+        "Return the bitset of executable statements in a file."
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            return 0
+
+        statements_mtime, statements = self._statements.get(filename, (None, None))
+        if statements_mtime != mtime:
+            parser = PythonParser(filename=filename, exclude='|'.join(DEFAULT_EXCLUDE))
+            try:
+                parser.parse_source()
+                statements = bitset(parser.statements)
+            except Exception:
+                # The file can't be parsed.
+                statements = None
+            self._statements[filename] = (mtime, statements)
+
+        if statements is None:
+            # Treat every executed line as a statement.
+            return self.executed.get(filename, 0)
+        return statements
+
+    def summary(self):
+        """Summarize the coverage of every measured file.
+
+        Returns a list of (filename, statements, missing, percent covered),
+        sorted by filename.
+        """
+        summary = []
+        for filename in sorted(self.executed):
+            statements = self.statements(filename)
+            n_statements = bitset_count(statements)
+            n_missing = bitset_count(statements & ~self.executed[filename])
+            if n_statements:
+                percent = 100.0 * (n_statements - n_missing) / n_statements
+            else:
+                percent = 100.0
+            summary.append((filename, n_statements, n_missing, percent))
+        return summary
+
+    def lines(self, filename):
+        """Return the sets of executed and missing line numbers in a file.
+        """
+        statements = self.statements(filename)
+        executed = self.executed.get(filename, 0)
+        return bitset_lines(statements & executed), bitset_lines(statements & ~executed)
+
+
+class CoverageMerger:
+    """Merges per-process coverage data files into a single data file.
+
+    If an impact index is provided, it is updated with the per-test
+    contexts of each process as that process's data is merged. If a
+    coverage index is provided, it is updated with the executed lines
+    of each process.
+
+    `on_merge` is invoked (on the event loop) whenever a merge completes.
+
+    A data file that can't be read (e.g., because the process writing
+    it was killed) is skipped, and reported by `wait()`, rather than
+    preventing the rest of the data from being merged. The file is
+    left in place.
+    """
+    def __init__(self, data_file='.coverage', impact_index=None, coverage_index=None, on_merge=None):
+        self.data_file = data_file
+        self.impact_index = impact_index
+        self.coverage_index = coverage_index
+        self.on_merge = on_merge
+
+        # Merges are performed one at a time, in the order they
+        # were requested, on a single background thread.
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+    def merge(self, pid):
+        """Merge the data written by the process `pid` in the background.
+
+        Returns immediately; use `wait()` to wait until all requested
+        merges have completed.
+        """
+        loop = asyncio.get_event_loop()
+        self._schedule(loop.run_in_executor(self._pool, self._merge, pid))
+
+    def _schedule(self, future):
+        if self.on_merge is not None:
+            future.add_done_callback(lambda f: self.on_merge())
+        self._pending.append(future)
+
+    async def wait(self):
+        """Wait until every requested merge has completed.
+
+        Returns a list of descriptions of the data that couldn't be merged.
+        """
+        pending, self._pending = self._pending, []
+        failures = []
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, Exception):
+                failures.append(str(result))
+            elif result:
+                failures.extend(result)
+        return failures
+
+    def _merge(self, pid):
+        # Parallel data files are named <data_file>.<host>.<pid>.<random>;
+        # recent versions of coverage prefix the pid with "pid".
+        process_files = []
+        failures = []
+        for process_file in glob.glob('{}.*[.d]{}.*'.format(self.data_file, pid)):
+            try:
+                CoverageData(process_file).read()
+            except Exception as e:
+                failures.append('{}: {}'.format(process_file, e))
+            else:
+                process_files.append(process_file)
+        if not process_files:
+            return failures
+
+        if self.impact_index is not None:
+            for process_file in process_files:
+                self.impact_index.update(process_file)
+            self.impact_index.save()
+
+        if self.coverage_index is not None:
+            for process_file in process_files:
+                self.coverage_index.update(process_file)
+
+        cov = Coverage(data_file=self.data_file)
+        cov.load()
+        cov.combine(process_files, keep=False)
+        cov.save()
+        return failures
+
+    def load(self):
+        "Load previously merged coverage data into the coverage index, in the background."
+        loop = asyncio.get_event_loop()
+        self._schedule(loop.run_in_executor(self._pool, self._load))
+
+    def _load(self):
+        if self.coverage_index is not None and os.path.exists(self.data_file):
+            self.coverage_index.update(self.data_file)
+
+    def erase(self):
+        "Discard all previously merged coverage data, in the background."
+        loop = asyncio.get_event_loop()
+        self._schedule(loop.run_in_executor(self._pool, self._erase))
+
+    def _erase(self):
+        cov = Coverage(data_file=self.data_file)
+        cov.erase()
+        if self.coverage_index is not None:
+            self.coverage_index.clear()
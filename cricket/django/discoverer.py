@@ -1,24 +1,56 @@
-import unittest
-
+import django
 from django.conf import settings
 from django.test.utils import get_runner
 
+from cricket.pipes import discovery_record
+from cricket.unittest.discoverer import consume, discover_in_parallel, discovery_units
+
 # Dynamically retrieve the test runner class for this project.
 TestRunnerClass = get_runner(settings, None)
 
 
+# The discoverer used by a worker process.
+_worker_discoverer = None
+
+
+def _init_worker(options):
+    "Prepare a worker process to discover tests."
+    global _worker_discoverer
+    django.setup()
+    # Only discovered tests may be written to stdout; Django reports
+    # the number of tests found unless it is silenced.
+    _worker_discoverer = TestDiscoverer(**dict(options, verbosity=0))
+
+
+def _discover_label(label):
+    "Discover the tests for a single label in a worker process."
+    return [discovery_record(test) for test in consume(_worker_discoverer.build_suite([label]))]
+
+
 class TestDiscoverer(TestRunnerClass):
     """A Django test runner that prints out all the test that will be run.
 
     Doesn't actually run any of the tests.
+
+    Each label (or, if no labels are provided, each top-level package
+    and test module in the project) is discovered in a separate worker
+    process.
     """
-    def _output_suite(self, suite):
-        for test in suite:
-            if isinstance(test, unittest.TestSuite):
-                self._output_suite(test)
-            else:
-                print(test.id())
+    def __init__(self, **kwargs):
+        # Retain the options, so workers can create an identical discoverer.
+        self._options = kwargs
+        super(TestDiscoverer, self).__init__(**kwargs)
 
     def run_tests(self, test_labels, extra_tests=None, **kwargs):
-        self._output_suite(self.build_suite(test_labels))
+        if test_labels:
+            units = list(test_labels)
+        else:
+            units = discovery_units(pattern=getattr(self, 'pattern', None) or 'test*.py')
+
+        for record in discover_in_parallel(
+                    _discover_label, units,
+                    initializer=_init_worker,
+                    initargs=(self._options,),
+                ):
+            print(record)
         return 0
@@ -9,8 +9,10 @@ import argparse
 # (the one you use to run Django's test suite)
 import runtests
 
+from cricket.pipes import read_labels
 
-def django_tests(runner, labels):
+
+def django_tests(runner, labels, maxfail=None, coverage_mode='trace', profile=False, resources=False):
     state = runtests.setup(1, labels)
 
     module_name, runner_class_name = runner.rsplit('.', 1)
@@ -21,6 +23,10 @@ def django_tests(runner, labels):
         verbosity=1,
         interactive=False,
         failfast=False,
+        maxfail=maxfail,
+        coverage_mode=coverage_mode,
+        profile=profile,
+        resources=resources,
     )
 
     # Catch warnings thrown in test DB setup -- remove in Django 1.9
@@ -42,10 +48,36 @@ if __name__ == "__main__":
 
     parser.add_argument("--settings", help="The settings file to use.", action="store")
     parser.add_argument("--testrunner", help="The test runner to use.", action="store")
+    parser.add_argument(
+        "--labels-from", metavar="FILE",
+        help="Read test labels to execute from FILE, one per line ('-' for stdin).",
+        action="store"
+    )
+    parser.add_argument("--maxfail", metavar="N", type=int, help="Stop the test run after N failures or errors.")
+    parser.add_argument("--coverage-mode", help="How coverage data should be collected.", default='trace')
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Profile each test, and report the profile with the test result."
+    )
+    parser.add_argument(
+        "--resources", action="store_true",
+        help="Record the resources used by each test, and report them with the test result."
+    )
     parser.add_argument('args', nargs=argparse.REMAINDER, help='Test labels to execute.')
 
     options = parser.parse_args()
 
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", options.settings)
 
-    django_tests(options.testrunner, options.args)
+    labels = options.args
+    if options.labels_from:
+        labels = labels + read_labels(options.labels_from)
+
+    django_tests(
+        options.testrunner,
+        labels,
+        maxfail=options.maxfail,
+        coverage_mode=options.coverage_mode,
+        profile=options.profile,
+        resources=options.resources,
+    )
@@ -1,10 +1,5 @@
 from __future__ import absolute_import
 
-try:
-    from coverage import coverage
-except ImportError:
-    coverage = None
-
 from django.conf import settings
 try:
     from django.test.simple import DjangoTestSuiteRunner
@@ -12,7 +7,8 @@ except ImportError:
     DjangoTestSuiteRunner = None
 from django.test.utils import get_runner
 
-from cricket.pipes import PipedTestRunner
+from cricket.coverage_data import COVERAGE_MODES, create_collector
+from cricket.pipes import PipedTestRunner, read_labels
 
 # Dynamically retrieve the test runner class for this project.
 TestRunnerClass = get_runner(settings, None)
@@ -23,8 +19,40 @@ class TestExecutor(TestRunnerClass):
 
     Formats output in a machine-readable format.
     """
+    def __init__(self, labels_from=None, maxfail=None, profile=False, resources=False, **kwargs):
+        super(TestExecutor, self).__init__(**kwargs)
+        self.labels_from = labels_from
+        self.maxfail = maxfail
+        self.profile = profile
+        self.resources = resources
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(TestExecutor, cls).add_arguments(parser)
+        parser.add_argument(
+            '--labels-from', metavar='FILE',
+            help="Read test labels to run from FILE, one per line ('-' for stdin)."
+        )
+        parser.add_argument(
+            '--maxfail', metavar='N', type=int,
+            help='Stop the test run after N failures or errors.'
+        )
+        parser.add_argument(
+            '--profile', action='store_true',
+            help='Profile each test, and report the profile with the test result.'
+        )
+        parser.add_argument(
+            '--resources', action='store_true',
+            help='Record the resources used by each test, and report them with the test result.'
+        )
+
+    def run_tests(self, test_labels, *args, **kwargs):
+        if self.labels_from:
+            test_labels = list(test_labels) + read_labels(self.labels_from)
+        return super(TestExecutor, self).run_tests(test_labels, *args, **kwargs)
+
     def run_suite(self, suite, **kwargs):
-        return PipedTestRunner().run(suite)
+        return PipedTestRunner(maxfail=self.maxfail, profile=self.profile, resources=self.resources).run(suite)
 
 
 class TestCoverageExecutor(TestExecutor):
@@ -32,10 +60,29 @@ class TestCoverageExecutor(TestExecutor):
 
     Formats output in a machine-readable format.
     """
+    def __init__(self, coverage_mode='trace', **kwargs):
+        super(TestCoverageExecutor, self).__init__(**kwargs)
+        self.coverage_mode = coverage_mode
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(TestCoverageExecutor, cls).add_arguments(parser)
+        parser.add_argument(
+            '--coverage-mode', choices=COVERAGE_MODES, default='trace',
+            help='How coverage data should be collected.'
+        )
+
     def run_suite(self, suite, **kwargs):
-        cov = coverage()
+        # Write to a per-process data file; the data will be
+        # merged by Cricket once the test run is complete.
+        cov = create_collector(self.coverage_mode)
         cov.start()
-        result = super(TestCoverageExecutor, self).run_suite(suite, **kwargs)
+        result = PipedTestRunner(
+            maxfail=self.maxfail,
+            coverage=cov,
+            profile=self.profile,
+            resources=self.resources,
+        ).run(suite)
         cov.stop()
         cov.save()
         return result
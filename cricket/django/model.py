@@ -14,6 +14,7 @@ class DjangoTestSuite(TestSuite):
     The TestSuite is a wrapper around the command-line calls to interface
     to test collection and test execution
     '''
+    coverage_contexts = True
 
     def __init__(self, options=None):
         self.settings = None
@@ -58,8 +59,11 @@ class DjangoTestSuite(TestSuite):
 
         return command
 
-    def execute_commandline(self, labels):
-        "The command line to execute the specified test labels"
+    def execute_commandline(self, labels_file, profile=False):
+        """The command line to execute the test labels listed in labels_file.
+
+        If profile is True, each test will be profiled.
+        """
         command = [sys.executable] + self.script
 
         if self.settings:
@@ -67,10 +71,17 @@ class DjangoTestSuite(TestSuite):
 
         if self.coverage:
             command.append('--testrunner=cricket.django.executor.TestCoverageExecutor')
+            command.append('--coverage-mode={}'.format(self.coverage_mode))
         else:
             command.append('--testrunner=cricket.django.executor.TestExecutor')
-        if labels is not None:
-            command.extend(labels)
+        if self.maxfail:
+            command.append('--maxfail={}'.format(self.maxfail))
+        if profile:
+            command.append('--profile')
+        if self.record_resources:
+            command.append('--resources')
+        if labels_file is not None:
+            command.append('--labels-from={}'.format(labels_file))
 
         return command
 
@@ -85,6 +96,17 @@ class DjangoTestSuite(TestSuite):
             (TestMethod, pathparts[-1]),
         ]
 
+    def source_file(self, test_id):
+        "Return the name of the file that defines the test test_id"
+        module_path = os.path.join(*[
+            part
+            for klass, part in self.split_test_id(test_id)
+            if klass == TestModule
+        ])
+        if os.path.isdir(module_path):
+            return os.path.join(module_path, '__init__.py')
+        return module_path + '.py'
+
     def join_path(self, parent, klass, part):
         if parent.path is None:
             return part
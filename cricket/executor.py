@@ -1,7 +1,10 @@
 import asyncio
 import json
+import os
 import subprocess
 import sys
+import tempfile
+import time
 from threading import Thread
 
 try:
@@ -24,6 +27,22 @@ def enqueue_output(out, queue):
     out.close()
 
 
+def write_labels(labels):
+    """Write test labels to a temporary file, one label per line.
+
+    `labels` can be any iterable; labels are written as they are
+    produced, so a large selection never needs to be joined into a
+    single string. Returns the name of the file; the caller is
+    responsible for deleting the file once it is no longer required.
+    """
+    with tempfile.NamedTemporaryFile(
+                'w', prefix='cricket-', suffix='.labels', delete=False, encoding='utf-8'
+            ) as labels_file:
+        for label in labels:
+            labels_file.write(label + '\n')
+    return labels_file.name
+
+
 def parse_status_and_error(post):
     if post['status'] == 'OK':
         status = TestMethod.STATUS_PASS
@@ -47,8 +66,94 @@ def parse_status_and_error(post):
     return status, error
 
 
+def format_duration(seconds):
+    "Describe a duration in the most appropriate units."
+    if seconds >= 7200:
+        return '%s hours' % int(seconds / 3600)
+    elif seconds >= 3600:
+        return '%s hour' % int(seconds / 3600)
+    elif seconds > 120:
+        return '%s mins' % int(seconds / 60)
+    elif seconds > 60:
+        return '%s min' % int(seconds / 60)
+    else:
+        return '%ss' % int(seconds)
+
+
+class RemainingTimeEstimator:
+    """Estimates the time remaining in a test run.
+
+    Each test that has been run before is expected to take as long as
+    its most recent run, scaled by how quickly the tests completed so
+    far in this run have gone compared to their own history. Tests
+    without a recorded duration are expected to take as long as the
+    average test in this run (including any overhead between tests);
+    until a test has completed, the average recorded duration is used.
+    """
+    # The amount of recorded time (in seconds) that is assumed to have
+    # run at exactly its historical speed; this stops a single test
+    # from skewing the estimate for every other test.
+    PRIOR = 1.0
+
+    def __init__(self, tests):
+        # The recorded duration of each test that hasn't run yet, or
+        # None if the test has never been run.
+        self._pending = {test.path: test.duration for test in tests}
+        self._known_remaining = sum(
+            duration for duration in self._pending.values() if duration is not None
+        )
+        self._unknown_count = sum(1 for duration in self._pending.values() if duration is None)
+        known_count = len(self._pending) - self._unknown_count
+        self._mean_duration = self._known_remaining / known_count if known_count else 0.0
+
+        # The number of tests completed in this run, and the recorded and
+        # actual durations of the completed tests that have a history.
+        self._completed = 0
+        self._expected = 0.0
+        self._actual = 0.0
+
+    def record(self, path, duration):
+        "Record that a test has completed, taking `duration` seconds."
+        self._completed += 1
+        try:
+            expected = self._pending.pop(path)
+        except KeyError:
+            # Not one of the tests that were expected to run.
+            return
+
+        if expected is None:
+            self._unknown_count -= 1
+        else:
+            self._known_remaining -= expected
+            self._expected += expected
+            self._actual += duration
+
+    def estimate(self, elapsed):
+        """Estimate the time remaining, given the time elapsed since the run started.
+
+        Returns the estimated number of seconds remaining, and a
+        confidence between 0 and 1: the proportion of the estimate
+        that is based on the recorded durations of the remaining tests.
+        """
+        speed = (self._actual + self.PRIOR) / (self._expected + self.PRIOR)
+        known = max(self._known_remaining, 0.0) * speed
+
+        if self._completed:
+            unknown = self._unknown_count * elapsed / self._completed
+        else:
+            unknown = self._unknown_count * self._mean_duration
+
+        total = known + unknown
+        if total == 0:
+            return 0.0, 1.0
+        return total, known / total
+
+
 class Executor:
     "A wrapper around the subprocess that executes tests."
+    # The maximum amount of output to read from the test runner at once.
+    READ_SIZE = 2 ** 16
+
     def __init__(self, test_suite, display=None):
         self.test_suite = test_suite
         self.display = display
@@ -73,133 +178,71 @@ class Executor:
         # The count of specific test results.
         self.result_count = {}
 
-    async def run(self, count, labels):
-        self.total_count = count
+        # An estimator of the time remaining in the run.
+        self.estimator = None
+
+        # The test runner subprocess, and whether it has been stopped.
+        self.proc = None
+        self.stopped = False
 
-        self.proc = await asyncio.create_subprocess_shell(
-            ' '.join(self.test_suite.execute_commandline(labels)),
+    async def run(self, count, labels, profile=False):
+        """Run the tests targeted by `labels`; None means every test.
+
+        If profile is True, each test will be profiled.
+        """
+        self.total_count = count
+        self.estimator = RemainingTimeEstimator(self.test_suite.tests_for_labels(labels))
+        self.test_suite.last_run = time.time()
+
+        # Labels are handed to the test runner in a file, rather than
+        # on the command line; a large selection can easily exceed the
+        # maximum length of a command line.
+        if labels is None:
+            labels_file = None
+        else:
+            labels_file = write_labels(labels)
+
+        try:
+            await self._execute(labels_file, profile)
+        finally:
+            if labels_file is not None:
+                os.remove(labels_file)
+
+    async def _execute(self, labels_file, profile):
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.test_suite.execute_commandline(labels_file, profile=profile),
             stdin=None,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
-
-        line = await self.proc.stdout.readline()
-        while line:
-            line = line.strip().decode('utf-8')
-            if line in {
-                            PipedTestResult.RESULT_SEPARATOR,
-                            PipedTestRunner.START_TEST_RESULTS,
-                            PipedTestRunner.END_TEST_RESULTS,
-                        }:
-                if self.buffer is None:
-                    # Preamble is finished. Set up the line buffer.
-                    self.buffer = []
-                else:
-                    # Start of new test result; record the last result
-                    # Then, work out what content goes where.
-                    pre = json.loads(self.buffer[0])
-                    if len(self.buffer) == 2:
-                        # No subtests are present, or only one subtest
-                        post = json.loads(self.buffer[1])
-                        status, error = parse_status_and_error(post)
-                    else:
-                        # We have subtests; capture the most important status (until we can capture all the statuses)
-                        status = TestMethod.STATUS_PASS  # Assume pass until told otherwise
-                        error = ''
-                        for line_num in range(1, len(self.buffer)):
-                            post = json.loads(self.buffer[line_num])
-                            subtest_status, subtest_error = parse_status_and_error(post)
-                            if subtest_status > status:
-                                status = subtest_status
-                            if subtest_error:
-                                error += subtest_error + '\n\n'
-
-                    # Increase the count of executed tests
-                    self.completed_count = self.completed_count + 1
-
-                    # Get the start and end times for the test
-                    start_time = float(pre['start_time'])
-                    end_time = float(post['end_time'])
-
-                    self.current_test.set_result(
-                        description=post['description'],
-                        status=status,
-                        output=post.get('output'),
-                        error=error,
-                        duration=end_time - start_time,
-                    )
-
-                    # Work out how long the suite has left to run (approximately)
-                    if self.start_time is None:
-                        self.start_time = start_time
-                    total_duration = end_time - self.start_time
-                    time_per_test = total_duration / self.completed_count
-                    remaining_time = (self.total_count - self.completed_count) * time_per_test
-                    if remaining_time > 4800:
-                        remaining = '%s hours' % int(remaining_time / 2400)
-                    elif remaining_time > 2400:
-                        remaining = '%s hour' % int(remaining_time / 2400)
-                    elif remaining_time > 120:
-                        remaining = '%s mins' % int(remaining_time / 60)
-                    elif remaining_time > 60:
-                        remaining = '%s min' % int(remaining_time / 60)
-                    else:
-                        remaining = '%ss' % int(remaining_time)
-
-                    # Update test result counts
-                    self.result_count.setdefault(status, 0)
-                    self.result_count[status] = self.result_count[status] + 1
-
-                    # Update the display
-                    if self.display:
-                        self.display.executor_test_end(
-                            test_path=self.current_test.path,
-                            result=status,
-                            remaining_time=remaining
-                        )
-
-                    # Clear the decks for the next test.
-                    self.current_test = None
-                    self.buffer = []
-
-                    if line == PipedTestRunner.END_TEST_RESULTS:
-                        # End of test execution.
-                        # Mark the runner as finished, and move back
-                        # to a pre-test state in the results.
-                        finished = True
-                        self.buffer = None
-
+        if self.stopped:
+            # The executor was stopped while the test runner was starting.
+            self._terminate_process()
+
+        # Output is read in blocks, and all the complete lines in a block
+        # are applied to the test suite together, so that listeners are
+        # notified once per block, rather than once per test.
+        partial = b''
+        running = True
+        while running:
+            data = await self.proc.stdout.read(self.READ_SIZE)
+            if data:
+                lines = (partial + data).split(b'\n')
+                partial = lines.pop()
             else:
-                # Not a separator line, so it's actual content.
-                if self.buffer is not None:
-                    # Suite is running - have we got an active test?
-                    # Doctest (and some other tools) output invisible escape sequences.
-                    # Strip these if they exist.
-                    if line.startswith('\x1b'):
-                        line = line[line.find('{'):]
-
-                    # Store the cleaned buffer
-                    self.buffer.append(line)
-
-                    # If we don't have an currently active test, this line will
-                    # contain the path for the test.
-                    if self.current_test is None:
-                        try:
-                            # No active test; first line tells us which test is running.
-                            pre = json.loads(line)
-                            self.current_test = self.test_suite.put_test(pre['path'])
-
-                            # Update the display
-                            if self.display:
-                                self.display.executor_test_start(
-                                    test_path=self.current_test.path,
-                                )
-
-                        except ValueError:
-                            self.current_test = None
-                # else:
-                #     # We haven't started the suite yet; we're still collecting the preamble
-            line = await self.proc.stdout.readline()
+                # End of output.
+                lines = [partial] if partial else []
+                running = False
+
+            with self.test_suite.batch():
+                for line in lines:
+                    if not self._process_line(line.strip().decode('utf-8')):
+                        running = False
+                        break
+
+        # Wait for the test runner to exit, so that it doesn't linger
+        # as a zombie, and its return code is available.
+        await self.proc.wait()
 
         # Update the display
         if self.display:
@@ -212,10 +255,153 @@ class Executor:
         #     else:
         #         self.emit('suite_error', error='Test output ended unexpectedly')
 
+    def _process_line(self, line):
+        """Process a line of output from the test runner.
+
+        Returns False if the test runner has been stopped, and no
+        further output should be processed.
+        """
+        if line in {
+                        PipedTestResult.RESULT_SEPARATOR,
+                        PipedTestRunner.START_TEST_RESULTS,
+                        PipedTestRunner.END_TEST_RESULTS,
+                    }:
+            if self.buffer is None:
+                # Preamble is finished. Set up the line buffer.
+                self.buffer = []
+            else:
+                # Start of new test result; record the last result
+                # Then, work out what content goes where.
+                pre = json.loads(self.buffer[0])
+                if len(self.buffer) == 2:
+                    # No subtests are present, or only one subtest
+                    post = json.loads(self.buffer[1])
+                    status, error = parse_status_and_error(post)
+                    profile = post.get('profile')
+                    resources = post.get('resources')
+                else:
+                    # We have subtests; capture the most important status (until we can capture all the statuses)
+                    status = TestMethod.STATUS_PASS  # Assume pass until told otherwise
+                    error = ''
+                    profile = None
+                    resources = None
+                    for line_num in range(1, len(self.buffer)):
+                        post = json.loads(self.buffer[line_num])
+                        subtest_status, subtest_error = parse_status_and_error(post)
+                        if subtest_status > status:
+                            status = subtest_status
+                        if subtest_error:
+                            error += subtest_error + '\n\n'
+                        # Each result includes the profile and resource
+                        # usage of the test so far.
+                        profile = post.get('profile', profile)
+                        resources = post.get('resources', resources)
+
+                # Increase the count of executed tests
+                self.completed_count = self.completed_count + 1
+
+                # Get the start and end times for the test
+                start_time = float(pre['start_time'])
+                end_time = float(post['end_time'])
+
+                self.current_test.set_result(
+                    description=post['description'],
+                    status=status,
+                    output=post.get('output'),
+                    error=error,
+                    duration=end_time - start_time,
+                    profile=profile,
+                    resources=resources,
+                )
+
+                # Work out how long the suite has left to run (approximately)
+                if self.start_time is None:
+                    self.start_time = start_time
+                self.estimator.record(self.current_test.path, end_time - start_time)
+                remaining_time, confidence = self.estimator.estimate(end_time - self.start_time)
+
+                # Update test result counts
+                self.result_count.setdefault(status, 0)
+                self.result_count[status] = self.result_count[status] + 1
+
+                # Update the display
+                if self.display:
+                    self.display.executor_test_end(
+                        test_path=self.current_test.path,
+                        result=status,
+                        remaining_time=format_duration(remaining_time),
+                        confidence=confidence,
+                    )
+
+                # Clear the decks for the next test.
+                self.current_test = None
+                self.buffer = []
+
+                if line == PipedTestRunner.END_TEST_RESULTS:
+                    # End of test execution.
+                    # Move back to a pre-test state in the results.
+                    self.buffer = None
+
+        else:
+            # Not a separator line, so it's actual content.
+            if self.buffer is not None:
+                # Suite is running - have we got an active test?
+                # Doctest (and some other tools) output invisible escape sequences.
+                # Strip these if they exist.
+                if line.startswith('\x1b'):
+                    line = line[line.find('{'):]
+
+                # Store the cleaned buffer
+                self.buffer.append(line)
+
+                # If we don't have an currently active test, this line will
+                # contain the path for the test.
+                if self.current_test is None:
+                    try:
+                        # No active test; first line tells us which test is running.
+                        pre = json.loads(line)
+
+                        if self.maxfail_reached:
+                            # The test runner should have stopped once the
+                            # maximum number of failures was reached, but it
+                            # has started another test. Stop it.
+                            self._terminate_process()
+                            return False
+
+                        self.current_test = self.test_suite.put_test(pre['path'])
+
+                        # Update the display
+                        if self.display:
+                            self.display.executor_test_start(
+                                test_path=self.current_test.path,
+                            )
+
+                    except ValueError:
+                        self.current_test = None
+            # else:
+            #     # We haven't started the suite yet; we're still collecting the preamble
+        return True
+
     async def terminate(self):
         "Stop the executor."
-        self.proc.terminate()
-        await self.proc.wait()
+        self.stopped = True
+        if self.proc is not None:
+            self._terminate_process()
+            await self.proc.wait()
+
+    def _terminate_process(self):
+        "Terminate the test runner, unless it has already exited."
+        if self.proc.returncode is None:
+            try:
+                self.proc.terminate()
+            except ProcessLookupError:
+                # The test runner exited before its return code was collected.
+                pass
+
+    @property
+    def maxfail_reached(self):
+        "Has the run reached the maximum number of failures allowed by the test suite?"
+        return bool(self.test_suite.maxfail) and self.any_failed >= self.test_suite.maxfail
 
     @property
     def any_failed(self):
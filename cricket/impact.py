@@ -0,0 +1,148 @@
+"""An index of the source files that each test depends on.
+
+The index is derived from coverage data gathered with a dynamic
+context per test, and is used to select the tests that are affected
+by a change to the code base.
+"""
+import json
+import os
+import subprocess
+import time
+
+try:
+    from coverage import CoverageData
+except ImportError:
+    CoverageData = None
+
+
+# The directory where Cricket persists state between sessions.
+STATE_DIR = '.cricket'
+
+
+class ImpactIndex:
+    """A mapping of test path to the set of files executed by that test.
+
+    Files are stored relative to the current working directory.
+    """
+    FILENAME = os.path.join(STATE_DIR, 'impact.json')
+
+    def __init__(self, filename=FILENAME):
+        self.filename = filename
+
+        # test path -> set of filenames
+        self.tests = {}
+
+        # The time at which the index was last updated.
+        self.timestamp = None
+
+    def __len__(self):
+        return len(self.tests)
+
+    @classmethod
+    def load(cls, filename=FILENAME):
+        """Load a previously saved index.
+
+        If no index has been saved, returns an empty index.
+        """
+        index = cls(filename)
+        try:
+            with open(filename, encoding='utf-8') as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return index
+
+        # Filenames are stored once, and referenced by position.
+        files = content['files']
+        index.tests = {
+            test: {files[i] for i in file_ids}
+            for test, file_ids in content['tests'].items()
+        }
+        index.timestamp = content['timestamp']
+        return index
+
+    def save(self):
+        "Persist the index."
+        files = sorted(set().union(*self.tests.values()))
+        file_ids = {filename: i for i, filename in enumerate(files)}
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump({
+                'timestamp': self.timestamp,
+                'files': files,
+                'tests': {
+                    test: sorted(file_ids[filename] for filename in filenames)
+                    for test, filenames in self.tests.items()
+                },
+            }, f, separators=(',', ':'))
+
+    def update(self, data_file='.coverage'):
+        """Update the index from the per-test contexts in a coverage data file.
+
+        The dependencies of any test that has a context in the data file
+        are replaced; all other tests are left untouched.
+        """
+        data = CoverageData(data_file)
+        data.read()
+
+        tests = {}
+        for measured_file in data.measured_files():
+            filename = os.path.relpath(measured_file)
+            contexts = set()
+            for line_contexts in data.contexts_by_lineno(measured_file).values():
+                contexts.update(line_contexts)
+            for context in contexts:
+                # Code executed outside a test is recorded in the empty context.
+                if context:
+                    tests.setdefault(context, set()).add(filename)
+
+        self.tests.update(tests)
+        self.timestamp = time.time()
+
+    def changed_files(self):
+        """Determine the files that have changed.
+
+        In a git checkout, this is every file that differs from HEAD.
+        Otherwise, it is every indexed file that has been modified since
+        the index was last updated.
+        """
+        try:
+            output = subprocess.check_output(
+                ['git', 'diff', '--name-only', '--relative', 'HEAD'],
+                stderr=subprocess.DEVNULL,
+            )
+            return {
+                os.path.normpath(line)
+                for line in output.decode('utf-8').splitlines()
+            }
+        except (OSError, subprocess.CalledProcessError):
+            pass
+
+        changed = set()
+        for filename in set().union(*self.tests.values()):
+            try:
+                if self.timestamp is None or os.path.getmtime(filename) > self.timestamp:
+                    changed.add(filename)
+            except OSError:
+                # The file has been deleted.
+                changed.add(filename)
+        return changed
+
+    def affected_tests(self, test_paths, changed_files=None):
+        """Select the tests affected by a set of changed files.
+
+        `test_paths` is an iterable of every test that could be run.
+        A test is affected if it executed any of the changed files; a
+        test that isn't in the index is always considered affected.
+        """
+        if changed_files is None:
+            changed_files = self.changed_files()
+
+        affected = []
+        for path in test_paths:
+            try:
+                if not self.tests[path].isdisjoint(changed_files):
+                    affected.append(path)
+            except KeyError:
+                affected.append(path)
+        return affected
@@ -0,0 +1,160 @@
+"""Measuring the resources used by individual tests.
+
+When resource usage is being recorded, the test runner measures the
+resources used by each test, and reports them along with the result
+of the test. The usage of a test is a dictionary of:
+
+    rss:         the change in the resident set size of the process, in bytes
+    peak_memory: the peak memory allocated by Python during the test, in bytes
+    wall_time:   the elapsed time of the test, in seconds
+    cpu_time:    the CPU time used by the process during the test, in seconds
+    fds:         the change in the number of open file descriptors
+    threads:     the number of threads started by the test that are still running
+
+Where /proc isn't available (e.g., macOS), the resident set size is
+the peak reported by getrusage(), so `rss` is the growth of the peak.
+Measurements that aren't available on the platform are None.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+# The resources that are measured, with a title for each one.
+RESOURCES = [
+    ('rss', 'RSS change'),
+    ('peak_memory', 'Peak memory'),
+    ('wall_time', 'Wall time'),
+    ('cpu_time', 'CPU time'),
+    ('fds', 'Open files'),
+    ('threads', 'Threads'),
+]
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError):
+    PAGE_SIZE = None
+
+
+def resident_set_size():
+    """The resident set size of this process in bytes, or None if it can't be determined.
+
+    If the current size can't be read from /proc, the peak size is used.
+    """
+    if PAGE_SIZE is not None:
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            pass
+
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports the peak in bytes; other platforms use kilobytes.
+        if sys.platform == 'darwin':
+            return max_rss
+        return max_rss * 1024
+    return None
+
+
+def open_file_descriptors():
+    "The number of file descriptors open in this process, or None if it can't be determined."
+    for fd_dir in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            pass
+    return None
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return None
+    return after - before
+
+
+class ResourceMonitor:
+    """Measure the resources used by a test.
+
+    The monitor is started when the test starts; usage() describes the
+    resources used since then.
+
+    Memory allocations are traced with tracemalloc. Starting a monitor
+    clears any traces that have already been recorded.
+    """
+    def __init__(self):
+        self._rss = None
+        self._fds = None
+        self._threads = set()
+        self._wall_time = None
+        self._cpu_time = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Clearing the traces also resets the peak.
+        tracemalloc.clear_traces()
+
+        self._rss = resident_set_size()
+        self._fds = open_file_descriptors()
+        self._threads = set(threading.enumerate())
+        self._wall_time = time.perf_counter()
+        self._cpu_time = time.process_time()
+
+    def usage(self):
+        "The resources used since the monitor was started."
+        wall_time = time.perf_counter() - self._wall_time
+        cpu_time = time.process_time() - self._cpu_time
+        return {
+            'rss': _change(self._rss, resident_set_size()),
+            'peak_memory': tracemalloc.get_traced_memory()[1],
+            'wall_time': round(wall_time, 6),
+            'cpu_time': round(cpu_time, 6),
+            'fds': _change(self._fds, open_file_descriptors()),
+            'threads': len(set(threading.enumerate()) - self._threads),
+        }
+
+
+def format_size(size):
+    "A human readable description of a (possibly negative) number of bytes."
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'GiB'
+    if unit == 'B':
+        return '{} {}'.format(size, unit)
+    return '{:.1f} {}'.format(size, unit)
+
+
+def format_resource(resource, value):
+    "A human readable description of the measurement of a resource."
+    if value is None:
+        return '-'
+    elif resource in ('rss', 'peak_memory'):
+        return format_size(value)
+    elif resource in ('wall_time', 'cpu_time'):
+        return '{:.3f}s'.format(value)
+    return str(value)
+
+
+def worst_offenders(tests, resource):
+    """The tests with a measurement of a resource, worst first.
+
+    Tests are ordered by decreasing usage of the resource; tests where
+    the resource couldn't be measured come last.
+    """
+    measured = [test for test in tests if test.resources]
+    return sorted(
+        measured,
+        key=lambda test: (test.resources.get(resource) is not None, test.resources.get(resource) or 0),
+        reverse=True,
+    )
@@ -5,9 +5,14 @@ This is the "Model" of the MVC world.
 Each object in the model is an event source; views/controllers
 can bind to events on the model to be notified of changes.
 """
+import asyncio
+import bisect
+import contextlib
+import json
+import os
+import re
 import subprocess
 import sys
-from datetime import datetime
 
 import toga
 from toga.sources import Source
@@ -26,10 +31,15 @@ class TestNode:
         self._child_nodes = {}
 
         self._source = source
+        # The node containing this node; set when the node is added.
+        self._parent = None
 
         self._path = path
         self._name = name
-        self._active = True
+
+        # The number of tests in this node, and how many of them are active.
+        self._test_count = 0
+        self._active_count = 0
 
     ######################################################################
     # Methods required by the TreeSource interface
@@ -52,24 +62,40 @@ class TestNode:
     ######################################################################
 
     def __setitem__(self, label, child):
-        # Insert the item, sort the list,
+        # Insert the item into the (already sorted) list of labels,
         # and find out where the item was inserted.
-        self._child_labels.append(label)
-        self._child_labels.sort()
-        index = self._child_labels.index(label)
+        index = bisect.bisect_left(self._child_labels, label)
+        self._child_labels.insert(index, label)
 
         self._child_nodes[label] = child
+        child._parent = self
 
         self._source._notify('insert', parent=self, index=index, item=child)
+        self._adjust_counts(child._test_count, child._active_count)
 
     def __delitem__(self, label):
         # Find the label in the list of children, and remove it.
         index = self._child_labels.index(label)
-        self._child_nodes[label] = child
+        child = self._child_nodes[label]
 
-        self._source._notify('remove', item=child)
         del self._child_labels[index]
         del self._child_nodes[label]
+        self._source._unindex(child)
+        self._source._notify('remove', parent=self, index=index, item=child)
+        self._adjust_counts(-child._test_count, -child._active_count)
+
+    def _adjust_counts(self, tests, active):
+        """Add to the count of tests (and active tests) in this node,
+        and in every node containing it.
+        """
+        node = self
+        while node is not None:
+            was_active = node.active
+            node._test_count += tests
+            node._active_count += active
+            if node.active != was_active and node is not self._source:
+                self._source._notify('change', item=node)
+            node = node._parent
 
     @property
     def path(self):
@@ -81,91 +107,129 @@ class TestNode:
         "The identifying name for this node"
         return self._name
 
+    @property
+    def parent(self):
+        "The node containing this node"
+        return self._parent
+
     @property
     def active(self):
-        "Is this test method currently active?"
-        return self._active
+        "Are any of the tests in this node active?"
+        # A node without any tests is considered active.
+        return self._active_count > 0 or self._test_count == 0
+
+    def set_active(self, is_active):
+        """Explicitly set the active state of every test in this node.
+
+        The nodes containing this node are updated to reflect the change.
+        """
+        with self._source.batch():
+            self._set_active(is_active)
+
+    def _set_active(self, is_active):
+        before = self._active_count
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            was_active = node.active
+            node._active_count = node._test_count if is_active else 0
+            if node.active != was_active and node is not self._source:
+                self._source._notify('change', item=node)
+
+            for child in node._child_nodes.values():
+                if child.can_have_children():
+                    nodes.append(child)
+                elif child._active != is_active:
+                    child._active = is_active
+                    self._source._notify('change', item=child)
+
+        if self._parent is not None:
+            self._parent._adjust_counts(0, self._active_count - before)
 
-    def find_tests(self, active=True, status=None, labels=None):
+    def toggle_active(self):
+        "Toggle the current active status of this node"
+        self.set_active(not self.active)
+
+    def find_tests(self, active=True, status=None, labels=None, markers=None):
         """Find the test labels matching the search criteria.
 
         This will check:
             * active: if the method is currently an active test
             * status: if the last run status of the method is in the provided list
             * labels: if the method label is in the provided list
+            * markers: if the method has any of the provided markers
 
         Returns a count of tests found, plus the labels needed to
         execute those tests.
         """
+        selection = self._source._selection(self, labels) if labels else None
+        return self._find_tests(active, status, selection, markers)
+
+    def _find_tests(self, active, status, selection, markers):
+        """Find the tests matching the search criteria.
+
+        `selection` is the part of a label trie (see TestSuite._label_trie())
+        that corresponds to this node, or None if every test in this node
+        has been requested. The trie is walked in lockstep with the tree;
+        each child is checked against the selection, but the descendants
+        of children that haven't been selected are never visited.
+        """
         tests = []
         count = 0
         found_partial = False
         for child_label, child_node in self._child_nodes.items():
+            # If a specific set of tests has been requested,
+            # the child node must be (or contain) one of them.
             # If only active tests have been requested,
             # the child node must be active.
             # If only "status == X" tests have been requested,
             # the child node must have that status.
-            if active and not child_node.active:
+            if selection is not None and child_label not in selection:
+                # There's at least one child that wasn't requested;
+                # this node is therefore a partial selection
+                subcount = 0
+                subtests = []
+                found_partial = True
+            elif active and not child_node.active:
                 # There's at least one child marked inactive;
                 # this node is therefore a partial selection
                 subcount = 0
                 subtests = []
                 found_partial = True
-            elif status and child_node.status not in status:
+            elif status and not child_node.can_have_children() and child_node.status not in status:
                 # There's at least one child marked inactive;
                 # this node is therefore a partial selection
                 subcount = 0
                 subtests = []
                 found_partial = True
+            elif markers and not child_node.can_have_children() and child_node.markers.isdisjoint(markers):
+                # There's at least one child without a requested marker;
+                # this node is therefore a partial selection
+                subcount = 0
+                subtests = []
+                found_partial = True
             else:
-                if labels:
-                    # A specific set of tests has been requested.
-                    if child_node.path in labels:
-                        # This child node exactly matches a requested label.
-                        # Find *all* subtests of this node.
-                        subcount, subtests = child_node.find_tests(active, status)
-
-                        # If subtests have been found, but the list of subtests
-                        # is None, then this node's path can be provided as a
-                        # specifier for "all subtests of this node"
-                        if subtests is None:
-                            subtests = [child_node.path]
-                        else:
-                            # At least one descendent of this child is excluded
-                            # that means this node is a partial match.
-                            found_partial = True
-                    else:
-                        # Search children of this child for the provided labels.
-                        subcount, subtests = child_node.find_tests(active, status, labels)
-
-                        # If subtests have been found, but the list of subtests
-                        # is None, then this node's path can be provided as a
-                        # specifier for "all subtests of this node"
-                        if subtests is None:
-                            subtests = [child_node.path]
-                        else:
-                            # At least one descendent of this child is excluded
-                            # that means this node is a partial match.
-                            found_partial = True
+                # Search the child for the tests requested in it. If the child
+                # exactly matches a requested label, *all* its subtests are found.
+                subcount, subtests = child_node._find_tests(
+                    active, status,
+                    None if selection is None else selection[child_label],
+                    markers
+                )
 
+                # If subtests have been found, but the list of subtests
+                # is None, then this node's path can be provided as a
+                # specifier for "all subtests of this node"
+                if subtests is None:
+                    subtests = [child_node.path]
                 else:
-                    # All tests have been requested.
-                    subcount, subtests = child_node.find_tests(active, status)
-
-                    # If subtests have been found, but the list of subtests
-                    # is empty, then this node's path can be provided as a
-                    # specifier for "all subtests of this node"
-                    if subtests is None:
-                        subtests = [child_node.path]
-                    else:
-                        # At least one descendent of this child is excluded
-                        # that means this node is a partial match.
-                        found_partial = True
+                    # At least one descendent of this child is excluded
+                    # that means this node is a partial match.
+                    found_partial = True
 
             count = count + subcount
             tests.extend(subtests)
 
-
         # No children were a partial match; therefore, this entire
         # node is being executed. Return the count of subtests found,
         # with a test list of None to flag the complete status.
@@ -175,6 +239,11 @@ class TestNode:
         # Return the count of tests, and the labels needed to target them.
         return count, tests
 
+    def iter_tests(self):
+        "Iterate over every test method contained in this node."
+        for child_label in self._child_labels:
+            yield from self._child_nodes[child_label].iter_tests()
+
 
 class TestMethod:
     """A data representation of an individual test method.
@@ -201,17 +270,31 @@ class TestMethod:
 
     def __init__(self, source, path, name):
         self._source = source
+        # The node containing this test; set when the test is added.
+        self._parent = None
 
         self._path = path
         self._name = name
         self._active = True
 
+        # Details reported by the discoverer
+        self._file = None
+        self._line = None
+        self._markers = frozenset()
+        self._skip = None
+
         # Test status
         self._description = ''
         self._status = self.STATUS_UNKNOWN
         self._output = None
         self._error = None
         self._duration = None
+        # A summary of the profile of the test, if it was profiled;
+        # see cricket.profiling.
+        self._profile = None
+        # The resources used by the test, if they were recorded;
+        # see cricket.instrumentation.
+        self._resources = None
 
     def __repr__(self):
         return '<TestMethod %s>' % self.path
@@ -235,6 +318,11 @@ class TestMethod:
     def name(self):
         return self._name
 
+    @property
+    def parent(self):
+        "The test case containing this test"
+        return self._parent
+
     @property
     def label(self):
         "The display label for the node"
@@ -244,6 +332,26 @@ class TestMethod:
     def description(self):
         return self._description
 
+    @property
+    def file(self):
+        "The file that defines the test, if known."
+        return self._file
+
+    @property
+    def line(self):
+        "The line number of the test definition, if known."
+        return self._line
+
+    @property
+    def markers(self):
+        "The markers (e.g., pytest marks or Django tags) applied to the test."
+        return self._markers
+
+    @property
+    def skip(self):
+        "The reason the test will be skipped, if it is unconditionally skipped."
+        return self._skip
+
     @property
     def status(self):
         return self._status
@@ -260,49 +368,74 @@ class TestMethod:
     def duration(self):
         return self._duration
 
+    @property
+    def profile(self):
+        return self._profile
+
+    @property
+    def resources(self):
+        return self._resources
+
     @property
     def active(self):
         "Is this test method currently active?"
         return self._active
 
-    def set_result(self, description, status, output, error, duration):
+    # A test method counts as a single test in the nodes containing it.
+    _test_count = 1
+
+    @property
+    def _active_count(self):
+        return 1 if self._active else 0
+
+    def set_details(self, file=None, line=None, description=None, markers=(), skip=None):
+        "Record the details of the test reported by the discoverer."
+        self._file = file
+        self._line = line
+        if description:
+            self._description = description
+        self._markers = frozenset(markers)
+        self._skip = skip
+
+    def set_result(self, description, status, output, error, duration, profile=None, resources=None):
         self._description = description
         self._status = status
         self._output = output
         self._error = error
         self._duration = duration
+        self._profile = profile
+        self._resources = resources
 
         self._source._notify('change', item=self)
 
-    def set_active(self, is_active, cascade=True):
+    def set_active(self, is_active):
         """Explicitly set the active state of the test method
 
-        If cascade is True, the parent testCase will be prompted
-        to check it's current active status.
+        The nodes containing the test are updated to reflect the change.
         """
-        if self._active:
-            if not is_active:
-                self._active = False
-                if cascade:
-                    self.parent._update_active()
-        else:
-            if is_active:
-                self._active = True
-                if cascade:
-                    self.parent._update_active()
+        if self._active != is_active:
+            self._active = is_active
+            self._source._notify('change', item=self)
+            if self._parent is not None:
+                self._parent._adjust_counts(0, 1 if is_active else -1)
 
     def toggle_active(self):
         "Toggle the current active status of this test method"
         self.set_active(not self.active)
 
-    def find_tests(self, active=True, status=None, labels=None):
-        if labels:
-            if self.path in labels:
-                return 1, None
-            else:
-                return 0, []
-        else:
-            return 1, None
+    def find_tests(self, active=True, status=None, labels=None, markers=None):
+        selection = self._source._selection(self, labels) if labels else None
+        return self._find_tests(active, status, selection, markers)
+
+    def _find_tests(self, active, status, selection, markers):
+        # A selection can only continue past a test if a label
+        # names something inside the test; there's no such thing.
+        if selection is not None:
+            return 0, []
+        return 1, None
+
+    def iter_tests(self):
+        yield self
 
 
 class TestCase(TestNode):
@@ -318,47 +451,6 @@ class TestCase(TestNode):
         "The display label for the node"
         return (self.TEST_CASE_ICON, self.name)
 
-    def set_active(self, is_active, cascade=True):
-        """Explicitly set the active state of the test case.
-
-        Forces all methods on this test case to set to the same
-        active status.
-
-        If cascade is True, the parent test module will be prompted
-        to check it's current active status.
-        """
-        if self._active:
-            if not is_active:
-                self._active = False
-                # self.emit('inactive')
-                if cascade:
-                    self.parent._update_active()
-                for testMethod in self.values():
-                    testMethod.set_active(False, cascade=False)
-        else:
-            if is_active:
-                self._active = True
-                # self.emit('active')
-                if cascade:
-                    self.parent._update_active()
-                for testMethod in self.values():
-                    testMethod.set_active(True, cascade=False)
-
-    def toggle_active(self):
-        "Toggle the current active status of this test case"
-        self.set_active(not self.active)
-
-    def _update_active(self):
-        "Check the active status of all child nodes, and update the status of this node accordingly"
-        for testMethod_name, testMethod in self.items():
-            if testMethod.active:
-                # As soon as we find an active child, this node
-                # must be marked active, and no other checks are
-                # required.
-                self.set_active(True)
-                return
-        self.set_active(False)
-
 
 class TestModule(TestNode):
     """A data representation of a module. It may contain test cases, or other modules.
@@ -373,94 +465,450 @@ class TestModule(TestNode):
         "The display label for the node"
         return (self.TEST_MODULE_ICON, self.name)
 
-    def set_active(self, is_active, cascade=True):
-        """Explicitly set the active state of the test case.
 
-        Forces all test cases and test modules held by this test module
-        to be set to the same active status
+def search_tokens(text):
+    """Split text into lower case search tokens.
 
-        If cascade is True, the parent test module will be prompted
-        to check it's current active status.
-        """
-        if self._active:
-            if not is_active:
-                self._active = False
-                # self.emit('inactive')
-                if cascade:
-                    self.parent._update_active()
-                for testModule in self.values():
-                    testModule.set_active(False, cascade=False)
-        else:
-            if is_active:
-                self._active = True
-                # self.emit('active')
-                if cascade:
-                    self.parent._update_active()
-                for testModule in self.values():
-                    testModule.set_active(True, cascade=False)
+    Text is split at any character that isn't a letter or digit, and
+    at camelCase boundaries; e.g., "test_module.DeepNestedTests" gives
+    "test", "module", "deep", "nested" and "tests".
+    """
+    return re.findall(r'[a-z0-9]+', re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', text).lower())
 
-    def toggle_active(self):
-        "Toggle the current active status of this test case"
-        self.set_active(not self.active)
 
-    def _purge(self, timestamp):
-        """Search all submodules and test cases looking for stale test methods.
+class TestIndex:
+    """A prefix index over the nodes of a test suite.
 
-        Purge any test module without any test cases, and any test Case with no
-        test methods.
+    Each node is indexed under the tokens in its name (and, for test
+    methods, its description), plus its entire name. Indexing names
+    rather than full paths means each module or test case name is only
+    indexed once, no matter how many tests it contains.
+    """
+    def __init__(self, suite):
+        self.suite = suite
+        # The nodes with each token.
+        self._nodes = {}
+        # The tokens of each node, so they can be removed.
+        self._tokens = {}
+        # All tokens, in sorted order; rebuilt when needed.
+        self._sorted = None
+
+    def add(self, node, text=''):
+        "Index a node, by its name and any additional text."
+        tokens = set(search_tokens(node.name) + search_tokens(text))
+        tokens.add(node.name.lower())
+        old_tokens = self._tokens.get(node, set())
+        if tokens == old_tokens:
+            return
+
+        self.remove(node)
+        self._tokens[node] = tokens
+        for token in tokens:
+            try:
+                self._nodes[token].add(node)
+            except KeyError:
+                self._nodes[token] = {node}
+                self._sorted = None
+
+    def remove(self, node):
+        "Remove a node from the index."
+        for token in self._tokens.pop(node, ()):
+            nodes = self._nodes[token]
+            nodes.discard(node)
+            if not nodes:
+                del self._nodes[token]
+                self._sorted = None
+
+    def nodes_with_prefix(self, prefix):
+        "The nodes with a token starting with `prefix`."
+        if self._sorted is None:
+            self._sorted = sorted(self._nodes)
+
+        nodes = set()
+        index = bisect.bisect_left(self._sorted, prefix)
+        while index < len(self._sorted) and self._sorted[index].startswith(prefix):
+            nodes.update(self._nodes[self._sorted[index]])
+            index += 1
+        return nodes
+
+    def search(self, query):
+        """Find the tests matching a search query.
+
+        Every token in the query must be the prefix of a token of the
+        test, or of a node that contains the test. Returns the set of
+        paths of the matching tests, or None if the query is empty.
         """
-        for testModule_name, testModule in self.items():
-            testModule._purge(timestamp)
-            if len(testModule) == 0:
-                self.pop(testModule_name)
+        terms = set(search_tokens(query))
+        if not terms:
+            return None
+
+        # Find the tests matching the most selective term, then check
+        # those tests (and the nodes that contain them) against the others.
+        term_nodes = sorted((self.nodes_with_prefix(term) for term in terms), key=len)
+        tests = set()
+        for node in term_nodes[0]:
+            if node.can_have_children():
+                tests.update(node.iter_tests())
+            else:
+                tests.add(node)
+
+        for nodes in term_nodes[1:]:
+            if not tests:
+                break
+            tests = {test for test in tests if not nodes.isdisjoint(self._nodes_on_path(test))}
+
+        return {test.path for test in tests}
+
+    def _nodes_on_path(self, test):
+        "The nodes containing a test, and the test itself."
+        nodes = []
+        node = self.suite
+        for NodeClass, part in self.suite.split_test_id(test.path):
+            node = node[part]
+            nodes.append(node)
+        return nodes
 
 
 class TestSuite(TestNode, Source):
     """A data representation of a test suite, containing 1+ test cases.
     """
+    # Does the backend record the coverage of each test in its own
+    # context? If not, the tests affected by a change can't be found.
+    coverage_contexts = False
+
     def __init__(self):
         super().__init__(self, None, None)
         self.errors = []
+
+        # Every node in the suite, by path.
+        self._nodes = {}
+
+        # The notifications that have been held back by batch(), and
+        # the items that already have a pending change notification.
+        self._batch = None
+        self._batch_changed = None
+        self._batch_depth = 0
+
+        # An index for searching the tests in the suite.
+        self.index = TestIndex(self)
         self.coverage = False
+        self.coverage_mode = 'trace'
+
+        # If True, runs will be ordered to report likely failures first.
+        self.failed_first = False
+
+        # The number of failures after which a run should stop.
+        self.maxfail = None
+
+        # Should the resources used by each test be recorded?
+        self.record_resources = False
+
+        # Should tests be discovered by parsing test files, rather than
+        # importing them? Only used by backends that support it.
+        self.static_discovery = False
+
+        # If provided, only tests with one of these markers will be run.
+        self.markers = None
+
+        # The time at which the most recent test run was started.
+        self.last_run = None
 
     def __repr__(self):
         return '<TestSuite>'
 
+    @contextlib.contextmanager
+    def batch(self):
+        """Collect the notifications for a group of changes, and deliver them together.
+
+        Notifications are held back until the outermost batch ends, then
+        delivered in order. Only one change notification is delivered
+        for each item (describing its final state), and changes to items
+        that were removed from the suite during the batch are dropped.
+        """
+        if self._batch_depth == 0:
+            self._batch = []
+            self._batch_changed = set()
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                notifications = self._batch
+                self._batch = None
+                self._batch_changed = None
+                for notification, kwargs in notifications:
+                    if notification == 'change' and self.get_node(kwargs['item'].path) is not kwargs['item']:
+                        continue
+                    super()._notify(notification, **kwargs)
+
+    def _notify(self, notification, **kwargs):
+        if self._batch is None:
+            super()._notify(notification, **kwargs)
+        elif notification == 'change':
+            if kwargs['item'] not in self._batch_changed:
+                self._batch_changed.add(kwargs['item'])
+                self._batch.append((notification, kwargs))
+        else:
+            self._batch.append((notification, kwargs))
+
+    def discover(self):
+        """Run the test discovery command for the test suite.
+
+        Returns a list of discovered tests (as reported by the discoverer;
+        see put_discovered()), and a list of any error output produced
+        during discovery.
+
+        Raises ModelLoadError if no tests could be discovered.
+        """
+        runner = subprocess.Popen(
+            self.discover_commandline(),
+            stdin=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+        )
+
+        # Read stdout and stderr together; reading one after the other
+        # can deadlock if the discoverer fills the other pipe's buffer.
+        stdout, stderr = runner.communicate()
+
+        test_list = [line.strip() for line in stdout.decode('utf-8').splitlines()]
+        errors = [line.strip() for line in stderr.decode('utf-8').splitlines()]
+        if errors and not test_list:
+            raise ModelLoadError('\n'.join(errors))
+
+        return test_list, errors
+
+    async def refresh_async(self, batch_size=100):
+        """Rediscover the tests in the test suite, without blocking the event loop.
+
+        Tests are added to the suite as the discoverer reports them,
+        `batch_size` at a time; control is returned to the event loop
+        after each batch, so the display can be updated while discovery
+        is still running.
+
+        Raises ModelLoadError if no tests could be discovered.
+        """
+        runner = await asyncio.create_subprocess_exec(
+            *self.discover_commandline(),
+            stdin=None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        # Collect error output in the background while tests are read.
+        errors = []
+
+        async def read_errors():
+            async for line in runner.stderr:
+                errors.append(line.strip().decode('utf-8'))
+
+        error_reader = asyncio.ensure_future(read_errors())
+
+        found = set()
+        batch = []
+        async for line in runner.stdout:
+            batch.append(line.strip().decode('utf-8'))
+            if len(batch) >= batch_size:
+                with self.batch():
+                    for line in batch:
+                        found.add(self.put_discovered(line).path)
+                batch = []
+                await asyncio.sleep(0)
+        with self.batch():
+            for line in batch:
+                found.add(self.put_discovered(line).path)
+
+        await error_reader
+        await runner.wait()
+
+        if errors and not found:
+            raise ModelLoadError('\n'.join(errors))
+        with self.batch():
+            self.purge(found)
+        self.errors = errors
+
     def refresh(self, test_list=None, errors=None):
         """Rediscover the tests in the test suite.
         """
         if test_list is None:
-            runner = subprocess.Popen(
-                self.discover_commandline(),
-                stdin=None,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=False,
+            test_list, errors = self.discover()
+
+        # Make sure there is a data representation for every test in the list,
+        # and remove any test that is no longer in the list.
+        with self.batch():
+            self.purge([self.put_discovered(line).path for line in test_list])
+
+        self.errors = errors if errors is not None else []
+
+    def tests_for_labels(self, labels=None):
+        """Expand a set of test labels into the tests they target.
+
+        `labels` is a list of labels, as returned by find_tests(); None
+        means every test in the suite.
+        """
+        if labels is None:
+            return list(self.iter_tests())
+
+        tests = []
+        for label in labels:
+            node = self.get_node(label)
+            if node is not None:
+                tests.extend(node.iter_tests())
+        return tests
+
+    def ordered_tests(self, labels=None):
+        """Expand a set of test labels into a prioritized list of tests.
+
+        `labels` is a list of labels, as returned by find_tests(); None
+        means every test in the suite. Returns the path of every test
+        targeted by those labels, ordered so that tests which are most
+        likely to fail are executed first:
+
+            * tests that failed on their most recent run, then
+            * tests in files that have been modified since the last run, then
+            * all other tests, in order of increasing duration.
+        """
+        tests = self.tests_for_labels(labels)
+
+        modified = {}
+
+        def is_modified(test):
+            filename = test.file or self.source_file(test.path)
+            try:
+                return modified[filename]
+            except KeyError:
+                try:
+                    modified[filename] = os.path.getmtime(filename) > self.last_run
+                except OSError:
+                    modified[filename] = False
+                return modified[filename]
+
+        def priority(test):
+            if test.status in TestMethod.FAILING_STATES:
+                tier = 0
+            elif self.last_run is not None and is_modified(test):
+                tier = 1
+            else:
+                tier = 2
+            return (tier, test.duration or 0)
+
+        return [test.path for test in sorted(tests, key=priority)]
+
+    def tests_in_files(self, filenames):
+        """Select the tests that are defined in any of a set of files.
+
+        `filenames` are relative to the current working directory.
+        Returns the path of every matching test.
+        """
+        filenames = {os.path.normpath(filename) for filename in filenames}
+        return [
+            test.path
+            for test in self.iter_tests()
+            if os.path.normpath(test.file or self.source_file(test.path)) in filenames
+        ]
+
+    def put_discovered(self, line):
+        """Add a test reported by a discoverer.
+
+        A discoverer reports each test on a single line, either as a bare
+        test ID, or as a JSON record of the form:
+
+            {"id": ..., "file": ..., "line": ..., "description": ...,
+             "markers": [...], "skip": ...}
+
+        where every key other than "id" is optional.
+        """
+        if line.startswith('{'):
+            record = json.loads(line)
+            test = self.put_test(record['id'])
+            test.set_details(
+                file=record.get('file'),
+                line=record.get('line'),
+                description=record.get('description'),
+                markers=record.get('markers', ()),
+                skip=record.get('skip'),
             )
+            if self.index is not None and test.description:
+                self.index.add(test, test.description)
+        else:
+            test = self.put_test(line)
+        return test
 
-            test_list = []
-            for line in runner.stdout:
-                test_list.append(line.strip().decode('utf-8'))
+    def get_node(self, path):
+        "Return the node with the given path, or None if there is no such node."
+        return self._nodes.get(path)
 
-            errors = []
-            for line in runner.stderr:
-                errors.append(line.strip().decode('utf-8'))
-            if errors and not test_list:
-                raise ModelLoadError('\n'.join(errors))
+    def _label_trie(self, labels):
+        """Build a trie of the parts of a collection of test labels.
 
-        timestamp = datetime.now()
+        Each level of the trie is a dictionary, keyed by the name of a
+        child node; a value of None marks a label that was requested,
+        selecting every test contained by that node.
+        """
+        trie = {}
+        for label in labels:
+            node = self.get_node(label)
+            if node is None:
+                # The label doesn't select anything.
+                continue
+
+            names = self._names_on_path(node)
+            level = trie
+            for name in names[:-1]:
+                level = level.setdefault(name, {})
+                if level is None:
+                    # A label containing this one has already been requested.
+                    break
+            else:
+                level[names[-1]] = None
+        return trie
 
-        # Make sure there is a data representation for every test in the list.
-        for test_id in test_list:
-            self.put_test(test_id)
+    def _selection(self, node, labels):
+        """Walk the label trie for a collection of test labels down to a node.
 
-        self.errors = errors if errors is not None else []
+        Returns the part of the trie that corresponds to the node, or None
+        if a label selects every test in the node.
+        """
+        selection = self._label_trie(labels)
+        for name in self._names_on_path(node):
+            selection = selection.get(name, {})
+            if selection is None:
+                break
+        return selection
+
+    def _names_on_path(self, node):
+        "The names of the nodes from the top of the suite down to `node`."
+        names = []
+        while node is not self:
+            names.append(node.name)
+            node = node.parent
+        names.reverse()
+        return names
+
+    def _unindex(self, node):
+        "Remove a node that has been deleted, and any nodes it contains, from the indexes."
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            if self._nodes.get(node.path) is node:
+                del self._nodes[node.path]
+            if self.index is not None:
+                self.index.remove(node)
+            if node.can_have_children():
+                nodes.extend(node._child_nodes.values())
 
     def put_test(self, test_id):
         """An idempotent insert method for tests.
 
         Ensures that a test identified as `test_id` exists in the test tree.
         """
+        # Most tests (e.g., every test reported by a test run) already exist.
+        test = self._nodes.get(test_id)
+        if test is not None and not test.can_have_children():
+            return test
+
         parent = self
 
         for NodeClass, part in self.split_test_id(test_id):
@@ -473,6 +921,9 @@ class TestSuite(TestNode, Source):
                     name=part
                 )
                 parent[part] = child
+                self._nodes[child.path] = child
+                if self.index is not None:
+                    self.index.add(child)
             parent = child
 
         return child
@@ -499,41 +950,436 @@ class TestSuite(TestNode, Source):
         # If at any point we find a parent with children,
         # we can bail (as the parent of a node with children
         # must also have children)
-        while parents:
+        while len(parents) > 1:
             child = parents.pop()
             if len(child) == 0:
                 del parents[-1][child.name]
             else:
                 return
 
+    def purge(self, test_ids):
+        "Remove every test that isn't in `test_ids`."
+        test_ids = set(test_ids)
+        for test in list(self.iter_tests()):
+            if test.path not in test_ids:
+                self.del_test(test.path)
+
 
 class TestSuiteProblems(TestSuite):
+    """A projection of a test suite, containing only the failing tests.
+
+    The projection is only restructured when a test starts or stops
+    failing; results for tests that weren't (and still aren't) failing
+    don't touch the problem tree.
+    """
     def __init__(self, suite):
         super().__init__()
         self.suite = suite
+
+        # Problems are found by searching the suite itself.
+        self.index = None
+
+        # The node in the problem tree for each failing test, by path.
+        self.failing = {}
+        # The number of failing tests contained in each problem tree node.
+        self.failing_counts = {}
+
         # Listen to any changes on the test suite
         self.suite.add_listener(self)
 
     def __repr__(self):
         return '<TestSuiteProblems>'
 
+    def _nodes_on_path(self, test_id):
+        "The problem tree nodes containing an existing test, outermost first."
+        nodes = []
+        node = self
+        for NodeClass, part in self.split_test_id(test_id):
+            node = node[part]
+            nodes.append(node)
+        return nodes
+
     def change(self, item):
+        if item.can_have_children():
+            # Only the results of tests are of interest.
+            return
+        failing_item = self.failing.get(item.path)
         if item.status in TestMethod.FAILING_STATES:
-            # Test didn't pass. Make sure it exists in the problem tree.
-            failing_item = self.put_test(item.path)
+            if failing_item is None:
+                # Test has started failing. Add it to the problem tree.
+                failing_item = self.put_test(item.path)
+                self.failing[item.path] = failing_item
+                for node in self._nodes_on_path(item.path):
+                    self.failing_counts[node] = self.failing_counts.get(node, 0) + 1
 
             failing_item.set_result(
                 description=item.description,
                 status=item.status,
                 output=item.output,
                 error=item.error,
-                duration=item.duration
+                duration=item.duration,
+                profile=item.profile,
+                resources=item.resources,
             )
-        else:
-            self.del_test(item.path)
+        elif failing_item is not None:
+            self._remove_failure(item.path)
+
+    def remove(self, parent, index, item):
+        # Tests that have been removed from the suite are no longer problems.
+        for test in item.iter_tests():
+            if test.path in self.failing:
+                self._remove_failure(test.path)
+
+    def _remove_failure(self, path):
+        """Remove a test that is no longer failing.
+
+        The outermost node that contains no other failing tests is
+        removed from the problem tree.
+        """
+        del self.failing[path]
+        parent = self
+        removed = None
+        for node in self._nodes_on_path(path):
+            self.failing_counts[node] -= 1
+            if self.failing_counts[node] == 0:
+                del self.failing_counts[node]
+                if removed is None:
+                    removed = node
+                    del parent[node.name]
+            parent = node
 
     def split_test_id(self, test_id):
         return self.suite.split_test_id(test_id)
 
     def join_path(self, parent, klass, part):
         return self.suite.join_path(parent, klass, part)
+
+
+class TestTreeRow:
+    """A row in a TestTree, displaying a single node of a test suite.
+
+    Any attribute of the node (path, label, status, ...) can be
+    retrieved from the row.
+    """
+    def __init__(self, tree, node, owner):
+        self._tree = tree
+        self._node = node
+        # The row containing this row.
+        self._owner = owner
+        # The parent row, as reported to the tree widget; None for a
+        # top level row.
+        self._parent = None if owner is tree else owner
+        # The rows for the children that have been shown, in order.
+        # None until the children are first requested.
+        self._rows = None
+        # The placeholder for any children that haven't been shown.
+        self._more = TestTreeMore(self, None if tree is self else self)
+
+    def __repr__(self):
+        return '<TestTreeRow %s>' % self._node.path
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self._node, attr)
+
+    @property
+    def node(self):
+        "The node displayed by this row"
+        return self._node
+
+    def _load(self):
+        "Make sure the first page of child rows has been created."
+        if self._rows is None:
+            self._rows = []
+            if self._node.can_have_children():
+                self._tree._show(self, self._tree.page_size, budget=True)
+            self._more._shown = self._more.count > 0
+        return self._rows
+
+    ######################################################################
+    # Methods required by the TreeSource interface
+    ######################################################################
+
+    def __len__(self):
+        # The placeholder (if needed) follows the rows that have been shown.
+        return len(self._load()) + (1 if self._more._shown else 0)
+
+    def __getitem__(self, index):
+        rows = self._load()
+        if index < 0:
+            index += len(self)
+        if index == len(rows) and self._more._shown:
+            return self._more
+        return rows[index]
+
+    def index(self, row):
+        if row is self._more:
+            return len(self._load())
+        return self._load().index(row)
+
+    def can_have_children(self):
+        return self._node.can_have_children()
+
+
+class TestTreeMore:
+    """A placeholder row, standing in for children that haven't been shown.
+    """
+    def __init__(self, owner, parent):
+        # The row whose children are hidden.
+        self._owner = owner
+        # The parent row, as reported to the tree widget.
+        self._parent = parent
+        # Has the placeholder been shown to the tree widget?
+        self._shown = False
+
+    def __repr__(self):
+        return '<TestTreeMore %s>' % self.count
+
+    @property
+    def count(self):
+        "The number of children that haven't been shown"
+        owner = self._owner
+        if owner._rows is None or not owner.can_have_children():
+            return 0
+        return owner._tree._child_count(owner._node) - len(owner._rows)
+
+    @property
+    def label(self):
+        "The display label for the row"
+        return (None, '{:,} more...'.format(self.count))
+
+    def __len__(self):
+        return 0
+
+    def can_have_children(self):
+        return False
+
+
+class TestTree(TestTreeRow, Source):
+    """A lazily populated tree source, displaying a test suite.
+
+    Rows for the children of a node are only created when the tree
+    widget first asks for them, and then only `page_size` at a time.
+    No more than `max_rows` rows will be created unless they are
+    explicitly requested with show_more(). Any children that haven't
+    been shown are represented by a single placeholder row.
+
+    This keeps the cost of displaying a suite independent of the
+    number of tests it contains.
+
+    The tree can also be filtered to show a subset of the tests; see
+    set_filter().
+    """
+    def __init__(self, suite, page_size=500, max_rows=10000):
+        Source.__init__(self)
+        TestTreeRow.__init__(self, self, suite, None)
+        self.page_size = page_size
+        self.max_rows = max_rows
+
+        # The row displaying each node that has a row.
+        self._row_for = {suite: self}
+        self._row_count = 0
+
+        # If the tree is filtered, the paths of the tests to show, and
+        # the number of children to show for each node that is shown.
+        self._paths = None
+        self._filter = None
+
+        # Listen to any changes on the test suite
+        suite.add_listener(self)
+
+    def __repr__(self):
+        return '<TestTree %r>' % self._node
+
+    def _shown(self, node):
+        "Is the node shown, given the current filter?"
+        return self._filter is None or node in self._filter
+
+    def _child_count(self, node):
+        "The number of children of a node that can be shown."
+        if self._filter is None:
+            return len(node)
+        return self._filter.get(node, 0)
+
+    def _show(self, row, count, budget):
+        """Create rows for up to `count` of the hidden children of a row.
+
+        If `budget` is True, no more than `max_rows` rows will exist
+        once the rows have been created. Returns the new rows.
+        """
+        if budget:
+            count = min(count, self.max_rows - self._row_count)
+
+        new_rows = []
+        if count > 0:
+            for label in row._node._child_labels:
+                node = row._node[label]
+                if node not in self._row_for and self._shown(node):
+                    new_rows.append(self._make_row(node, row))
+                    if len(new_rows) == count:
+                        break
+            if row._rows:
+                row._rows = sorted(row._rows + new_rows, key=lambda child: child._node.name)
+            else:
+                row._rows = new_rows
+        return new_rows
+
+    def _make_row(self, node, owner):
+        "Create a row for a node, as a child of the `owner` row."
+        row = TestTreeRow(self, node, owner)
+        self._row_for[node] = row
+        self._row_count += 1
+        return row
+
+    def _forget(self, row):
+        "Discard a row, and the rows for all its descendants."
+        del self._row_for[row._node]
+        self._row_count -= 1
+        for child in row._rows or []:
+            self._forget(child)
+
+    def _notify_inserted(self, row):
+        "Notify listeners of a new row, and any rows it contains."
+        self._notify('insert', parent=row._parent, index=row._owner.index(row), item=row)
+        if row.can_have_children():
+            for child in row:
+                self._notify_inserted(child)
+
+    def show_more(self, more):
+        "Show the next page of the children hidden behind a placeholder."
+        owner = more._owner
+        for row in self._show(owner, self.page_size, budget=False):
+            self._notify_inserted(row)
+
+        if more.count:
+            self._notify('change', item=more)
+        else:
+            more._shown = False
+            self._notify('remove', parent=more._parent, index=len(owner._rows), item=more)
+
+    def set_filter(self, paths):
+        """Only show the tests with the given paths, and the nodes containing them.
+
+        If `paths` is None, every test is shown.
+        """
+        # Replace all the rows.
+        self._notify('clear')
+        if paths is None:
+            self._paths = None
+            self._filter = None
+        else:
+            self._paths = set(paths)
+            self._filter = {}
+            for path in self._paths:
+                self._filter_add(path)
+
+        self._rows = None
+        self._row_for = {self._node: self}
+        self._row_count = 0
+        for row in self:
+            self._notify_inserted(row)
+
+    def _filter_add(self, path):
+        """Add a test, and the nodes containing it, to the filter.
+
+        Returns the parent of the outermost node that wasn't previously
+        shown, and that node; or None if the test isn't in the suite,
+        or was already shown.
+        """
+        try:
+            nodes = [self._node]
+            for NodeClass, part in self._node.split_test_id(path):
+                nodes.append(nodes[-1][part])
+        except KeyError:
+            return None
+
+        added = None
+        for parent, node in zip(nodes, nodes[1:]):
+            if node not in self._filter:
+                self._filter[node] = 0
+                self._filter[parent] = self._filter.get(parent, 0) + 1
+                if added is None:
+                    added = (parent, node)
+        return added
+
+    def _filter_discard(self, parent, node):
+        "Remove a node, and any nodes it contains, from the filter."
+        if node in self._filter:
+            self._filter[parent] -= 1
+            nodes = [node]
+            while nodes:
+                node = nodes.pop()
+                if self._filter.pop(node, 0):
+                    nodes.extend(node[label] for label in node._child_labels)
+
+    ######################################################################
+    # Notifications from the test suite
+    ######################################################################
+
+    def insert(self, parent, index, item):
+        if self._filter is not None:
+            # Containers are shown when a test they contain is added.
+            if item.can_have_children() or item.path not in self._paths:
+                return
+            added = self._filter_add(item.path)
+            if added is None:
+                return
+            parent, item = added
+
+        owner = self._row_for.get(parent)
+        if owner is None or owner._rows is None or item in self._row_for:
+            # The widget hasn't asked for these children yet, or the
+            # child was shown when the rows of its parent were created.
+            return
+
+        # When a batch of changes is delivered, the suite already holds
+        # every child added by the batch, so the decision is based on the
+        # rows that have been shown, not on the size of the suite.
+        # If no children are hidden, and there's room, the new child can
+        # be shown; otherwise, it joins the placeholder.
+        more = owner._more
+        if (
+                    not more._shown
+                    and len(owner._rows) < self.page_size
+                    and self._row_count < self.max_rows
+                ):
+            row = self._make_row(item, owner)
+            names = [child._node.name for child in owner._rows]
+            owner._rows.insert(bisect.bisect_left(names, item.name), row)
+            self._notify_inserted(row)
+        elif more._shown:
+            self._notify('change', item=more)
+        else:
+            more._shown = True
+            self._notify('insert', parent=more._parent, index=len(owner._rows), item=more)
+
+    def remove(self, parent, index, item):
+        if not self._shown(item):
+            return
+        if self._filter is not None:
+            self._filter_discard(parent, item)
+
+        owner = self._row_for.get(parent)
+        if owner is None or owner._rows is None:
+            return
+
+        row = self._row_for.get(item)
+        if row is not None:
+            position = owner._rows.index(row)
+            del owner._rows[position]
+            self._forget(row)
+            self._notify('remove', parent=row._parent, index=position, item=row)
+        elif not owner._more._shown:
+            # The child was never shown.
+            return
+        elif owner._more.count:
+            self._notify('change', item=owner._more)
+        else:
+            owner._more._shown = False
+            self._notify('remove', parent=owner._more._parent, index=len(owner._rows), item=owner._more)
+
+    def change(self, item):
+        row = self._row_for.get(item)
+        if row is not None:
+            self._notify('change', item=row)
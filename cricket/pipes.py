@@ -1,6 +1,10 @@
 from __future__ import absolute_import
 
+import cProfile
+import functools
+import inspect
 import json
+import os
 try:
     from StringIO import StringIO
 except ImportError:
@@ -14,12 +18,31 @@ if sys.version_info < (2, 7):
 else:
     import unittest
 
+from cricket.instrumentation import ResourceMonitor
+from cricket.profiling import profile_summary
 
+
+def read_labels(labels_file):
+    """Read the test labels listed in a file, one label per line.
+
+    If `labels_file` is '-', labels will be read from stdin.
+    """
+    if labels_file == '-':
+        return [line.strip() for line in sys.stdin if line.strip()]
+
+    with open(labels_file, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+@functools.lru_cache(maxsize=None)
 def trim_docstring(docstring):
     """Trim leading spaces in docstring indentation.
 
     Algorithm taken from PEP 257:
         http://www.python.org/dev/peps/pep-0257/#id20
+
+    Results are cached; a docstring is reported for every
+    result (and subtest result) of a test.
     """
     # Convert tabs to spaces (following the normal Python rules)
     # and split into a list of lines:
@@ -44,6 +67,40 @@ def trim_docstring(docstring):
     return '\n'.join(trimmed)
 
 
+def discovery_record(test):
+    """Describe a discovered test as a single line of compact JSON.
+
+    The record includes the test ID, the file and line where the test
+    is defined, its docstring, any Django tags as markers, and the
+    reason for an unconditional skip. See
+    cricket.model.TestSuite.put_discovered() for the format.
+    """
+    record = {'id': test.id()}
+
+    method = getattr(test, getattr(test, '_testMethodName', ''), None)
+    if method is not None:
+        # Decorators such as mock.patch wrap the test method.
+        function = inspect.unwrap(method)
+        try:
+            record['file'] = os.path.relpath(inspect.getsourcefile(function))
+            record['line'] = function.__code__.co_firstlineno
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+        if test._testMethodDoc:
+            record['description'] = trim_docstring(test._testMethodDoc)
+
+        markers = set(getattr(method, 'tags', ())) | set(getattr(type(test), 'tags', ()))
+        if markers:
+            record['markers'] = sorted(markers)
+
+        for obj in (type(test), method):
+            if getattr(obj, '__unittest_skip__', False):
+                record['skip'] = getattr(obj, '__unittest_skip_why__', '')
+
+    return json.dumps(record, separators=(',', ':'))
+
+
 class PipedTestResult(unittest.result.TestResult):
     """A test result class that can print test results in a machine-parseable format.
 
@@ -51,11 +108,26 @@ class PipedTestResult(unittest.result.TestResult):
     """
     RESULT_SEPARATOR = '\x1f'  # ASCII US (Unit Separator)
 
-    def __init__(self, stream):
+    def __init__(self, stream, maxfail=None, coverage=None, profile=False, resources=False):
         super(PipedTestResult, self).__init__()
         self.stream = stream
         self._first = True
 
+        # The number of failures after which the run should stop.
+        self.maxfail = maxfail
+
+        # If coverage is being gathered, each test is recorded
+        # in its own coverage context.
+        self.coverage = coverage
+
+        # If the run is being profiled, each test has its own profiler.
+        self.profile = profile
+        self._profiler = None
+
+        # If resource usage is being recorded, each test has its own monitor.
+        self.resources = resources
+        self._monitor = None
+
         # Create a clean buffer for stdout content.
         self._stdout = StringIO()
         sys.stdout = self._stdout
@@ -66,6 +138,12 @@ class PipedTestResult(unittest.result.TestResult):
         # for the misbehaving test.
         self._current_test = None
 
+    def _check_maxfail(self):
+        "Stop the test run if the maximum number of failures has been reached."
+        failures = len(self.failures) + len(self.errors) + len(self.unexpectedSuccesses)
+        if self.maxfail and failures >= self.maxfail:
+            self.stop()
+
     def description(self, test):
         try:
             # Wrapped _ErrorHolder objects have their own description
@@ -86,6 +164,9 @@ class PipedTestResult(unittest.result.TestResult):
 
         path = test.id()
 
+        if self.coverage is not None:
+            self.coverage.switch_context(path)
+
         body = {
             'path': path,
             'start_time': time.time()
@@ -98,6 +179,38 @@ class PipedTestResult(unittest.result.TestResult):
         self.stream.write('%s\n' % json.dumps(body))
         self.stream.flush()
 
+        if self.resources:
+            self._monitor = ResourceMonitor()
+            self._monitor.start()
+
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stopTest(self, test):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler = None
+        self._monitor = None
+        super(PipedTestResult, self).stopTest(test)
+
+    def _write_result(self, body):
+        """Write the result of a test.
+
+        If the test is being profiled, or its resource usage recorded,
+        they are included in the result.
+        """
+        if self._monitor is not None:
+            # Like the profile, the usage is that of the test so far.
+            body['resources'] = self._monitor.usage()
+        if self._profiler is not None:
+            # A test with subtests reports several results; each one
+            # includes the profile of the test so far.
+            body['profile'] = profile_summary(self._profiler)
+            self._profiler.enable()
+        self.stream.write('%s\n' % json.dumps(body))
+        self.stream.flush()
+
     def addSuccess(self, test):
         super(PipedTestResult, self).addSuccess(test)
         body = {
@@ -106,14 +219,14 @@ class PipedTestResult(unittest.result.TestResult):
             'description': self.description(test),
             'output': self._stdout.getvalue(),
         }
-        self.stream.write('%s\n' % json.dumps(body))
-        self.stream.flush()
+        self._write_result(body)
         self._current_test = None
 
     def addError(self, test, err):
         # If there's no current test, the error occurred during test
         # setup. Output a test start line so the protocol isn't confused.
-        if self._current_test is None:
+        synthesized = self._current_test is None
+        if synthesized:
             self.startTest(test)
 
         super(PipedTestResult, self).addError(test, err)
@@ -124,9 +237,13 @@ class PipedTestResult(unittest.result.TestResult):
             'error': '\n'.join(traceback.format_exception(*err)),
             'output': self._stdout.getvalue(),
         }
-        self.stream.write('%s\n' % json.dumps(body))
-        self.stream.flush()
+        self._write_result(body)
         self._current_test = None
+        if synthesized:
+            # The test runner won't stop a test that it didn't start;
+            # stop it here, so its profiler doesn't keep running.
+            self.stopTest(test)
+        self._check_maxfail()
 
     def addFailure(self, test, err):
         super(PipedTestResult, self).addFailure(test, err)
@@ -137,9 +254,9 @@ class PipedTestResult(unittest.result.TestResult):
             'error': '\n'.join(traceback.format_exception(*err)),
             'output': self._stdout.getvalue(),
         }
-        self.stream.write('%s\n' % json.dumps(body))
-        self.stream.flush()
+        self._write_result(body)
         self._current_test = None
+        self._check_maxfail()
 
     def addSubTest(self, test, subtest, err):
         super(PipedTestResult, self).addSubTest(test, subtest, err)
@@ -150,8 +267,7 @@ class PipedTestResult(unittest.result.TestResult):
                 'description': self.description(test),
                 'output': self._stdout.getvalue(),
             }
-            self.stream.write('%s\n' % json.dumps(body))
-            self.stream.flush()
+            self._write_result(body)
         elif issubclass(err[0], test.failureException):
             body = {
                 'status': 'F',
@@ -160,8 +276,7 @@ class PipedTestResult(unittest.result.TestResult):
                 'error': '\n'.join(traceback.format_exception(*err)),
                 'output': self._stdout.getvalue(),
             }
-            self.stream.write('%s\n' % json.dumps(body))
-            self.stream.flush()
+            self._write_result(body)
         else:
             body = {
                 'status': 'E',
@@ -170,8 +285,8 @@ class PipedTestResult(unittest.result.TestResult):
                 'error': '\n'.join(traceback.format_exception(*err)),
                 'output': self._stdout.getvalue(),
             }
-            self.stream.write('%s\n' % json.dumps(body))
-            self.stream.flush()
+            self._write_result(body)
+        self._check_maxfail()
 
     def addSkip(self, test, reason):
         super(PipedTestResult, self).addSkip(test, reason)
@@ -182,8 +297,7 @@ class PipedTestResult(unittest.result.TestResult):
             'error': reason,
             'output': self._stdout.getvalue(),
         }
-        self.stream.write('%s\n' % json.dumps(body))
-        self.stream.flush()
+        self._write_result(body)
         self._current_test = None
 
     def addExpectedFailure(self, test, err):
@@ -195,8 +309,7 @@ class PipedTestResult(unittest.result.TestResult):
             'error': '\n'.join(traceback.format_exception(*err)),
             'output': self._stdout.getvalue(),
         }
-        self.stream.write('%s\n' % json.dumps(body))
-        self.stream.flush()
+        self._write_result(body)
         self._current_test = None
 
     def addUnexpectedSuccess(self, test):
@@ -207,9 +320,9 @@ class PipedTestResult(unittest.result.TestResult):
             'description': self.description(test),
             'output': self._stdout.getvalue(),
         }
-        self.stream.write('%s\n' % json.dumps(body))
-        self.stream.flush()
+        self._write_result(body)
         self._current_test = None
+        self._check_maxfail()
 
 
 class PipedTestRunner(unittest.TextTestRunner):
@@ -221,8 +334,12 @@ class PipedTestRunner(unittest.TextTestRunner):
     START_TEST_RESULTS = '\x02'  # ASCII STX (Start of Text)
     END_TEST_RESULTS = '\x03'    # ASCII ETX (End of Text)
 
-    def __init__(self, stream=sys.stdout):
+    def __init__(self, stream=sys.stdout, maxfail=None, coverage=None, profile=False, resources=False):
         self.stream = stream
+        self.maxfail = maxfail
+        self.coverage = coverage
+        self.profile = profile
+        self.resources = resources
 
     def run(self, test):
         "Run the given test case or test suite."
@@ -230,7 +347,13 @@ class PipedTestRunner(unittest.TextTestRunner):
         old_stdout = sys.stdout
 
         # Create the result pipe, and run the tests with it.
-        result = PipedTestResult(self.stream)
+        result = PipedTestResult(
+            self.stream,
+            maxfail=self.maxfail,
+            coverage=self.coverage,
+            profile=self.profile,
+            resources=self.resources,
+        )
         test(result)
 
         # Report end of test run
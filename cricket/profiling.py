@@ -0,0 +1,83 @@
+"""Profiling individual tests.
+
+When a run is profiled, the test runner profiles each test with
+cProfile, and reports a summary of the profile along with the result
+of the test. Only the functions that took the most time are included
+in the summary, so the profile of a test is small enough to be sent
+over the result pipe.
+
+Each function in a summary is described by a row of:
+
+    [filename, line, function name, calls, own time, cumulative time]
+
+Own time excludes the time spent in the functions it calls; cumulative
+time includes it.
+"""
+import os
+
+# The number of functions included in the summary of a profile,
+# by own time and by cumulative time.
+SUMMARY_SIZE = 30
+
+# The number of functions listed in a table of hotspots.
+HOTSPOTS = 20
+
+
+def profile_summary(profiler, limit=SUMMARY_SIZE):
+    """Summarize the functions recorded by a profiler.
+
+    The profiler is disabled. The summary includes the `limit`
+    functions with the most own time, and the `limit` functions with
+    the most cumulative time, in order of decreasing cumulative time.
+    """
+    profiler.create_stats()
+
+    cwd = os.getcwd() + os.sep
+    rows = []
+    for (filename, line, function), (primitive_calls, calls, own, cumulative, callers) in profiler.stats.items():
+        if function.startswith("<method 'disable' of '_lsprof.Profiler"):
+            # The profiler itself.
+            continue
+        if filename.startswith(cwd):
+            filename = filename[len(cwd):]
+        rows.append([filename, line, function, calls, round(own, 6), round(cumulative, 6)])
+
+    summary = sorted(rows, key=lambda row: row[4], reverse=True)[:limit]
+    summary.extend(
+        row
+        for row in sorted(rows, key=lambda row: row[5], reverse=True)[:limit]
+        if row not in summary
+    )
+    return sorted(summary, key=lambda row: row[5], reverse=True)
+
+
+def aggregate(profiles):
+    """Combine the summaries of several profiles into one.
+
+    Calls and times are added together for each function.
+    """
+    combined = {}
+    for profile in profiles:
+        for filename, line, function, calls, own, cumulative in profile:
+            row = combined.get((filename, line, function))
+            if row is None:
+                combined[(filename, line, function)] = [filename, line, function, calls, own, cumulative]
+            else:
+                row[3] += calls
+                row[4] += own
+                row[5] += cumulative
+    return list(combined.values())
+
+
+def hotspots(profile, limit=HOTSPOTS):
+    "The `limit` functions in a profile summary with the most own time."
+    return sorted(profile, key=lambda row: row[4], reverse=True)[:limit]
+
+
+def function_label(row):
+    "A description of the function in a row of a profile summary."
+    filename, line, function = row[:3]
+    if filename == '~':
+        # A built-in function.
+        return function
+    return '{} ({}:{})'.format(function, filename, line)
@@ -10,48 +10,81 @@ class PyTestTestSuite(TestSuite):
 
     def discover_commandline(self):
         "Command line: Discover all available tests in a project."
+        if self.static_discovery:
+            return [sys.executable, '-m', 'cricket.static_discovery', 'pytest']
         return ['pytest', '--cricket', 'discover']
 
-    def execute_commandline(self, labels):
-        "Return the command line to execute the specified test labels"
+    def execute_commandline(self, labels_file, profile=False):
+        """Return the command line to execute the test labels listed in labels_file.
+
+        If profile is True, each test will be profiled.
+        """
         args = ['pytest', '--cricket', 'execute']
         # if self.coverage:
         #     args.append('--coverage')
-        if labels is None:
-            return args
-        return args + labels
+        if self.maxfail:
+            args.append('--maxfail={}'.format(self.maxfail))
+        if profile:
+            args.append('--cricket-profile')
+        if self.record_resources:
+            args.append('--cricket-resources')
+        if labels_file is not None:
+            args.append('--cricket-labels-from={}'.format(labels_file))
+        return args
 
     def split_test_id(self, test_id):
-        dirparts = test_id.split(os.sep)
-        pathparts = dirparts[-1].split('::')
+        file_path, _, test_path = test_id.partition('::')
+        if not test_path:
+            raise Exception("Don't know how to handle test {}.".format(test_id))
+
+        # A parametrized test has an id of the form `test_x[param]`.
+        # The parameter id is arbitrary text (it may even contain `::`
+        # or path separators), so split it off before anything else.
+        # Each parametrization becomes a leaf of a node representing
+        # the test function, so that the function nodeid can be used
+        # to select every parametrization at once.
+        param_index = test_path.find('[')
+        if param_index != -1:
+            test_path, param = test_path[:param_index], test_path[param_index:]
+        else:
+            param = None
 
+        names = test_path.split('::')
+
+        # Directories, then the test file itself.
         parts = [
             (TestModule, dirpart)
-            for dirpart in dirparts[:-1]
+            for dirpart in file_path.split(os.sep)
         ]
-
-        if len(pathparts) == 2:
-            parts.extend([
-                (TestModule, pathparts[0]),
-                (TestMethod, pathparts[1]),
-            ])
-        elif len(pathparts) == 3:
+        # Test classes (which may be nested)
+        parts.extend(
+            (TestCase, name)
+            for name in names[:-1]
+        )
+        # The test function, and any parametrizations of that function.
+        if param is None:
+            parts.append((TestMethod, names[-1]))
+        else:
             parts.extend([
-                (TestModule, pathparts[0]),
-                (TestCase, pathparts[1]),
-                (TestMethod, pathparts[2]),
+                (TestCase, names[-1]),
+                (TestMethod, param),
             ])
-        else:
-            raise Exception("Don't know how to handle test with {} parts.".format(len(pathparts)))
 
         return parts
 
+    def source_file(self, test_id):
+        "Return the name of the file that defines the test test_id"
+        return test_id.partition('::')[0]
+
     def join_path(self, parent, klass, part):
         if parent.path is None:
             return part
         else:
             if klass == TestModule:
                 join_char = os.sep
+            elif part.startswith('['):
+                # Parametrization ids are appended directly to the function name.
+                join_char = ''
             else:
                 join_char = '::'
 
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import cProfile
+import inspect
 import json
 import os
 import sys
@@ -8,6 +10,9 @@ import pluggy
 import py
 import pytest
 
+from cricket.instrumentation import ResourceMonitor
+from cricket.profiling import profile_summary
+
 
 def pytest_addoption(parser):
     group = parser.getgroup("cricket", "BeeWare Cricket integration")
@@ -15,6 +20,19 @@ def pytest_addoption(parser):
         '--cricket', dest="cricket_mode", metavar="cricket_mode",
         action="store", choices=["discover", "execute", "off"], default="off",
         help="Cricket output mode")
+    group.addoption(
+        '--cricket-labels-from', dest="cricket_labels_from", metavar="FILE",
+        action="store", default=None,
+        help="Read the test nodeids to execute from FILE, one per line "
+             "('-' for stdin). Replaces any test paths on the command line.")
+    group.addoption(
+        '--cricket-profile', dest="cricket_profile",
+        action="store_true", default=False,
+        help="Profile each test, and report the profile with the test result.")
+    group.addoption(
+        '--cricket-resources', dest="cricket_resources",
+        action="store_true", default=False,
+        help="Record the resources used by each test, and report them with the test result.")
 
 
 @pytest.hookimpl(trylast=True)
@@ -26,6 +44,21 @@ def pytest_configure(config):
         # Force the traceback style to native.
         config.option.tbstyle = 'native'
 
+    if config.option.cricket_labels_from:
+        # Collection uses config.args, so replace the test selection
+        # with the nodeids listed in the file.
+        if config.option.cricket_labels_from == '-':
+            # Capturing has already replaced stdin; make the real stdin
+            # available until capturing is next resumed.
+            capman = config.pluginmanager.getplugin('capturemanager')
+            if capman is not None:
+                capman.suspend_global_capture(in_=True)
+            lines = sys.stdin.readlines()
+        else:
+            with open(config.option.cricket_labels_from, encoding='utf-8') as labels_file:
+                lines = labels_file.readlines()
+        config.args = [line.strip() for line in lines if line.strip()]
+
     if config.option.cricket_mode == 'discover':
         reporter = CricketDiscoverReporter(config, file=sys.stdout)
         config.pluginmanager.register(reporter, "terminalreporter")
@@ -62,15 +95,45 @@ class CricketReporter:
 
 class CricketDiscoverReporter(CricketReporter):
     def pytest_itemcollected(self, item):
-        self.print(item.nodeid, flush=True)
+        # Describe the test with a discovery record;
+        # see cricket.model.TestSuite.put_discovered().
+        record = {'id': item.nodeid}
+
+        path, line, _ = item.location
+        record['file'] = path
+        if line is not None:
+            record['line'] = line + 1
+
+        docstring = getattr(getattr(item, 'function', None), '__doc__', None)
+        if docstring:
+            record['description'] = inspect.cleandoc(docstring)
+
+        markers = {mark.name for mark in item.iter_markers()}
+        if markers:
+            record['markers'] = sorted(markers)
+
+        skip = item.get_closest_marker('skip')
+        if skip is not None:
+            record['skip'] = skip.kwargs.get('reason', skip.args[0] if skip.args else '')
+
+        self.print(json.dumps(record, separators=(',', ':')), flush=True)
 
 
 class CricketExecuteReporter(CricketReporter):
     def report(self, **kwargs):
+        if self._monitor is not None and 'status' in kwargs:
+            # Each result of the test includes the resources used by the test so far.
+            kwargs['resources'] = self._monitor.usage()
+        if self._profiler is not None and 'status' in kwargs:
+            # Each result of the test includes the profile of the test so far.
+            kwargs['profile'] = profile_summary(self._profiler)
+            self._profiler.enable()
         self.print(json.dumps(kwargs), flush=True)
 
     def pytest_sessionstart(self, session):
         self._started = False
+        self._profiler = None
+        self._monitor = None
 
     def pytest_runtest_logstart(self, nodeid, location):
         if not self._started:
@@ -84,6 +147,20 @@ class CricketExecuteReporter(CricketReporter):
             start_time=time.time()
         )
 
+        if self.config.option.cricket_resources:
+            self._monitor = ResourceMonitor()
+            self._monitor.start()
+
+        if self.config.option.cricket_profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler = None
+        self._monitor = None
+
     def report_pass(self, report):
         self.report(
             status='OK',
@@ -0,0 +1,631 @@
+"""Discovering tests without importing them.
+
+Importing every test module just to list the tests it contains can
+dominate startup time on a large project. The static discoverer parses
+each test file with `ast` instead, finding test classes, methods and
+functions by name. The result for each file is cached until the file
+is modified, so on subsequent runs only changed files are parsed.
+
+Anything that can't be determined statically -- a `load_tests`
+function, a parametrized test, a test class that inherits from a class
+defined in another module -- is discovered by importing the affected
+files, using the discoverer for the test framework.
+
+Usage:
+
+    python -m cricket.static_discovery {unittest,pytest}
+"""
+import ast
+import fnmatch
+import json
+import os
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+from cricket.impact import STATE_DIR
+
+
+STYLES = ('unittest', 'pytest')
+
+# The version of the file analysis. Cached results from
+# any other version of the analysis are discarded.
+CACHE_VERSION = 3
+
+# Modules that unittest is able to import.
+VALID_MODULE_NAME = re.compile(r'[_a-z]\w*\.py$', re.IGNORECASE)
+
+# Directories pytest doesn't search for tests (by default).
+PYTEST_NORECURSEDIRS = ('*.egg', '.*', '_darcs', 'build', 'CVS', 'dist', 'node_modules', 'venv', '{arch}')
+
+# conftest.py hooks that change how tests are collected.
+PYTEST_COLLECTION_HOOKS = {
+    'pytest_collect_file',
+    'pytest_collection_modifyitems',
+    'pytest_generate_tests',
+    'pytest_ignore_collect',
+    'pytest_pycollect_makeitem',
+    'pytest_pycollect_makemodule',
+}
+
+# Calls that can add tests to a module or class while it is being imported.
+DYNAMIC_CALLS = {'setattr', 'locals', 'globals', 'vars', 'exec', 'type'}
+
+# The TestCase classes of unittest and Django, which don't define any tests.
+TEST_CASE_BASES = {
+    'TestCase',
+    'IsolatedAsyncioTestCase',
+    'SimpleTestCase',
+    'TransactionTestCase',
+    'LiveServerTestCase',
+    'StaticLiveServerTestCase',
+}
+
+# The modules those classes are referenced through (e.g., `unittest.TestCase`).
+TEST_CASE_MODULES = {'unittest', 'django.test'}
+
+# Decorators (from ddt and parameterized) that generate test methods.
+GENERATING_DECORATORS = {'ddt', 'data', 'idata', 'file_data', 'expand', 'parameterized', 'parameterized_class'}
+
+# Configuration settings that change how pytest finds tests.
+PYTEST_COLLECTION_SETTINGS = ('python_files', 'python_classes', 'python_functions', 'testpaths', 'norecursedirs')
+
+
+######################################################################
+# Analysis of a single file
+######################################################################
+
+def _base_name(node):
+    "The name of a base class: `TestCase` for `unittest.TestCase`."
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _is_test_case_base(node):
+    "Is a base class one of the TestCase classes of unittest or Django?"
+    if isinstance(node, ast.Name):
+        return node.id in TEST_CASE_BASES
+    elif isinstance(node, ast.Attribute) and node.attr in TEST_CASE_BASES:
+        module = []
+        value = node.value
+        while isinstance(value, ast.Attribute):
+            module.insert(0, value.attr)
+            value = value.value
+        if isinstance(value, ast.Name):
+            return '.'.join([value.id] + module) in TEST_CASE_MODULES
+    return False
+
+
+def _resolve_class(cls, classes, seen=()):
+    """Determine the test methods of a class.
+
+    `classes` are the other classes defined in the same scope; methods
+    inherited from those classes are included. Returns a tuple of:
+
+        * is the class a unittest TestCase?
+        * a dictionary of the test methods of the class, keyed by name,
+          and
+        * are all the base classes known? If a class inherits from a
+          class defined elsewhere (other than one of the TestCase
+          classes of unittest or Django), its test methods can't be
+          determined statically.
+    """
+    is_test_case = False
+    known = not cls.keywords  # e.g., a metaclass
+    methods = {}
+    for base in reversed(cls.bases):
+        name = _base_name(base)
+        if name in classes and name not in seen and name != cls.name:
+            base_is_test_case, base_methods, base_known = _resolve_class(
+                classes[name], classes, seen + (cls.name,)
+            )
+            is_test_case = is_test_case or base_is_test_case
+            known = known and base_known
+            methods.update(base_methods)
+        elif _is_test_case_base(base):
+            is_test_case = True
+        elif name != 'object':
+            known = False
+
+    for node in cls.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith('test'):
+            methods[node.name] = node
+
+    return is_test_case, methods, known
+
+
+def _generates_tests(body):
+    "Could the statements in a module or class body create tests when they are executed?"
+    for node in body:
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            return True
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if any(
+                        _base_name(decorator.func if isinstance(decorator, ast.Call) else decorator)
+                        in GENERATING_DECORATORS
+                        for decorator in node.decorator_list
+                    ):
+                return True
+            # The body of a function isn't executed on import.
+            if isinstance(node, ast.ClassDef) and _generates_tests(node.body):
+                return True
+        elif isinstance(node, (ast.If, ast.With, ast.AsyncWith)):
+            if _generates_tests(node.body) or _generates_tests(getattr(node, 'orelse', [])):
+                return True
+        elif isinstance(node, ast.Try):
+            if any(
+                        _generates_tests(block)
+                        for block in [node.body, node.orelse, node.finalbody]
+                        + [handler.body for handler in node.handlers]
+                    ):
+                return True
+        elif any(
+                    isinstance(child, ast.Call) and _base_name(child.func) in DYNAMIC_CALLS
+                    for child in ast.walk(node)
+                ):
+            return True
+    return False
+
+
+def _defines(tree, names):
+    "Does the module define a top-level function with any of the given names?"
+    return any(
+        isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name in names
+        for node in tree.body
+    )
+
+
+def _constant_argument(call, position, keyword):
+    "The value of a literal argument to a call, or None."
+    for argument in call.keywords:
+        if argument.arg == keyword and isinstance(argument.value, ast.Constant):
+            return argument.value.value
+    if len(call.args) > position and isinstance(call.args[position], ast.Constant):
+        return call.args[position].value
+    return None
+
+
+def _record(test_id, filename, node, markers=(), skip=None):
+    """Describe a test as a discovery record.
+
+    See cricket.model.TestSuite.put_discovered() for the format.
+    """
+    record = {
+        'id': test_id,
+        'file': filename,
+        # A decorated function is reported at its first decorator.
+        'line': min([node.lineno] + [decorator.lineno for decorator in node.decorator_list]),
+    }
+    docstring = ast.get_docstring(node)
+    if docstring:
+        record['description'] = docstring
+    if markers:
+        record['markers'] = sorted(markers)
+    if skip is not None:
+        record['skip'] = skip
+    return record
+
+
+def _unittest_decorations(node):
+    "Return the Django tags, and the reason for an unconditional skip, applied by decorators."
+    tags = set()
+    skip = None
+    for decorator in node.decorator_list:
+        if not isinstance(decorator, ast.Call):
+            continue
+        name = _base_name(decorator.func)
+        if name == 'tag':
+            tags.update(
+                argument.value
+                for argument in decorator.args
+                if isinstance(argument, ast.Constant)
+            )
+        elif name == 'skip':
+            skip = _constant_argument(decorator, 0, 'reason') or ''
+    return tags, skip
+
+
+def analyze_unittest(source, filename, module_name):
+    """Find the unittest tests defined in a module's source.
+
+    Returns a list of discovery records, and a flag indicating that
+    the module must be imported to discover its tests.
+    """
+    tree = ast.parse(source)
+    if _defines(tree, {'load_tests'}) or _generates_tests(tree.body):
+        return [], True
+
+    classes = {
+        node.name: node
+        for node in tree.body
+        if isinstance(node, ast.ClassDef)
+    }
+    records = []
+    for cls in classes.values():
+        is_test_case, methods, known = _resolve_class(cls, classes)
+        if not known and (is_test_case or methods or 'Test' in cls.name):
+            # This could be a test case, but its tests aren't known.
+            return [], True
+        if is_test_case:
+            class_tags, class_skip = _unittest_decorations(cls)
+            for name, method in sorted(methods.items()):
+                tags, skip = _unittest_decorations(method)
+                records.append(_record(
+                    '{}.{}.{}'.format(module_name, cls.name, name),
+                    filename, method,
+                    markers=class_tags | tags,
+                    skip=skip if skip is not None else class_skip,
+                ))
+    return records, False
+
+
+def _is_dynamic_pytest(tree):
+    "Does a module use features that generate tests at collection time?"
+    if _defines(tree, PYTEST_COLLECTION_HOOKS) or _generates_tests(tree.body):
+        return True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr == 'parametrize':
+            return True
+        elif isinstance(node, ast.Name) and node.id == 'parametrize':
+            return True
+        elif (
+                    isinstance(node, ast.Call)
+                    and _base_name(node.func) == 'fixture'
+                    and any(keyword.arg == 'params' for keyword in node.keywords)
+                ):
+            # A parametrized fixture parametrizes every test that uses it.
+            return True
+    return False
+
+
+def _pytest_marks(expressions):
+    """Find the pytest marks applied by decorators (or by a `pytestmark`).
+
+    Returns the set of mark names, and the reason for an
+    unconditional skip.
+    """
+    marks = set()
+    skip = None
+    for expression in expressions:
+        for node in ast.walk(expression):
+            if isinstance(node, ast.Attribute) and _base_name(node.value) == 'mark':
+                marks.add(node.attr)
+            elif (
+                        isinstance(node, ast.Call)
+                        and isinstance(node.func, ast.Attribute)
+                        and _base_name(node.func.value) == 'mark'
+                        and node.func.attr == 'skip'
+                    ):
+                skip = _constant_argument(node, 0, 'reason') or ''
+    if skip is None and 'skip' in marks:
+        skip = ''
+    return marks, skip
+
+
+def _pytest_class_records(cls, classes, prefix, filename, marks):
+    """Find the tests in a test class.
+
+    `marks` are the marks (and skip reason) applied to the scope
+    containing the class. Returns a list of discovery records, or
+    None if the class must be imported to discover its tests.
+    """
+    is_test_case, methods, known = _resolve_class(cls, classes)
+    node_id = '{}::{}'.format(prefix, cls.name)
+    class_marks, class_skip = _pytest_marks(cls.decorator_list)
+    class_marks |= marks[0]
+    if class_skip is None:
+        class_skip = marks[1]
+
+    def method_records():
+        records = []
+        for name, method in sorted(methods.items()):
+            method_marks, method_skip = _pytest_marks(method.decorator_list)
+            records.append(_record(
+                '{}::{}'.format(node_id, name), filename, method,
+                markers=class_marks | method_marks,
+                skip=method_skip if method_skip is not None else class_skip,
+            ))
+        return records
+
+    if is_test_case:
+        # unittest test cases are collected no matter what they are called.
+        if not known:
+            return None
+        return method_records()
+
+    if not cls.name.startswith('Test'):
+        if not known and methods:
+            # This could be a unittest test case.
+            return None
+        return []
+
+    if any(
+                isinstance(node, ast.FunctionDef) and node.name == '__init__'
+                for node in cls.body
+            ):
+        # pytest can't collect classes with a constructor.
+        return []
+    if not known:
+        return None
+
+    records = method_records()
+
+    # Nested test classes
+    nested = {
+        node.name: node
+        for node in cls.body
+        if isinstance(node, ast.ClassDef)
+    }
+    for nested_cls in nested.values():
+        nested_records = _pytest_class_records(
+            nested_cls, nested, node_id, filename, (class_marks, class_skip)
+        )
+        if nested_records is None:
+            return None
+        records.extend(nested_records)
+    return records
+
+
+def analyze_pytest(source, filename):
+    """Find the pytest tests defined in a module's source.
+
+    Returns a list of discovery records, and a flag indicating that
+    the module must be imported to discover its tests.
+    """
+    tree = ast.parse(source)
+    if _is_dynamic_pytest(tree):
+        return [], True
+
+    # Marks applied to every test in the module.
+    module_marks = _pytest_marks(
+        node.value
+        for node in tree.body
+        if isinstance(node, ast.Assign)
+        and any(_base_name(target) == 'pytestmark' for target in node.targets)
+    )
+
+    classes = {
+        node.name: node
+        for node in tree.body
+        if isinstance(node, ast.ClassDef)
+    }
+    records = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith('test'):
+            marks, skip = _pytest_marks(node.decorator_list)
+            records.append(_record(
+                '{}::{}'.format(filename, node.name), filename, node,
+                markers=module_marks[0] | marks,
+                skip=skip if skip is not None else module_marks[1],
+            ))
+        elif isinstance(node, ast.ClassDef):
+            class_records = _pytest_class_records(node, classes, filename, filename, module_marks)
+            if class_records is None:
+                return [], True
+            records.extend(class_records)
+    return records, False
+
+
+######################################################################
+# Discovery of a project
+######################################################################
+
+class StaticDiscoverer:
+    """Discovers the tests in the current directory by parsing test files.
+
+    The result of analyzing each file is cached in Cricket's state
+    directory, keyed by the modification time of the file.
+    """
+    def __init__(self, style):
+        self.style = style
+        self.cache_filename = os.path.join(STATE_DIR, 'static-{}.json'.format(style))
+
+        # filename -> [mtime, discovery records, dynamic?]
+        self.cache = {}
+        self.cache_changed = False
+
+    def load_cache(self):
+        try:
+            with open(self.cache_filename, encoding='utf-8') as f:
+                content = json.load(f)
+            if content['version'] == CACHE_VERSION:
+                self.cache = content['files']
+        except (OSError, ValueError, KeyError):
+            self.cache = {}
+
+    def save_cache(self, filenames):
+        "Save the cache, discarding any file that no longer exists."
+        cache = {filename: self.cache[filename] for filename in filenames}
+        if self.cache_changed or len(cache) != len(self.cache):
+            os.makedirs(STATE_DIR, exist_ok=True)
+            with open(self.cache_filename, 'w', encoding='utf-8') as f:
+                json.dump({'version': CACHE_VERSION, 'files': cache}, f, separators=(',', ':'))
+
+    def analyze(self, filename, analyzer, *args):
+        """Analyze a file, using the cached result if the file hasn't changed.
+
+        `analyzer` is called with the source of the file, and `args`.
+        Returns a list of discovery records, and a flag indicating that
+        the file must be imported to discover its tests.
+        """
+        mtime = os.path.getmtime(filename)
+        try:
+            cached_mtime, records, dynamic = self.cache[filename]
+            if cached_mtime == mtime:
+                return records, dynamic
+        except KeyError:
+            pass
+
+        try:
+            with open(filename, 'rb') as f:
+                records, dynamic = analyzer(f.read(), *args)
+        except (SyntaxError, ValueError):
+            # Importing the file will report the problem.
+            records, dynamic = [], True
+
+        self.cache[filename] = [mtime, records, dynamic]
+        self.cache_changed = True
+        return records, dynamic
+
+    def unittest_files(self, pattern='test*.py'):
+        """Find the files that unittest would search for tests.
+
+        Yields (filename, module name) for every test module and
+        every package's __init__.py.
+        """
+        dirs = ['.']
+        while dirs:
+            path = dirs.pop()
+            for name in sorted(os.listdir(path)):
+                filename = os.path.normpath(os.path.join(path, name))
+                if os.path.isdir(filename):
+                    init = os.path.join(filename, '__init__.py')
+                    if os.path.isfile(init):
+                        yield init, filename.replace(os.sep, '.')
+                        dirs.append(filename)
+                elif VALID_MODULE_NAME.match(name) and fnmatch.fnmatch(name, pattern):
+                    yield filename, filename[:-3].replace(os.sep, '.')
+
+    def discover_unittest(self):
+        """Discover unittest tests.
+
+        Returns the records of the statically discovered tests, and a
+        list of modules and packages that must be imported to discover the
+        rest of the tests.
+        """
+        records = []
+        units = []
+        dynamic_packages = []
+        filenames = []
+        for filename, module_name in self.unittest_files():
+            filenames.append(filename)
+            package_dir = os.path.dirname(filename)
+            if any(
+                        package_dir == dynamic or package_dir.startswith(dynamic + os.sep)
+                        for dynamic in dynamic_packages
+                    ):
+                # This file is in a package that loads its own tests.
+                continue
+
+            file_records, dynamic = self.analyze(filename, analyze_unittest, filename, module_name)
+            if os.path.basename(filename) == '__init__.py':
+                if not dynamic:
+                    records.extend(file_records)
+                    continue
+                # The package loads its own tests, so the entire package
+                # must be discovered by importing.
+                dynamic_packages.append(package_dir)
+                units.append(package_dir)
+            elif dynamic or not file_records:
+                # A test module without any tests may not be importable;
+                # import it, so any error is reported.
+                units.append(module_name)
+            else:
+                records.extend(file_records)
+
+        self.save_cache(filenames)
+        return records, units
+
+    def pytest_files(self):
+        "Find the files that pytest would search for tests, and any conftest.py."
+        dirs = ['.']
+        while dirs:
+            path = dirs.pop()
+            for name in sorted(os.listdir(path)):
+                filename = os.path.normpath(os.path.join(path, name))
+                if os.path.isdir(filename):
+                    if not (
+                        any(fnmatch.fnmatch(name, pattern) for pattern in PYTEST_NORECURSEDIRS)
+                        or name == '__pycache__'
+                        or os.path.exists(os.path.join(filename, 'pyvenv.cfg'))
+                    ):
+                        dirs.append(filename)
+                elif name == 'conftest.py' or fnmatch.fnmatch(name, 'test_*.py') or fnmatch.fnmatch(name, '*_test.py'):
+                    yield filename
+
+    def pytest_configured(self):
+        "Has the project configured how pytest collects tests?"
+        for config_filename in ('pytest.ini', 'pyproject.toml', 'tox.ini', 'setup.cfg'):
+            try:
+                with open(config_filename, encoding='utf-8') as f:
+                    config = f.read()
+            except OSError:
+                continue
+            if any(setting in config for setting in PYTEST_COLLECTION_SETTINGS):
+                return True
+        return False
+
+    def discover_pytest(self):
+        """Discover pytest tests.
+
+        Returns the records of the statically discovered tests, and a
+        list of files that must be collected by pytest to discover the
+        rest of the tests. If every file must be collected by pytest,
+        the list of records is None.
+        """
+        if self.pytest_configured():
+            return None, []
+
+        records = []
+        units = []
+        filenames = []
+        for filename in self.pytest_files():
+            filenames.append(filename)
+            file_records, dynamic = self.analyze(filename, analyze_pytest, filename)
+            if os.path.basename(filename) == 'conftest.py':
+                if dynamic:
+                    # A conftest.py can change the collection of any test.
+                    self.save_cache(filenames)
+                    return None, []
+            elif dynamic or not file_records:
+                # A test module without any tests may not be importable;
+                # collect it, so any error is reported.
+                units.append(filename)
+            else:
+                records.extend(file_records)
+
+        self.save_cache(filenames)
+        return records, units
+
+
+def discover_tests(style):
+    """Print a discovery record for each test in the current directory.
+
+    Tests are discovered statically where possible; everything else
+    is discovered by importing.
+    """
+    discoverer = StaticDiscoverer(style)
+    discoverer.load_cache()
+
+    if style == 'unittest':
+        from cricket.unittest.discoverer import discover_in_parallel, discover_unit
+
+        records, units = discoverer.discover_unittest()
+        for record in records:
+            print(json.dumps(record, separators=(',', ':')))
+        for record in discover_in_parallel(discover_unit, units):
+            print(record)
+
+    elif style == 'pytest':
+        records, units = discoverer.discover_pytest()
+        if records is None:
+            # Collection has been customized; let pytest collect everything.
+            sys.exit(subprocess.call(['pytest', '--cricket', 'discover']))
+
+        for record in records:
+            print(json.dumps(record, separators=(',', ':')))
+        sys.stdout.flush()
+        if units:
+            subprocess.call(['pytest', '--cricket', 'discover'] + units)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('style', choices=STYLES, help='The test framework used by the project.')
+    options = parser.parse_args()
+
+    discover_tests(options.style)
@@ -1,28 +1,113 @@
-import json
+import fnmatch
+import os
 import unittest
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from cricket.pipes import discovery_record
 
 
 def consume(iterable):
-    input = list(iterable)
-    while input:
-        item = input.pop(0)
-        try:
-            data = iter(item)
-            input = list(data) + input
-        except:
-            yield item
+    '''
+    Flatten a (possibly nested) iterable of tests, yielding each test in order.
 
+    Nested iterables (such as test suites) are expanded as they are
+    encountered. A stack of iterators is used, rather than recursion or
+    copying, so each item is visited exactly once, and there is no limit
+    on the depth of nesting.
+    '''
+    stack = [iter(iterable)]
+    while stack:
+        for item in stack[-1]:
+            try:
+                stack.append(iter(item))
+            except TypeError:
+                # Not iterable, so it's a test.
+                yield item
+            else:
+                # Descend into the nested iterable.
+                break
+        else:
+            # This iterable has been exhausted.
+            stack.pop()
 
-def discover_tests():
+
+def discovery_units(start_dir='.', pattern='test*.py'):
     '''
-    Collect a list of potentially runnable tests
+    Split a project into units that can be discovered independently.
+
+    Each top-level package is a unit, named by its directory; each
+    top-level test module is a unit, named by its module name.
+    '''
+    units = []
+    for name in sorted(os.listdir(start_dir)):
+        path = os.path.join(start_dir, name)
+        if os.path.isfile(os.path.join(path, '__init__.py')):
+            units.append(name)
+        elif (
+                    os.path.isfile(path)
+                    and name.endswith('.py')
+                    and fnmatch.fnmatch(name, pattern)
+                ):
+            units.append(name[:-3])
+    return units
+
+
+def discover_in_parallel(discover, units, initializer=None, initargs=()):
+    '''
+    Discover the tests in each unit, fanning out over a process pool.
+
+    `discover` is a function that accepts a unit, and returns a list of
+    discovered tests; it (and `initializer`, if provided) must be importable by
+    the worker processes. The tests from each unit are yielded as soon as
+    that unit has been discovered.
+
+    If there is only one unit, or the pool can't be used, the units
+    are discovered in this process.
     '''
+    if len(units) > 1:
+        try:
+            with ProcessPoolExecutor(
+                        max_workers=min(len(units), os.cpu_count() or 1),
+                        initializer=initializer,
+                        initargs=initargs,
+                    ) as pool:
+                futures = [pool.submit(discover, unit) for unit in units]
+                for future in as_completed(futures):
+                    yield from future.result()
+            return
+        except (BrokenProcessPool, OSError):
+            # Fall back to discovering serially. Some tests may be
+            # reported twice; adding a test to the suite is idempotent.
+            pass
+
+    if initializer is not None:
+        initializer(*initargs)
+    for unit in units:
+        yield from discover(unit)
+
 
+def discover_unit(unit):
+    '''
+    Collect a list of the potentially runnable tests in a single unit.
+
+    Each test is described by a discovery record.
+    '''
     loader = unittest.TestLoader()
-    suite = loader.discover('.')
+    if os.path.isdir(unit):
+        suite = loader.discover(unit, top_level_dir='.')
+    else:
+        suite = loader.loadTestsFromName(unit)
 
-    for test in list(consume(suite)):
-        print(test.id())
+    return [discovery_record(test) for test in consume(suite)]
+
+
+def discover_tests():
+    '''
+    Collect a list of potentially runnable tests
+    '''
+    for record in discover_in_parallel(discover_unit, discovery_units()):
+        print(record)
 
 
 if __name__ == '__main__':
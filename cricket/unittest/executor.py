@@ -9,28 +9,21 @@ call into it. See __main__ for usage
 import argparse
 import os
 import unittest
-
-try:
-    from coverage import coverage
-except ImportError:
-    coverage = None
+from collections import OrderedDict
 
 from cricket import pipes
+from cricket.coverage_data import COVERAGE_MODES, create_collector
+from cricket.unittest.discoverer import consume
 
 
 def unroll_test_suite(suite):
     """Convert a (possibly heirarchical) test suite into a flat set of tests.
 
     This is used to ensure that the suite only executes any
-    individual test once.
+    individual test once. The set is ordered, preserving the
+    order in which tests appear in the suite.
     """
-    flat = set()
-    for test in suite:
-        if isinstance(test, unittest.TestSuite):
-            flat.update(unroll_test_suite(test))
-        else:
-            flat.add(test)
-    return flat
+    return OrderedDict.fromkeys(consume(suite))
 
 
 class UnittestExecutor:
@@ -39,16 +32,25 @@ class UnittestExecutor:
     of well-formed test result outputs. Its processing is
     initiated by the top-level Executor class
     '''
-    def __init__(self):
+    def __init__(self, maxfail=None, profile=False, resources=False):
 
         # Allows the executor to run a specified list of tests
         self.specified_list = None
 
+        # The number of failures after which the run should stop.
+        self.maxfail = maxfail
+
+        # Should each test be profiled?
+        self.profile = profile
+
+        # Should the resources used by each test be recorded?
+        self.resources = resources
+
     def run_only(self, specified_list):
         self.specified_list = specified_list
 
     def stream_suite(self, suite):
-        pipes.PipedTestRunner().run(suite)
+        pipes.PipedTestRunner(maxfail=self.maxfail, profile=self.profile, resources=self.resources).run(suite)
 
     def stream_results(self):
         """Build a suite matching the requested test list, and stream it."""
@@ -58,7 +60,8 @@ class UnittestExecutor:
         if not self.specified_list:
             suite = loader.discover('.')
         else:
-            all_tests = set()
+            # Tests are run in the order they were requested.
+            all_tests = OrderedDict()
 
             for module in self.specified_list:
                 file_path = module.replace('.', os.sep)
@@ -78,10 +81,21 @@ class UnittestCoverageExecutor(UnittestExecutor):
     '''
     A version of UnittestExecutor that gathers coverage data.
     '''
+    def __init__(self, maxfail=None, profile=False, resources=False, coverage_mode='trace'):
+        super(UnittestCoverageExecutor, self).__init__(maxfail=maxfail, profile=profile, resources=resources)
+        self.coverage_mode = coverage_mode
+
     def stream_suite(self, suite):
-        cov = coverage()
+        # Write to a per-process data file; the data will be
+        # merged by Cricket once the test run is complete.
+        cov = create_collector(self.coverage_mode)
         cov.start()
-        super(UnittestCoverageExecutor, self).stream_suite(suite)
+        pipes.PipedTestRunner(
+            maxfail=self.maxfail,
+            coverage=cov,
+            profile=self.profile,
+            resources=self.resources,
+        ).run(suite)
         cov.stop()
         cov.save()
 
@@ -90,6 +104,26 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--coverage", help="Generate coverage data for the test run", action="store_true")
+    parser.add_argument(
+        "--coverage-mode", choices=COVERAGE_MODES, default='trace',
+        help="How coverage data should be collected."
+    )
+    parser.add_argument(
+        "--maxfail", metavar="N", type=int,
+        help="Stop the test run after N failures or errors."
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Profile each test, and report the profile with the test result."
+    )
+    parser.add_argument(
+        "--resources", action="store_true",
+        help="Record the resources used by each test, and report them with the test result."
+    )
+    parser.add_argument(
+        "--labels-from", metavar="FILE",
+        help="Read test labels to run from FILE, one per line ('-' for stdin)."
+    )
     parser.add_argument(
         'labels', nargs=argparse.REMAINDER,
         help='Test labels to run.'
@@ -98,10 +132,23 @@ if __name__ == '__main__':
     options = parser.parse_args()
 
     if options.coverage:
-        executor = UnittestCoverageExecutor()
+        executor = UnittestCoverageExecutor(
+            maxfail=options.maxfail,
+            profile=options.profile,
+            resources=options.resources,
+            coverage_mode=options.coverage_mode,
+        )
     else:
-        executor = UnittestExecutor()
-
-    if options.labels:
-        executor.run_only(options.labels)
+        executor = UnittestExecutor(
+            maxfail=options.maxfail,
+            profile=options.profile,
+            resources=options.resources,
+        )
+
+    labels = options.labels
+    if options.labels_from:
+        labels = labels + pipes.read_labels(options.labels_from)
+
+    if labels:
+        executor.run_only(labels)
     executor.stream_results()
@@ -1,24 +1,39 @@
+import os
 import sys
 
 from cricket.model import TestSuite, TestModule, TestCase, TestMethod
 
 
 class UnittestTestSuite(TestSuite):
+    coverage_contexts = True
+
     def __init__(self, options=None):
         super(UnittestTestSuite, self).__init__()
 
     def discover_commandline(self):
         "Command line: Discover all available tests in a project."
+        if self.static_discovery:
+            return [sys.executable, '-m', 'cricket.static_discovery', 'unittest']
         return [sys.executable, '-m', 'cricket.unittest.discoverer']
 
-    def execute_commandline(self, labels):
-        "Return the command line to execute the specified test labels"
+    def execute_commandline(self, labels_file, profile=False):
+        """Return the command line to execute the test labels listed in labels_file.
+
+        If profile is True, each test will be profiled.
+        """
         args = [sys.executable, '-m', 'cricket.unittest.executor']
         if self.coverage:
             args.append('--coverage')
-        if labels is None:
-            return args
-        return args + labels
+            args.append('--coverage-mode={}'.format(self.coverage_mode))
+        if self.maxfail:
+            args.append('--maxfail={}'.format(self.maxfail))
+        if profile:
+            args.append('--profile')
+        if self.record_resources:
+            args.append('--resources')
+        if labels_file is not None:
+            args.append('--labels-from={}'.format(labels_file))
+        return args
 
     def split_test_id(self, test_id):
         pathparts = test_id.split('.')
@@ -31,6 +46,17 @@ class UnittestTestSuite(TestSuite):
             (TestMethod, pathparts[-1]),
         ]
 
+    def source_file(self, test_id):
+        "Return the name of the file that defines the test test_id"
+        module_path = os.path.join(*[
+            part
+            for klass, part in self.split_test_id(test_id)
+            if klass == TestModule
+        ])
+        if os.path.isdir(module_path):
+            return os.path.join(module_path, '__init__.py')
+        return module_path + '.py'
+
     def join_path(self, parent, klass, part):
         if parent.path is None:
             return part
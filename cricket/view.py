@@ -3,9 +3,9 @@
 This is the "View" of the MVC world.
 """
 
+import asyncio
 import os
 import sys
-import subprocess
 import webbrowser
 
 import toga
@@ -13,23 +13,26 @@ from toga.style import Pack
 from toga.style.pack import RIGHT, CENTER, ROW, COLUMN
 from toga.fonts import BOLD, SANS_SERIF
 
-# Check for the existence of coverage and duvet
+# Check for the existence of coverage
 try:
     import coverage
-    try:
-        import duvet
-    except ImportError:
-        duvet = None
 except ImportError:
     coverage = None
-    duvet = None
 
-from cricket.model import TestMethod, TestSuiteProblems
+from cricket.model import ModelLoadError, TestMethod, TestSuiteProblems, TestTree, TestTreeMore
+from cricket.coverage_data import CoverageIndex, CoverageMerger
 from cricket.executor import Executor
+from cricket.impact import ImpactIndex
+from cricket.instrumentation import RESOURCES, format_resource, worst_offenders
+from cricket.profiling import aggregate, function_label, hotspots
+from cricket.watch import Watcher
 from cricket.dialogs import FailedTestDialog, TestLoadErrorDialog, IgnorableTestLoadErrorDialog
 
 
 class Cricket(toga.App):
+    # Should tests be re-run automatically when source files change?
+    watch = False
+
     def startup(self):
         '''
         -----------------------------------------------------
@@ -47,6 +50,40 @@ class Cricket(toga.App):
 
         '''
         self.executor = None
+        # Should the results of the current run be shown without a dialog?
+        self.quiet_run = False
+
+        # Runs requested while a run is in progress are queued, and
+        # run in order once the current run has finished. Each entry
+        # is a dictionary of arguments for run().
+        self.run_queue = []
+        self.queue_running = False
+
+        # The index of files executed by each test, used to
+        # select the tests affected by a change.
+        self.impact_index = ImpactIndex.load()
+
+        # Coverage data from each test run is merged in the background.
+        # The lines executed in each file are indexed as the data is merged.
+        self.coverage_index = CoverageIndex()
+        self.coverage_window = None
+        self.resources_window = None
+        self.coverage_merger = CoverageMerger(
+            impact_index=self.impact_index,
+            coverage_index=self.coverage_index,
+            on_merge=self.on_coverage_merged,
+        )
+        if coverage:
+            self.coverage_merger.load()
+
+        # In watch mode, tests are re-run whenever source files change.
+        # Each change is numbered, so that the handling of a change can
+        # be abandoned as soon as a newer change is seen.
+        self.watcher = None
+        self.change_count = 0
+        if self.watch:
+            self.watcher = Watcher(self.on_files_changed)
+            self.watcher.start()
 
         # Main window of the application with title and size
         self.main_window = toga.MainWindow(title=self.name, size=(1024, 768))
@@ -69,7 +106,9 @@ class Cricket(toga.App):
         # Show the main window
         self.main_window.show()
 
-        self._check_errors_status()
+        # Discover the tests once the window is on screen; the tree
+        # is populated as tests are found.
+        self.discovery = asyncio.ensure_future(self.discover_tests())
 
     def open_document(self, doc):
         pass
@@ -108,7 +147,14 @@ class Cricket(toga.App):
             'Show coverage...',
             group=self.instruments_group
         )
-        self.show_coverage_command.enabled = False if duvet is None else True
+        self.show_coverage_command.enabled = coverage is not None
+
+        self.show_resources_command = toga.Command(
+            self.cmd_show_resources,
+            'Show resource usage...',
+            group=self.instruments_group
+        )
+        self.show_resources_command.enabled = self.test_suite.record_resources
 
         # Button to stop run the tests
         self.stop_command = toga.Command(
@@ -149,10 +195,30 @@ class Cricket(toga.App):
         )
         self.rerun_command.enabled = False
 
+        # Run the tests affected by changes to the code
+        self.run_affected_command = toga.Command(
+            self.cmd_run_affected, 'Run affected',
+            tooltip='Run the tests affected by changes since coverage was last gathered.',
+            group=self.control_tests_group
+        )
+        self.run_affected_command.enabled = self.can_run_affected()
+
+        # Run the selected tests, profiling each test
+        self.profile_selected_command = toga.Command(
+            self.cmd_profile_selected, 'Profile selected',
+            tooltip='Run the tests selected, and profile each test.',
+            group=self.control_tests_group
+        )
+        self.profile_selected_command.enabled = False
+
         # Cricket's menu items
         self.commands.add(
+            # Test items
+            self.run_affected_command,
+            self.profile_selected_command,
             # Instrument items
             self.show_coverage_command,
+            self.show_resources_command,
         )
 
         self.main_window.toolbar.add(
@@ -179,7 +245,7 @@ class Cricket(toga.App):
         # is the details panel.
         self.split_main_container = toga.SplitContainer(
             content=[
-                (self.tree_notebook, 33),
+                (self.left_box, 33),
                 (self.right_box, 66),
             ],
             style=Pack(flex=1)
@@ -200,7 +266,7 @@ class Cricket(toga.App):
         '''
         self.all_tests_tree = toga.Tree(
             ['Test'], accessors=['label'],
-            data=self.test_suite,
+            data=TestTree(self.test_suite),
             multiple_select=True
         )
 
@@ -208,7 +274,7 @@ class Cricket(toga.App):
 
         self.problem_tests_tree = toga.Tree(
             ['Test'], accessors=['label'],
-            data=TestSuiteProblems(self.test_suite),
+            data=TestTree(TestSuiteProblems(self.test_suite)),
             multiple_select=True
         )
         self.problem_tests_tree.on_select = self.on_test_selected
@@ -221,6 +287,20 @@ class Cricket(toga.App):
             on_select=self.on_tab_selected
         )
 
+        # The paths of the tests matching the search box; None if
+        # there is no search.
+        self.search_matches = None
+        self.search_input = toga.TextInput(
+            placeholder='Search tests',
+            on_change=self.on_search_changed,
+            style=Pack(padding=5)
+        )
+
+        self.left_box = toga.Box(
+            children=[self.search_input, self.tree_notebook],
+            style=Pack(direction=COLUMN)
+        )
+
     def _setup_right_frame(self):
         '''
         The right frame is basically the "output viewer" space
@@ -275,9 +355,21 @@ class Cricket(toga.App):
         self.duration_box.add(self.duration_label)
         self.duration_box.add(self.duration_view)
 
-        # Group the name and duration into a single "identifier" box
+        # Box to put the location of the test
+        self.location_box = toga.Box(style=Pack(direction=ROW, padding=(5, 10)))
+        # Label to indicate the test location
+        self.location_label = toga.Label(
+            'Location:', style=Pack(text_align=RIGHT, width=80, padding_right=10)
+        )
+        # Text input to show the file and line of the test, and its markers
+        self.location_view = toga.TextInput(readonly=True, style=Pack(flex=1))
+        self.location_box.add(self.location_label)
+        self.location_box.add(self.location_view)
+
+        # Group the name, location and duration into a single "identifier" box
         self.identifier_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
         self.identifier_box.add(self.name_box)
+        self.identifier_box.add(self.location_box)
         self.identifier_box.add(self.duration_box)
 
         # Put the identifiers on the same row as the status label
@@ -321,12 +413,28 @@ class Cricket(toga.App):
         self.error_box.add(self.error_label)
         self.error_box.add(self.error_view)
 
+        # Box to put the profile of the test
+        self.profile_box = toga.Box(style=Pack(direction=ROW, padding=(5, 10), flex=3))
+        # Label to indicate the test profile
+        self.profile_label = toga.Label(
+            'Profile:', style=Pack(text_align=RIGHT, width=80, padding_right=10)
+        )
+        # Table to show the functions where the most time was spent
+        self.profile_view = toga.Table(
+            ['Calls', 'Own time', 'Total time', 'Function'],
+            style=Pack(flex=1)
+        )
+        # Insert the test profile box objects
+        self.profile_box.add(self.profile_label)
+        self.profile_box.add(self.profile_view)
+
         # Insert the right box contents
         # self.right_box.add(self.coverage_checkbox)
         self.right_box.add(self.summary_box)
         self.right_box.add(self.description_box)
         self.right_box.add(self.output_box)
         self.right_box.add(self.error_box)
+        self.right_box.add(self.profile_box)
 
     def _setup_status_bar(self):
         '''The bottom frame to inform the user about the status of the tests
@@ -354,11 +462,6 @@ class Cricket(toga.App):
 
     def _setup_init_values(self):
         "Update the layout with the initial values."
-        # Get a count of active tests to display in the status bar.
-
-        count, labels = self.test_suite.find_tests(active=True)
-        self.run_summary.text = 'T:{count} P:0 F:0 E:0 X:0 U:0 S:0'.format(count=count)
-
         # Update the test suite to make sure coverage status matches the GUI
         self.on_coverageChange(None)
 
@@ -386,7 +489,7 @@ class Cricket(toga.App):
 
     async def cmd_stop(self, widget):
         "Command: The stop button has been pressed"
-        await self.stop()
+        await self.cancel_runs()
 
     async def cmd_run_all(self, widget):
         "Command: The Run all button has been pressed"
@@ -395,36 +498,85 @@ class Cricket(toga.App):
         # self.problem_tests_data.data = {}
         # self.all_tests_tree.update()
         # self.problem_tests_tree.update()
-        # If the executor isn't currently running, we can
-        # start a test run.
-        if not self.executor:
-            await self.run(active=True)
+        await self.request_run(active=True)
 
     async def cmd_run_selected(self, widget):
         "Command: The 'run selected' button has been pressed"
-        tests_to_run = set()
-        if self.current_tree.selection:
-            for node in self.current_tree.selection:
-                tests_to_run.add(node.path)
+        tests_to_run = self.selected_labels()
+        if tests_to_run is not None:
+            await self.request_run(labels=tests_to_run)
 
-        # If the executor isn't currently running, we can
-        # start a test run.
-        if not self.executor:
-            await self.run(labels=tests_to_run)
+    async def cmd_profile_selected(self, widget):
+        "Command: The 'profile selected' button has been pressed"
+        tests_to_run = self.selected_labels()
+        if tests_to_run is not None:
+            await self.request_run(labels=tests_to_run, profile=True)
 
-    def cmd_rerun(self, widget):
+    def selected_labels(self):
+        """The labels of the tests to run for the current selection.
+
+        Returns None if there is nothing to run.
+        """
+        nodes = self.selected_nodes(self.current_tree)
+        if self.search_matches is None:
+            tests_to_run = {node.path for node in nodes}
+        else:
+            # Only the tests that match the search are shown, so only
+            # those tests are run. If nothing is selected, every test
+            # matching the search is run.
+            if nodes:
+                tests_to_run = {
+                    test.path
+                    for node in nodes
+                    for test in node.iter_tests()
+                    if test.path in self.search_matches
+                }
+            else:
+                tests_to_run = set(self.search_matches)
+
+            if not tests_to_run:
+                return None
+
+        return tests_to_run
+
+    async def cmd_rerun(self, widget):
         "Command: The run/stop button has been pressed"
-        # If the executor isn't currently running, we can
-        # start a test run.
-        if not self.executor:
-            self.run(status=set(TestMethod.FAILING_STATES))
+        await self.request_run(status=set(TestMethod.FAILING_STATES))
 
-    def cmd_show_coverage(self, widget):
-        "Command: Open coverage tool"
-        try:
-            subprocess.Popen('duvet')
-        except Exception as e:
-            self.main_window.error_dialog('Error on open duvet', 'Unable to start Duvet: %s' % e)
+    async def cmd_run_affected(self, widget):
+        "Command: The 'run affected' button has been pressed"
+        # Make sure the index includes the results of any recent runs.
+        await self.wait_for_coverage()
+
+        tests_to_run = self.impact_index.affected_tests(
+            test.path for test in self.test_suite.iter_tests()
+        )
+        if not tests_to_run:
+            self.run_status.text = 'No affected tests.'
+            return
+
+        await self.request_run(labels=set(tests_to_run))
+
+    async def cmd_show_coverage(self, widget):
+        "Command: Show the coverage viewer"
+        # Make sure the coverage data includes any recent runs.
+        await self.wait_for_coverage()
+
+        if self.coverage_window is None:
+            self.coverage_window = CoverageWindow(self.coverage_index, on_close=self.on_coverage_window_close)
+            self.windows += self.coverage_window
+
+        self.coverage_window.refresh()
+        self.coverage_window.show()
+
+    async def cmd_show_resources(self, widget):
+        "Command: Show the resources used by each test"
+        if self.resources_window is None:
+            self.resources_window = ResourcesWindow(self.test_suite, on_close=self.on_resources_window_close)
+            self.windows += self.resources_window
+
+        self.resources_window.refresh()
+        self.resources_window.show()
 
     # def cmd_cricket_page(self, sender):
     #     "Show the Cricket test_suite page"
@@ -458,13 +610,28 @@ class Cricket(toga.App):
         self.current_tree = option
         self.on_test_selected(option, None)
 
+    def selected_nodes(self, tree):
+        "The test nodes selected in a tree, ignoring any placeholder rows."
+        return [
+            row.node
+            for row in tree.selection or []
+            if not isinstance(row, TestTreeMore)
+        ]
+
     def on_test_selected(self, widget, node):
         "Event handler: a test case has been selected in the tree"
-        nodes = widget.selection
+        # Selecting the placeholder for tests that haven't been shown
+        # shows the next page of tests.
+        for row in widget.selection or []:
+            if isinstance(row, TestTreeMore):
+                widget.data.show_more(row)
+
+        nodes = self.selected_nodes(widget)
         # Multiple tests selected
         if nodes and len(nodes) > 1:
             self.status_label.text = ''
             self.name_view.clear()
+            self.location_view.clear()
             self.duration_view.clear()
             self.description_view.clear()
 
@@ -478,6 +645,16 @@ class Cricket(toga.App):
             try:
                 self.description_view.value = testMethod.description
 
+                # The location is known if the discoverer reported it.
+                location = ''
+                if testMethod.file:
+                    location = testMethod.file
+                    if testMethod.line:
+                        location += ':{}'.format(testMethod.line)
+                if testMethod.markers:
+                    location += ' [{}]'.format(', '.join(sorted(testMethod.markers)))
+                self.location_view.value = location.strip()
+
                 # Display constants for test status
                 self.status_label.text = {
                     TestMethod.STATUS_UNKNOWN: '?',
@@ -511,7 +688,10 @@ class Cricket(toga.App):
                     #     self.error_box.style.visibility = HIDDEN
                 else:
                     # Test hasn't been executed yet.
-                    self.duration_view.value = 'Not executed'
+                    if testMethod.skip is not None:
+                        self.duration_view.value = 'Not executed (will be skipped: {})'.format(testMethod.skip)
+                    else:
+                        self.duration_view.value = 'Not executed'
 
                     self.output_view.clear()
                     self.error_view.clear()
@@ -521,6 +701,7 @@ class Cricket(toga.App):
                 # There's no description attribute; that means it's not a test method,
                 # it's a module or test case.
                 self.status_label.text = ''
+                self.location_view.clear()
                 self.description_view.clear()
                 self.duration_view.clear()
 
@@ -532,6 +713,7 @@ class Cricket(toga.App):
             # No selection at all.
             self.status_label.text = ''
             self.name_view.clear()
+            self.location_view.clear()
             self.description_view.clear()
             self.duration_view.clear()
             self.output_view.clear()
@@ -539,13 +721,111 @@ class Cricket(toga.App):
 
             # self.error_box.style.visibility = HIDDEN
 
+        self.show_profile(nodes)
+
         # update "run selected" button enabled state
         self.set_selected_button_state()
 
+    def show_profile(self, nodes):
+        """Display the functions where the most time was spent by the selected tests.
+
+        If more than one test has been profiled, their profiles are combined.
+        """
+        profiles = [
+            test.profile
+            for node in nodes
+            for test in node.iter_tests()
+            if test.profile
+        ]
+        if len(profiles) > 1:
+            profile = aggregate(profiles)
+        elif profiles:
+            profile = profiles[0]
+        else:
+            profile = []
+
+        self.profile_view.data = [
+            (row[3], '%0.4fs' % row[4], '%0.4fs' % row[5], function_label(row))
+            for row in hotspots(profile)
+        ]
+
+    def on_search_changed(self, widget):
+        "Event handler: the search text has been modified"
+        self.search_matches = self.test_suite.index.search(widget.value)
+        self.all_tests_tree.data.set_filter(self.search_matches)
+        self.problem_tests_tree.data.set_filter(self.search_matches)
+
     def on_coverageChange(self, widget):
         "Event handler: when the coverage checkbox has been toggled"
         self.coverage = not self.coverage
-        self.test_suite.coverage = self.coverage == True
+        # Coverage can only be gathered if coverage is installed.
+        self.test_suite.coverage = self.coverage and coverage is not None
+
+    async def wait_for_coverage(self):
+        """Wait until the coverage data of every run has been merged.
+
+        Data that couldn't be merged is reported, but doesn't stop
+        the data that could be merged from being used.
+        """
+        failures = await self.coverage_merger.wait()
+        if failures:
+            self.run_status.text = 'Unable to merge coverage data: {}'.format('; '.join(failures))
+
+    def on_coverage_merged(self):
+        "Coverage data from a test run has been merged."
+        if self.coverage_window is not None:
+            self.coverage_window.refresh()
+
+    def on_coverage_window_close(self, window):
+        "Event handler: the coverage viewer has been closed"
+        self.coverage_window = None
+        return True
+
+    def on_resources_window_close(self, window):
+        "Event handler: the resource usage window has been closed"
+        self.resources_window = None
+        return True
+
+    async def on_files_changed(self, filenames):
+        "The watcher has seen changes to source files."
+        self.change_count += 1
+        change = self.change_count
+
+        # A newer change supersedes any run that is in progress.
+        await self.cancel_runs()
+
+        self.run_status.text = 'Changes detected; discovering tests...'
+        try:
+            await self.test_suite.refresh_async()
+        except ModelLoadError:
+            self.run_status.text = 'Unable to discover tests.'
+            return
+        if self.search_matches is not None:
+            self.on_search_changed(self.search_input)
+        if change != self.change_count:
+            return
+
+        # Run the tests in the changed files, plus any test
+        # that is known to execute one of the changed files.
+        await self.wait_for_coverage()
+        if change != self.change_count:
+            return
+
+        tests_to_run = set(self.test_suite.tests_in_files(filenames))
+        if self.impact_index:
+            tests_to_run.update(
+                path
+                for path, test_files in self.impact_index.tests.items()
+                if not test_files.isdisjoint(filenames)
+            )
+        # The index may refer to tests that no longer exist.
+        tests_to_run.intersection_update(test.path for test in self.test_suite.iter_tests())
+
+        if not tests_to_run:
+            self.run_status.text = 'No tests affected by changes.'
+            return
+
+        await self.request_run(labels=tests_to_run, replace=True, quiet=True)
 
     def on_executorStatusUpdate(self, event, update):
         "The executor has some progress to report"
@@ -557,11 +837,16 @@ class Cricket(toga.App):
         # Update status line, and set the tree item to active.
         self.run_status.text = 'Running %s...' % test_path
 
-    def executor_test_end(self, test_path, result, remaining_time):
+    def executor_test_end(self, test_path, result, remaining_time, confidence=1.0):
         "The executor has finished running a test."
         # Update the progress meter
         self.progress.value += 1
 
+        # If most of the remaining tests have never been run,
+        # the estimate of the time remaining is only a guess.
+        if confidence < 0.5:
+            remaining_time += ' (rough)'
+
         # Update the run summary
         self.run_summary.text = 'T{total} P:{passes} F:{failed} E:{errors} X:{expected} U:{unexpected} S:{skipped}, ~{remaining} remaining'.format(
             total=self.executor.total_count,
@@ -577,11 +862,19 @@ class Cricket(toga.App):
     def executor_suite_end(self, error=None):
         "The test suite finished running."
         # Display the final results
-        self.run_status.text = 'Finished.'
+        if self.executor.stopped:
+            self.run_status.text = 'Stopped.'
+        elif self.executor.maxfail_reached:
+            self.run_status.text = 'Stopped after {} failures.'.format(self.executor.any_failed)
+        else:
+            self.run_status.text = 'Finished.'
 
         if error:
             self.main_window.error_dialog('Result', error)
 
+        if self.resources_window is not None:
+            self.resources_window.refresh()
+
         message = ', '.join(
             '%d %s' % (
                 count, {
@@ -596,7 +889,11 @@ class Cricket(toga.App):
             for state, count in sorted(self.executor.result_count.items())
         )
 
-        if self.executor.any_failed:
+        # A run that was stopped, or that was started by the
+        # watcher, doesn't need to interrupt the user.
+        if self.executor.stopped or self.quiet_run:
+            pass
+        elif self.executor.any_failed:
             self.main_window.error_dialog('Result', message)
         else:
             self.main_window.info_dialog('Result',
@@ -630,21 +927,110 @@ class Cricket(toga.App):
         "A test run has ended and we should enable or disable buttons as appropriate."
         self.stop_command.enabled = False
         self.run_all_command.enabled = True
+        self.run_affected_command.enabled = self.can_run_affected()
         self.set_selected_button_state()
         if self.executor and self.executor.any_failed:
             self.rerun_command.enabled = True
         else:
             self.rerun_command.enabled = False
 
+    def can_run_affected(self):
+        """Can the tests affected by a change be found?
+
+        The test suite must record the coverage of each test.
+        """
+        return coverage is not None and self.test_suite.coverage_contexts
+
     def set_selected_button_state(self):
-        state = False if self.executor else True
-        self.run_selected_command.enabled = state
+        # Runs requested during a run are queued, so
+        # the button is available even while running.
+        self.run_selected_command.enabled = True
+        self.profile_selected_command.enabled = True
 
     ######################################################
     # GUI utility methods
     ######################################################
 
-    async def run(self, active=True, status=None, labels=None):
+    async def request_run(self, active=True, status=None, labels=None, profile=False, quiet=False, replace=False):
+        """Request a run of the test suite.
+
+        The arguments are the same as for run(). If no run is in
+        progress, the run starts immediately; otherwise, the request is
+        queued behind the current run. If replace=True, the current run
+        (and anything queued) is cancelled, and the request replaces it.
+
+        Requests are merged with any queued request that selects tests
+        the same way, so a test is never queued twice. A merged run is
+        only quiet if every request for it was.
+        """
+        if replace:
+            await self.cancel_runs()
+
+        request = {'active': active, 'status': status, 'labels': labels, 'profile': profile, 'quiet': quiet}
+        for queued in self.run_queue:
+            if (
+                        queued['active'] == active
+                        and queued['status'] == status
+                        and queued['profile'] == profile
+                    ):
+                if queued['labels'] is None or labels is None:
+                    # One of the requests is for every test.
+                    queued['labels'] = None
+                else:
+                    queued['labels'] = set(queued['labels']) | set(labels)
+                queued['quiet'] = queued['quiet'] and quiet
+                break
+        else:
+            self.run_queue.append(request)
+
+        if self.queue_running:
+            # The request will be run once the runs ahead of it have finished.
+            self.run_status.text = '{} run(s) queued.'.format(len(self.run_queue))
+            return
+
+        self.queue_running = True
+        try:
+            # Tests can't be run until they have been discovered.
+            await self.discovery
+
+            while self.run_queue:
+                await self.run(**self.run_queue.pop(0))
+        finally:
+            self.queue_running = False
+
+    async def cancel_runs(self):
+        "Discard any queued runs, and stop the run in progress."
+        self.run_queue = []
+        await self.stop()
+
+    async def discover_tests(self):
+        "Discover the tests in the test suite."
+        while True:
+            self.run_status.text = 'Discovering tests...'
+            try:
+                await self.test_suite.refresh_async()
+            except ModelLoadError as e:
+                self.test_load_error = e.trace
+                self.ignorable_test_load_error = None
+            else:
+                self.test_load_error = None
+                self.ignorable_test_load_error = '\n'.join(self.test_suite.errors) or None
+
+            # If discovery failed, the user can retry (or quit).
+            self._check_errors_status()
+            if not self.test_load_error:
+                break
+
+        # Tests that have been found may match the current search.
+        if self.search_matches is not None:
+            self.on_search_changed(self.search_input)
+
+        # Get a count of active tests to display in the status bar.
+        count, labels = self.test_suite.find_tests(active=True, markers=self.test_suite.markers)
+        self.run_status.text = 'Not running'
+        self.run_summary.text = 'T:{count} P:0 F:0 E:0 X:0 U:0 S:0'.format(count=count)
+
+    async def run(self, active=True, status=None, labels=None, profile=False, quiet=False):
         """Run the test suite.
 
         If active=True, only active tests will be run.
@@ -652,25 +1038,44 @@ class Cricket(toga.App):
             status matches the set provided will be executed.
         If labels is provided, only tests with those labels will
             be executed
+        If profile=True, each test will be profiled.
+        If quiet=True, no dialog is shown when the run finishes; this
+            is used for runs started by the watcher.
         """
-        count, labels = self.test_suite.find_tests(active=active, status=status, labels=labels)
+        count, labels = self.test_suite.find_tests(
+            active=active, status=status, labels=labels, markers=self.test_suite.markers
+        )
+        if self.test_suite.coverage and coverage and labels is None:
+            # The entire suite is being run, so coverage data from
+            # previous runs is no longer needed.
+            self.coverage_merger.erase()
+
+        if self.test_suite.failed_first:
+            labels = self.test_suite.ordered_tests(labels)
 
         self.run_status.text = 'Running...'
         self.run_summary.text = 'T:{count} P:0 F:0 E:0 X:0 U:0 S:0'.format(count=count)
 
+        # Run requests made during the run will be queued; however, the
+        # tests that failed aren't known until the run has finished.
         self.stop_command.enabled = True
-        self.run_all_command.enabled = False
-        self.run_selected_command.enabled = False
         self.rerun_command.enabled = False
 
         self.progress.max = count
         self.progress.value = 0
 
         # Create the executor...
+        self.quiet_run = quiet
         self.executor = Executor(self.test_suite, self)
 
         # ...and run it
-        await self.executor.run(count, labels)
+        await self.executor.run(count, labels, profile=profile)
+
+        # If coverage was gathered, merge the data written by the
+        # test runner. This happens in the background; anything that
+        # needs the merged data must wait for the merge to complete.
+        if self.test_suite.coverage and coverage:
+            self.coverage_merger.merge(self.executor.proc.pid)
 
         # Once it's done, clean up.
         self.executor = None
@@ -681,12 +1086,9 @@ class Cricket(toga.App):
         if self.executor:
             self.run_status.text = 'Stopping...'
 
-            # await self.executor.terminate()
-
-        self.executor = None
-        self.run_status.text = 'Stopped.'
-
-        self.reset_button_states_on_end()
+            # Once the test runner has been terminated, run()
+            # will finish, and clean up after the executor.
+            await self.executor.terminate()
 
     def _check_errors_status(self):
         """Checks if the model or the test_suite have errors.
@@ -706,3 +1108,127 @@ class Cricket(toga.App):
                         self._ignorable_test_load_error)
             if dialog.status == dialog.CANCEL:
                 sys.exit(1)
+
+
+class CoverageWindow(toga.Window):
+    """A window summarizing the coverage of each measured file.
+
+    Selecting a file displays its source, with each executable line
+    marked as executed (>) or missing (!).
+    """
+    def __init__(self, coverage_index, on_close=None):
+        super().__init__(title='Coverage', size=(1024, 768), on_close=on_close)
+        self.coverage_index = coverage_index
+
+        self.summary_table = toga.Table(
+            ['File', 'Statements', 'Missing', 'Coverage'],
+            accessors=['filename', 'statements', 'missing', 'percent'],
+            on_select=self.on_file_selected,
+        )
+        self.source_view = toga.MultilineTextInput(readonly=True)
+
+        self.content = toga.SplitContainer(
+            content=[
+                (self.summary_table, 40),
+                (self.source_view, 60),
+            ],
+            style=Pack(flex=1)
+        )
+
+    def refresh(self):
+        "Update the summary from the coverage index."
+        self.summary_table.data = [
+            {
+                'path': filename,
+                'filename': os.path.relpath(filename),
+                'statements': n_statements,
+                'missing': n_missing,
+                'percent': '{:.0f}%'.format(percent),
+            }
+            for filename, n_statements, n_missing, percent in self.coverage_index.summary()
+        ]
+
+    def on_file_selected(self, widget, row):
+        "Event handler: a file has been selected in the summary"
+        if row is None:
+            self.source_view.clear()
+            return
+
+        executed, missing = self.coverage_index.lines(row.path)
+        try:
+            with open(row.path, encoding='utf-8') as source_file:
+                source = source_file.read().splitlines()
+        except (OSError, UnicodeDecodeError) as e:
+            self.source_view.value = 'Unable to read {}: {}'.format(row.filename, e)
+            return
+
+        self.source_view.value = '\n'.join(
+            '{:>5} {} {}'.format(
+                line_number,
+                '>' if line_number in executed else '!' if line_number in missing else ' ',
+                line
+            )
+            for line_number, line in enumerate(source, start=1)
+        )
+
+
+class ResourcesWindow(toga.Window):
+    """A window listing the resources used by each test.
+
+    Only tests whose resources were recorded are listed. Tests are
+    ordered by the resource chosen to sort by, worst first.
+    """
+    def __init__(self, test_suite, on_close=None):
+        super().__init__(title='Resource usage', size=(1024, 768), on_close=on_close)
+        self.test_suite = test_suite
+
+        self.usage_table = toga.Table(
+            ['Test'] + [title for resource, title in RESOURCES],
+            accessors=['test'] + [resource for resource, title in RESOURCES],
+            style=Pack(flex=1)
+        )
+        self.sort_selection = toga.Selection(
+            items=[title for resource, title in RESOURCES],
+            on_select=self.on_sort_selected,
+            style=Pack(padding=5)
+        )
+
+        self.content = toga.Box(
+            children=[
+                toga.Box(
+                    children=[
+                        toga.Label('Sort by:', style=Pack(padding=5)),
+                        self.sort_selection,
+                    ],
+                    style=Pack(direction=ROW)
+                ),
+                self.usage_table,
+            ],
+            style=Pack(direction=COLUMN)
+        )
+
+    @property
+    def sort_resource(self):
+        "The resource the tests are sorted by."
+        for resource, title in RESOURCES:
+            if title == self.sort_selection.value:
+                return resource
+        return RESOURCES[0][0]
+
+    def refresh(self):
+        "Update the table from the most recent results of each test."
+        self.usage_table.data = [
+            dict(
+                path=test.path,
+                test=test.path,
+                **{
+                    resource: format_resource(resource, test.resources.get(resource))
+                    for resource, title in RESOURCES
+                }
+            )
+            for test in worst_offenders(self.test_suite.iter_tests(), self.sort_resource)
+        ]
+
+    def on_sort_selected(self, widget):
+        "Event handler: a different resource has been chosen to sort by"
+        self.refresh()
@@ -0,0 +1,111 @@
+"""Watching the file system for changes to Python source files.
+
+The watcher polls the modification times of the Python files in a
+directory tree. Polling is used, rather than a platform notification
+API, so that watching works everywhere (including network file systems
+and containers) without any additional dependencies.
+"""
+import asyncio
+import os
+
+
+# Directories that never contain source files of interest.
+IGNORED_DIRS = {'.git', '.hg', '.svn', '.tox', '.nox', '.cricket', '__pycache__', 'node_modules'}
+
+
+def modified_files(before, after):
+    "Return the set of files that differ between two snapshots."
+    changed = {
+        filename
+        for filename, mtime in after.items()
+        if before.get(filename) != mtime
+    }
+    # Deleted files have changed, too.
+    changed.update(filename for filename in before if filename not in after)
+    return changed
+
+
+class Watcher:
+    """Watches a directory tree for modified Python files.
+
+    Once a change has been seen, the watcher waits until no further
+    changes have been seen for `debounce` seconds (so that saving
+    several files, or a checkout, produces a single notification), and
+    then invokes the coroutine `on_change` with the set of modified
+    filenames, relative to `path`.
+
+    `on_change` is scheduled as a separate task, so the watcher keeps
+    watching while it runs; it may be invoked again before an earlier
+    invocation has completed.
+    """
+    def __init__(self, on_change, path='.', interval=1.0, debounce=0.5):
+        self.on_change = on_change
+        self.path = path
+        self.interval = interval
+        self.debounce = debounce
+
+        self._task = None
+
+    def scan(self):
+        "Return a snapshot of the modification time of every Python file."
+        snapshot = {}
+        dirs = [self.path]
+        while dirs:
+            try:
+                entries = os.scandir(dirs.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            # Skip hidden directories and virtual environments.
+                            if not (
+                                entry.name in IGNORED_DIRS
+                                or entry.name.startswith('.')
+                                or os.path.exists(os.path.join(entry.path, 'pyvenv.cfg'))
+                            ):
+                                dirs.append(entry.path)
+                        elif entry.name.endswith('.py'):
+                            snapshot[os.path.relpath(entry.path, self.path)] = entry.stat().st_mtime
+                    except OSError:
+                        # The entry was deleted while scanning.
+                        pass
+        return snapshot
+
+    async def watch(self):
+        "Watch for changes until cancelled."
+        loop = asyncio.get_event_loop()
+
+        # Scanning a large tree takes a while; do it off the event loop.
+        snapshot = await loop.run_in_executor(None, self.scan)
+        while True:
+            await asyncio.sleep(self.interval)
+            current = await loop.run_in_executor(None, self.scan)
+            changed = modified_files(snapshot, current)
+            if not changed:
+                continue
+
+            # Wait for the changes to settle.
+            while True:
+                await asyncio.sleep(self.debounce)
+                latest = await loop.run_in_executor(None, self.scan)
+                more = modified_files(current, latest)
+                if not more:
+                    break
+                changed.update(more)
+                current = latest
+
+            snapshot = current
+            asyncio.ensure_future(self.on_change(changed))
+
+    def start(self):
+        "Start watching in the background."
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.watch())
+
+    def stop(self):
+        "Stop watching."
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
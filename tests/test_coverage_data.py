@@ -0,0 +1,381 @@
+import asyncio
+import glob
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+try:
+    from coverage import Coverage, CoverageData
+except ImportError:
+    Coverage = None
+    CoverageData = None
+
+from cricket.coverage_data import (
+    CoverageIndex,
+    CoverageMerger,
+    MonitoringCollector,
+    bitset,
+    bitset_count,
+    bitset_lines,
+    create_collector,
+)
+from cricket.impact import ImpactIndex
+
+
+def write_data(filename, contexts):
+    """Write a coverage data file.
+
+    `contexts` maps each context to a dictionary of {filename: line numbers}.
+    """
+    data = CoverageData(basename=filename)
+    for context, lines in contexts.items():
+        data.set_context(context)
+        data.add_lines({
+            os.path.abspath(measured_file): line_numbers
+            for measured_file, line_numbers in lines.items()
+        })
+    data.write()
+
+
+def read_lines(filename):
+    "Read the lines executed in each file recorded in a coverage data file."
+    data = CoverageData(basename=filename)
+    data.read()
+    return {
+        os.path.relpath(measured_file): set(data.lines(measured_file))
+        for measured_file in data.measured_files()
+    }
+
+
+@unittest.skipIf(CoverageData is None, "coverage isn't installed")
+class CoverageMergerTests(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmpdir.name)
+
+        # Data files for process 1234, using both the old and new
+        # naming schemes of coverage.
+        write_data('.coverage.host.pid1234.abcdef', {'tests.A.test_a': {'a.py': [1, 2]}})
+        write_data('.coverage.host.1234.ghijkl', {'tests.B.test_b': {'b.py': [3]}})
+        # Data files for other processes with similar pids.
+        write_data('.coverage.host.pid12345.mnopqr', {'tests.C.test_c': {'c.py': [4]}})
+        write_data('.coverage.host.pid91234.stuvwx', {'tests.D.test_d': {'d.py': [5]}})
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmpdir.cleanup()
+
+    def complete(self, merger, *requests):
+        "Make requests of a merger, and wait until they have been completed."
+        async def complete():
+            for request in requests:
+                request()
+            return await merger.wait()
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(complete())
+        finally:
+            loop.close()
+
+    def merge(self, merger, *pids):
+        "Merge the data written by each process, returning any failures."
+        return self.complete(merger, *[lambda pid=pid: merger.merge(pid) for pid in pids])
+
+    def test_merge(self):
+        "Only the data files written by the process are merged"
+        self.merge(CoverageMerger(), 1234)
+
+        self.assertEqual(read_lines('.coverage'), {'a.py': {1, 2}, 'b.py': {3}})
+        # Merged data files are removed.
+        self.assertEqual(
+            sorted(filename for filename in os.listdir('.') if filename.startswith('.coverage.')),
+            ['.coverage.host.pid12345.mnopqr', '.coverage.host.pid91234.stuvwx']
+        )
+
+    def test_merge_accumulates(self):
+        "Data from each process is added to the data that has already been merged"
+        write_data('.coverage', {'tests.E.test_e': {'a.py': [7]}})
+
+        self.merge(CoverageMerger(), 1234, 12345)
+
+        self.assertEqual(read_lines('.coverage'), {'a.py': {1, 2, 7}, 'b.py': {3}, 'c.py': {4}})
+
+    def test_corrupt_data(self):
+        "A data file that can't be read is reported, and the rest of the data is merged"
+        with open('.coverage.host.pid1234.corrupt', 'wb') as f:
+            f.write(b'not a coverage data file')
+
+        failures = self.merge(CoverageMerger(), 1234)
+
+        self.assertEqual(len(failures), 1)
+        self.assertTrue(failures[0].startswith('.coverage.host.pid1234.corrupt: '))
+        self.assertEqual(read_lines('.coverage'), {'a.py': {1, 2}, 'b.py': {3}})
+        self.assertTrue(os.path.exists('.coverage.host.pid1234.corrupt'))
+
+    def test_merge_error(self):
+        "An error while merging is reported, and doesn't affect later merges"
+        merger = CoverageMerger()
+        with mock.patch.object(Coverage, 'combine', side_effect=OSError('disk full')):
+            self.assertEqual(self.merge(merger, 1234), ['disk full'])
+
+        self.assertEqual(self.merge(merger, 1234), [])
+        self.assertEqual(read_lines('.coverage'), {'a.py': {1, 2}, 'b.py': {3}})
+
+    def test_no_data(self):
+        "A process that didn't write any data is ignored"
+        self.merge(CoverageMerger(), 4321)
+
+        self.assertFalse(os.path.exists('.coverage'))
+
+    def test_impact_index(self):
+        "The impact index is updated with the tests of each merged process"
+        index = ImpactIndex(os.path.join('.cricket', 'impact.json'))
+        index.tests = {'tests.A.test_a': {'old.py'}, 'tests.Z.test_z': {'z.py'}}
+
+        self.merge(CoverageMerger(impact_index=index), 1234)
+
+        expected = {
+            'tests.A.test_a': {'a.py'},
+            'tests.B.test_b': {'b.py'},
+            'tests.Z.test_z': {'z.py'},
+        }
+        self.assertEqual(index.tests, expected)
+        self.assertEqual(ImpactIndex.load(index.filename).tests, expected)
+
+    def test_erase(self):
+        merger = CoverageMerger()
+        self.merge(merger, 1234)
+        self.complete(merger, merger.erase)
+
+        self.assertFalse(os.path.exists('.coverage'))
+
+    def test_coverage_index(self):
+        "The coverage index is updated with the lines executed by each merged process"
+        index = CoverageIndex()
+        merger = CoverageMerger(coverage_index=index)
+
+        self.merge(merger, 1234)
+        self.assertEqual(
+            {os.path.relpath(filename): bitset_lines(bits) for filename, bits in index.executed.items()},
+            {'a.py': {1, 2}, 'b.py': {3}}
+        )
+
+        # Merged data can be reloaded into a new index.
+        reloaded = CoverageIndex()
+        loader = CoverageMerger(coverage_index=reloaded)
+        self.complete(loader, loader.load)
+        self.assertEqual(reloaded.executed, index.executed)
+
+        # Erasing the data clears the index.
+        self.complete(merger, merger.erase)
+        self.assertEqual(index.executed, {})
+
+
+@unittest.skipIf(CoverageData is None, "coverage isn't installed")
+class CreateCollectorTests(unittest.TestCase):
+    def test_trace(self):
+        self.assertIsInstance(create_collector('trace'), Coverage)
+
+    @unittest.skipUnless(hasattr(sys, 'monitoring'), "sys.monitoring requires Python 3.12+")
+    def test_sysmon(self):
+        self.assertIsInstance(create_collector('sysmon'), MonitoringCollector)
+
+    @unittest.skipUnless(hasattr(sys, 'monitoring'), "sys.monitoring requires Python 3.12+")
+    def test_sysmon_in_use(self):
+        "If another tool is using sys.monitoring for coverage, coverage.py is used instead"
+        sys.monitoring.use_tool_id(sys.monitoring.COVERAGE_ID, 'other')
+        try:
+            with self.assertWarns(UserWarning):
+                collector = create_collector('sysmon')
+        finally:
+            sys.monitoring.free_tool_id(sys.monitoring.COVERAGE_ID)
+
+        self.assertIsInstance(collector, Coverage)
+
+    def test_sysmon_unavailable(self):
+        "If sys.monitoring isn't available, coverage.py is used instead"
+        with mock.patch('cricket.coverage_data.sys', SimpleNamespace()):
+            with self.assertWarns(UserWarning):
+                collector = create_collector('sysmon')
+
+        self.assertIsInstance(collector, Coverage)
+
+
+MEASURED_SOURCE = """\
+def double(x):
+    return x * 2
+
+
+def triple(x):
+    return x * 3
+"""
+
+
+@unittest.skipIf(CoverageData is None, "coverage isn't installed")
+@unittest.skipUnless(hasattr(sys, 'monitoring'), "sys.monitoring requires Python 3.12+")
+class MonitoringCollectorTests(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmpdir.name)
+
+        # Functions defined in a file in the current directory are
+        # measured; functions defined anywhere else are not.
+        self.filename = os.path.abspath('measured.py')
+        with open(self.filename, 'w') as f:
+            f.write(MEASURED_SOURCE)
+        self.measured = {}
+        exec(compile(MEASURED_SOURCE, self.filename, 'exec'), self.measured)
+        self.unmeasured = {}
+        exec(compile(MEASURED_SOURCE, os.path.join(self._cwd, 'elsewhere.py'), 'exec'), self.unmeasured)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmpdir.cleanup()
+
+    def test_contexts(self):
+        "The lines executed in each context are recorded"
+        collector = MonitoringCollector()
+        collector.start()
+        try:
+            collector.switch_context('tests.A.test_double')
+            self.measured['double'](1)
+            self.measured['double'](2)
+            self.unmeasured['triple'](1)
+
+            collector.switch_context('tests.B.test_both')
+            self.measured['double'](3)
+            self.measured['triple'](3)
+        finally:
+            collector.stop()
+        collector.save()
+
+        # Data is saved to a per-process data file.
+        self.assertFalse(os.path.exists('.coverage'))
+        [data_file] = glob.glob('.coverage.*')
+        data = CoverageData(basename=data_file)
+        data.read()
+
+        self.assertEqual(data.measured_files(), {self.filename})
+        self.assertEqual(
+            {
+                line: sorted(contexts)
+                for line, contexts in data.contexts_by_lineno(self.filename).items()
+            },
+            {
+                2: ['tests.A.test_double', 'tests.B.test_both'],
+                6: ['tests.B.test_both'],
+            }
+        )
+
+    def test_restart(self):
+        "The collector releases sys.monitoring when it stops, so it can be used again"
+        for context in ('first', 'second'):
+            collector = MonitoringCollector()
+            collector.start()
+            try:
+                collector.switch_context(context)
+                self.measured['double'](1)
+            finally:
+                collector.stop()
+            self.assertIsNone(sys.monitoring.get_tool(collector.tool_id))
+
+
+class BitsetTests(unittest.TestCase):
+    def test_bitset(self):
+        self.assertEqual(bitset([]), 0)
+        self.assertEqual(bitset([1, 3, 9]), 0b1000001010)
+        self.assertEqual(bitset([9, 3, 1, 3]), 0b1000001010)
+
+    def test_bitset_lines(self):
+        self.assertEqual(bitset_lines(0), set())
+        self.assertEqual(bitset_lines(bitset([1, 3, 9, 1000])), {1, 3, 9, 1000})
+
+    def test_bitset_count(self):
+        self.assertEqual(bitset_count(0), 0)
+        self.assertEqual(bitset_count(bitset([1, 3, 9, 1000])), 4)
+
+
+@unittest.skipIf(CoverageData is None, "coverage isn't installed")
+class CoverageIndexTests(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmpdir.name)
+
+        # Lines 1, 2, 5 and 6 are statements.
+        self.filename = os.path.abspath('measured.py')
+        with open(self.filename, 'w') as f:
+            f.write(MEASURED_SOURCE)
+
+        self.index = CoverageIndex()
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmpdir.cleanup()
+
+    def test_summary(self):
+        write_data('.coverage.1', {'': {'measured.py': [1, 2, 5]}})
+        self.index.update('.coverage.1')
+
+        self.assertEqual(self.index.summary(), [(self.filename, 4, 1, 75.0)])
+        self.assertEqual(self.index.lines(self.filename), ({1, 2, 5}, {6}))
+
+    def test_update(self):
+        "Lines executed in each data file are added to the index"
+        write_data('.coverage.1', {'': {'measured.py': [1, 2, 5]}})
+        write_data('.coverage.2', {'': {'measured.py': [6]}})
+        self.index.update('.coverage.1')
+        self.index.update('.coverage.2')
+
+        self.assertEqual(self.index.summary(), [(self.filename, 4, 0, 100.0)])
+        self.assertEqual(self.index.lines(self.filename), ({1, 2, 5, 6}, set()))
+
+    def test_unmeasured_file(self):
+        self.assertEqual(self.index.summary(), [])
+        self.assertEqual(self.index.lines(self.filename), (set(), {1, 2, 5, 6}))
+
+    def test_modified_file(self):
+        "Statements are parsed again when a file is modified"
+        write_data('.coverage.1', {'': {'measured.py': [1, 2]}})
+        self.index.update('.coverage.1')
+        self.assertEqual(self.index.summary(), [(self.filename, 4, 2, 50.0)])
+
+        with open(self.filename, 'w') as f:
+            f.write("def double(x):\n    return x * 2\n")
+        mtime = os.path.getmtime(self.filename) + 10
+        os.utime(self.filename, (mtime, mtime))
+
+        self.assertEqual(self.index.summary(), [(self.filename, 2, 0, 100.0)])
+
+    def test_unparseable_file(self):
+        "If a file can't be parsed, every executed line is treated as a statement"
+        with open(self.filename, 'w') as f:
+            f.write("def broken(:\n")
+        write_data('.coverage.1', {'': {'measured.py': [1, 3]}})
+        self.index.update('.coverage.1')
+
+        self.assertEqual(self.index.summary(), [(self.filename, 2, 0, 100.0)])
+
+        write_data('.coverage.2', {'': {'measured.py': [4]}})
+        self.index.update('.coverage.2')
+        self.assertEqual(self.index.summary(), [(self.filename, 3, 0, 100.0)])
+
+    def test_missing_file(self):
+        "A measured file that no longer exists has no statements"
+        write_data('.coverage.1', {'': {'deleted.py': [1]}})
+        self.index.update('.coverage.1')
+
+        self.assertEqual(self.index.summary(), [(os.path.abspath('deleted.py'), 0, 0, 100.0)])
+
+    def test_clear(self):
+        write_data('.coverage.1', {'': {'measured.py': [1]}})
+        self.index.update('.coverage.1')
+        self.index.clear()
+
+        self.assertEqual(self.index.summary(), [])
@@ -32,7 +32,7 @@ class DiscoveryTests(unittest.TestCase):
         found = set()
         for line in runner.stdout.decode('utf-8').split('\n'):
             if line:
-                found.add(line)
+                found.add(json.loads(line)['id'])
 
         self.assertEqual(
             found,
@@ -80,9 +80,10 @@ class ExecutorTests(unittest.TestCase):
 
     def execute(self, *args):
         suite = DjangoTestSuite()
+        # Labels are passed to the executor on stdin.
         runner = subprocess.run(
-            suite.execute_commandline(list(args)),
-            stdin=None,
+            suite.execute_commandline('-' if args else None),
+            input='\n'.join(args).encode('utf-8'),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             shell=False,
@@ -1,5 +1,13 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
 import unittest
-from cricket.model import TestModule, TestCase
+from cricket.model import (
+    ModelLoadError, TestModule, TestCase, TestMethod, TestSuiteProblems, TestTree, TestTreeMore,
+    search_tokens
+)
 
 # Use Unittest as a template for TestSuite behavior.
 from cricket.unittest.model import UnittestTestSuite as TestSuite
@@ -84,6 +92,131 @@ class TestTestSuite(unittest.TestCase):
                 }
             }))
 
+    def test_with_discovery_records(self):
+        "Discoverers can describe each test with a JSON record."
+        test_suite = TestSuite()
+        test_suite.refresh([
+                '{"id": "tests.FunkyTestCase.test_something", "file": "tests.py", "line": 12,'
+                ' "description": "Do something", "markers": ["slow"], "skip": "Not today"}',
+                'tests.FunkyTestCase.test_something_else',
+            ])
+
+        self.assertEqual(sorted(self._full_tree(test_suite)), sorted({
+                (TestModule, 'tests'): {
+                    (TestCase, 'FunkyTestCase'): [
+                        'test_something',
+                        'test_something_else',
+                    ]
+                }
+            }))
+
+        test = test_suite['tests']['FunkyTestCase']['test_something']
+        self.assertEqual(test.file, 'tests.py')
+        self.assertEqual(test.line, 12)
+        self.assertEqual(test.description, 'Do something')
+        self.assertEqual(test.markers, {'slow'})
+        self.assertEqual(test.skip, 'Not today')
+
+        test = test_suite['tests']['FunkyTestCase']['test_something_else']
+        self.assertIsNone(test.file)
+        self.assertIsNone(test.line)
+        self.assertEqual(test.description, '')
+        self.assertEqual(test.markers, set())
+        self.assertIsNone(test.skip)
+
+
+class ScriptedTestSuite(TestSuite):
+    "A test suite whose discoverer prints a fixed list of test IDs."
+    def __init__(self, test_ids, errors=()):
+        super().__init__()
+        self.test_ids = test_ids
+        self.error_lines = errors
+
+    def discover_commandline(self):
+        return [
+            sys.executable, '-c',
+            'import sys\n'
+            'for line in {!r}:\n'
+            '    print(line)\n'
+            'for line in {!r}:\n'
+            '    print(line, file=sys.stderr)\n'.format(list(self.test_ids), list(self.error_lines)),
+        ]
+
+
+class RefreshAsyncTests(unittest.TestCase):
+    "Check that tests can be discovered without blocking the event loop."
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def refresh(self, test_suite, batch_size=100):
+        """Refresh a test suite, recording the number of tests it holds
+        whenever control is returned to the event loop.
+        """
+        counts = []
+
+        async def observe(refresh):
+            while not refresh.done():
+                counts.append(len(list(test_suite.iter_tests())))
+                await asyncio.sleep(0)
+
+        async def refresh():
+            task = asyncio.ensure_future(test_suite.refresh_async(batch_size=batch_size))
+            await observe(task)
+            await task
+
+        self.loop.run_until_complete(refresh())
+        return counts
+
+    def test_batches(self):
+        "Tests are added to the suite a batch at a time"
+        test_ids = ['tests.TestCase.test_{:03d}'.format(i) for i in range(250)]
+        test_suite = ScriptedTestSuite(test_ids)
+
+        counts = self.refresh(test_suite)
+
+        self.assertEqual(sorted(set(counts)), [0, 100, 200])
+        self.assertEqual([test.path for test in test_suite.iter_tests()], test_ids)
+        self.assertEqual(test_suite.errors, [])
+
+    def test_purge(self):
+        "Tests that are no longer discovered are removed once discovery has finished"
+        test_suite = ScriptedTestSuite(['app1.TestCase.test_method1', 'app2.TestCase.test_method1'])
+        self.refresh(test_suite)
+
+        test_suite.test_ids = ['app1.TestCase.test_method1', 'app1.TestCase.test_method2']
+        counts = self.refresh(test_suite, batch_size=1)
+
+        self.assertEqual(sorted(set(counts)), [2, 3])
+        self.assertEqual(
+            [test.path for test in test_suite.iter_tests()],
+            ['app1.TestCase.test_method1', 'app1.TestCase.test_method2']
+        )
+        self.assertIsNone(test_suite.get_node('app2'))
+
+    def test_errors(self):
+        "Error output is recorded if any tests are found"
+        test_suite = ScriptedTestSuite(
+            ['tests.TestCase.test_method'],
+            errors=['Warning: something odd'],
+        )
+
+        self.refresh(test_suite)
+
+        self.assertEqual([test.path for test in test_suite.iter_tests()], ['tests.TestCase.test_method'])
+        self.assertEqual(test_suite.errors, ['Warning: something odd'])
+
+    def test_no_tests(self):
+        "If no tests are found, the error output is raised"
+        test_suite = ScriptedTestSuite([], errors=['ImportError: no module', 'named tests'])
+
+        with self.assertRaises(ModelLoadError) as cm:
+            self.refresh(test_suite)
+
+        self.assertEqual(cm.exception.trace, 'ImportError: no module\nnamed tests')
+
 
 class FindLabelTests(unittest.TestCase):
     "Check that naming tests by labels reduces to the right runtime list."
@@ -490,6 +623,23 @@ class FindLabelTests(unittest.TestCase):
             ]),
             (2, ['app8.package2.subpackage2.tests2.TestCase2']))
 
+    def test_node_selection(self):
+        "Tests can be found from any node, using the same labels as the suite"
+        test_case = self.test_suite['app2']['TestCase2']
+        self.assertEqual(
+            test_case.find_tests(labels=['app2.TestCase2.test_method1']),
+            (1, ['app2.TestCase2.test_method1'])
+        )
+        self.assertEqual(test_case.find_tests(labels=['app2']), (2, None))
+        self.assertEqual(test_case.find_tests(labels=['app1']), (0, []))
+
+        test_method = test_case['test_method1']
+        self.assertEqual(test_method.find_tests(labels=['app2.TestCase2.test_method1']), (1, None))
+        self.assertEqual(test_method.find_tests(labels=['app2.TestCase2']), (1, None))
+        self.assertEqual(test_method.find_tests(labels=['app2.TestCase2.test_method2']), (0, []))
+        self.assertEqual(test_method.find_tests(labels=['app2.TestCase1']), (0, []))
+        self.assertEqual(test_method.find_tests(), (1, None))
+
     def test_testmethod_collapse(self):
         "If all test cases in a test are selected, path is trimmed to the testmethod"
 
@@ -851,3 +1001,660 @@ class FindLabelTests(unittest.TestCase):
                 'app8.package2',
             ]),
             (6, ['app8']))
+
+    def test_overlapping_labels(self):
+        "A label inside another requested label doesn't change the selection"
+        self.assertEqual(
+            self.test_suite.find_tests(labels=[
+                'app4.tests2.TestCase2.test_method1',
+                'app4.tests2',
+                'app4.tests2.TestCase1',
+            ]),
+            (3, ['app4.tests2']))
+
+    def test_unknown_labels(self):
+        "Labels that don't name a node in the suite select nothing"
+        self.assertEqual(
+            self.test_suite.find_tests(labels=['app9', 'app1.TestCase.test_missing']),
+            (0, []))
+        self.assertEqual(
+            self.test_suite.find_tests(labels=['app9', 'app1.TestCase.test_method']),
+            (1, ['app1']))
+
+    def test_subtree(self):
+        "Tests can be found in part of the suite"
+        self.assertEqual(
+            self.test_suite['app2'].find_tests(labels=['app2.TestCase2', 'app4.tests1']),
+            (2, ['app2.TestCase2']))
+        self.assertEqual(
+            self.test_suite['app2'].find_tests(labels=['app2']),
+            (3, None))
+
+
+class NodeIndexTests(unittest.TestCase):
+    "Check that nodes can be found by path."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                'app1.TestCase.test_method1',
+                'app1.TestCase.test_method2',
+                'app2.TestCase.test_method1',
+            ])
+
+    def test_get_node(self):
+        test = self.test_suite.get_node('app1.TestCase.test_method1')
+        self.assertIs(test, self.test_suite['app1']['TestCase']['test_method1'])
+        self.assertIs(self.test_suite.get_node('app1.TestCase'), self.test_suite['app1']['TestCase'])
+        self.assertIsNone(self.test_suite.get_node('app3.TestCase.test_method1'))
+
+        # Existing tests are returned without walking the tree.
+        self.assertIs(self.test_suite.put_test('app1.TestCase.test_method1'), test)
+
+    def test_del_test(self):
+        "Deleted nodes can't be found"
+        self.test_suite.del_test('app2.TestCase.test_method1')
+        self.assertIsNone(self.test_suite.get_node('app2.TestCase.test_method1'))
+        self.assertIsNone(self.test_suite.get_node('app2.TestCase'))
+        self.assertIsNone(self.test_suite.get_node('app2'))
+
+        test = self.test_suite.put_test('app2.TestCase.test_method1')
+        self.assertIs(self.test_suite.get_node('app2.TestCase.test_method1'), test)
+
+    def test_purge(self):
+        "Tests that are no longer discovered are removed on refresh"
+        problems = TestSuiteProblems(self.test_suite)
+        self.test_suite.put_test('app2.TestCase.test_method1').set_result(
+            description='', status=TestMethod.STATUS_FAIL, output='', error=None, duration=0.1
+        )
+        self.assertEqual(len(problems), 1)
+
+        self.test_suite.refresh([
+                'app1.TestCase.test_method1',
+                'app3.TestCase.test_method1',
+            ])
+
+        self.assertEqual(
+            sorted(test.path for test in self.test_suite.iter_tests()),
+            ['app1.TestCase.test_method1', 'app3.TestCase.test_method1']
+        )
+        self.assertIsNone(self.test_suite.get_node('app1.TestCase.test_method2'))
+        self.assertIsNone(self.test_suite.get_node('app2'))
+
+        # Removed tests are no longer problems.
+        self.assertEqual(len(problems), 0)
+        self.assertEqual(problems.failing, {})
+
+
+class ActiveTests(unittest.TestCase):
+    "Check that the active state of tests is tracked through the tree."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                'app1.TestCase1.test_method1',
+                'app1.TestCase1.test_method2',
+                'app1.TestCase2.test_method1',
+                'app2.TestCase.test_method1',
+            ])
+
+    def test_counts(self):
+        self.assertEqual(self.test_suite._test_count, 4)
+        self.assertEqual(self.test_suite._active_count, 4)
+        self.assertEqual(self.test_suite['app1']._test_count, 3)
+
+        self.test_suite.put_test('app1.TestCase2.test_method2')
+        self.assertEqual(self.test_suite['app1']._test_count, 4)
+        self.assertEqual(self.test_suite._active_count, 5)
+
+        self.test_suite.del_test('app1.TestCase1.test_method1')
+        self.test_suite.del_test('app2.TestCase.test_method1')
+        self.assertEqual(self.test_suite['app1']._test_count, 3)
+        self.assertEqual(self.test_suite._test_count, 3)
+        self.assertEqual(self.test_suite._active_count, 3)
+
+    def test_module(self):
+        "Deactivating a module deactivates everything it contains"
+        app1 = self.test_suite['app1']
+        app1.set_active(False)
+        self.assertFalse(app1.active)
+        self.assertFalse(app1['TestCase1'].active)
+        self.assertFalse(app1['TestCase1']['test_method2'].active)
+        self.assertEqual(self.test_suite._active_count, 1)
+        self.assertEqual(self.test_suite.find_tests(active=True), (1, ['app2']))
+
+        app1.toggle_active()
+        self.assertTrue(app1['TestCase2']['test_method1'].active)
+        self.assertEqual(self.test_suite.find_tests(active=True), (4, None))
+
+    def test_method(self):
+        "A node is active while any of its tests are active"
+        case = self.test_suite['app1']['TestCase1']
+        case['test_method1'].set_active(False)
+        self.assertTrue(case.active)
+        self.assertEqual(
+            self.test_suite.find_tests(active=True),
+            (3, ['app1.TestCase1.test_method2', 'app1.TestCase2', 'app2'])
+        )
+
+        case['test_method2'].toggle_active()
+        self.assertFalse(case.active)
+        self.assertTrue(self.test_suite['app1'].active)
+        self.assertEqual(self.test_suite['app1']._active_count, 1)
+
+        case['test_method1'].set_active(True)
+        self.assertTrue(case.active)
+        self.assertEqual(self.test_suite['app1']._active_count, 2)
+
+    def test_notifications(self):
+        "Listeners are told about every node whose active state changes"
+        changes = []
+
+        class Listener:
+            def change(self, item):
+                changes.append(item.path)
+
+        self.test_suite.add_listener(Listener())
+        self.test_suite['app1']['TestCase1'].set_active(False)
+        self.assertEqual(sorted(changes), [
+            'app1.TestCase1',
+            'app1.TestCase1.test_method1',
+            'app1.TestCase1.test_method2',
+        ])
+
+        changes.clear()
+        self.test_suite['app1']['TestCase2']['test_method1'].set_active(False)
+        self.assertEqual(changes, ['app1.TestCase2.test_method1', 'app1.TestCase2', 'app1'])
+
+
+class BatchTests(unittest.TestCase):
+    "Check that notifications can be collected, and delivered together."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                'app1.TestCase.test_method1',
+                'app1.TestCase.test_method2',
+            ])
+        self.notifications = []
+
+        class Listener:
+            def insert(listener, parent, index, item):
+                self.notifications.append(('insert', item.path))
+
+            def remove(listener, parent, index, item):
+                self.notifications.append(('remove', item.path))
+
+            def change(listener, item):
+                self.notifications.append(('change', item.path))
+
+        self.test_suite.add_listener(Listener())
+
+    def set_status(self, path, status):
+        self.test_suite.put_test(path).set_result(
+            description='', status=status, output='', error=None, duration=0.1
+        )
+
+    def test_batch(self):
+        "Notifications are delivered in order when the batch ends"
+        with self.test_suite.batch():
+            self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_FAIL)
+            self.test_suite.put_test('app1.TestCase.test_method3')
+            self.assertEqual(self.notifications, [])
+
+        self.assertEqual(self.notifications, [
+            ('change', 'app1.TestCase.test_method1'),
+            ('insert', 'app1.TestCase.test_method3'),
+        ])
+
+    def test_collapse_changes(self):
+        "Only one change is delivered for each item"
+        with self.test_suite.batch():
+            self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_FAIL)
+            self.set_status('app1.TestCase.test_method2', TestMethod.STATUS_PASS)
+            self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_PASS)
+
+        self.assertEqual(self.notifications, [
+            ('change', 'app1.TestCase.test_method1'),
+            ('change', 'app1.TestCase.test_method2'),
+        ])
+
+    def test_removed(self):
+        "Changes to items that have been removed are dropped"
+        with self.test_suite.batch():
+            self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_FAIL)
+            self.test_suite.del_test('app1.TestCase.test_method1')
+
+        self.assertEqual(self.notifications, [('remove', 'app1.TestCase.test_method1')])
+
+    def test_nested(self):
+        "Notifications are held until the outermost batch ends"
+        with self.test_suite.batch():
+            with self.test_suite.batch():
+                self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_FAIL)
+            self.assertEqual(self.notifications, [])
+        self.assertEqual(self.notifications, [('change', 'app1.TestCase.test_method1')])
+
+    def watch_tree(self, tree, row):
+        """Record the children of a tree row that are shown to a tree widget.
+
+        Returns the list of displayed children, which is updated as the
+        tree notifies the widget of changes.
+        """
+        displayed = list(row)
+        # Top level rows have no parent.
+        parent_row = None if row is tree else row
+
+        class Widget:
+            def insert(widget, parent, index, item):
+                if parent is parent_row:
+                    displayed.insert(index, item)
+
+            def remove(widget, parent, index, item):
+                if parent is parent_row:
+                    self.assertIs(displayed.pop(index), item)
+
+            def change(widget, item):
+                if isinstance(item, TestTreeMore):
+                    self.assertIn(item, displayed)
+
+        tree.add_listener(Widget())
+        return displayed
+
+    def test_tree_pages(self):
+        "A tree shows the children added by a batch, even if they fill more than a page"
+        tree = TestTree(self.test_suite, page_size=4)
+        case = tree[0][0]
+        displayed = self.watch_tree(tree, case)
+
+        with self.test_suite.batch():
+            for i in range(3, 10):
+                self.test_suite.put_test('app1.TestCase.test_method{}'.format(i))
+
+        self.assertEqual(displayed, list(case))
+        self.assertEqual(
+            [child.label[1] if isinstance(child, TestTreeMore) else child.name for child in case],
+            ['test_method1', 'test_method2', 'test_method3', 'test_method4', '5 more...']
+        )
+
+        # Hidden children can still be shown.
+        tree.show_more(case[-1])
+        self.assertEqual(displayed, list(case))
+        self.assertEqual(len(case), 9)
+
+    def test_tree_containers(self):
+        "A container added by a batch is only shown once, with its children"
+        tree = TestTree(self.test_suite)
+        displayed = self.watch_tree(tree, tree)
+
+        with self.test_suite.batch():
+            self.test_suite.put_test('app2.TestCase.test_method1')
+            self.test_suite.put_test('app2.TestCase.test_method2')
+
+        self.assertEqual(displayed, list(tree))
+        self.assertEqual([row.name for row in tree], ['app1', 'app2'])
+        self.assertEqual([row.name for row in tree[1][0]], ['test_method1', 'test_method2'])
+
+    def test_problems(self):
+        "Listeners see the final state of each item"
+        problems = TestSuiteProblems(self.test_suite)
+        with self.test_suite.batch():
+            self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_FAIL)
+            self.set_status('app1.TestCase.test_method2', TestMethod.STATUS_FAIL)
+            self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_PASS)
+            self.assertEqual(len(problems), 0)
+
+        self.assertEqual(
+            [test.path for test in problems.iter_tests()],
+            ['app1.TestCase.test_method2']
+        )
+
+
+class FindMarkerTests(unittest.TestCase):
+    "Check that tests can be selected by marker."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                '{"id": "app1.TestCase.test_method1", "markers": ["slow"]}',
+                '{"id": "app1.TestCase.test_method2", "markers": ["slow", "db"]}',
+                '{"id": "app2.TestCase.test_method1", "markers": ["db"]}',
+                'app2.TestCase.test_method2',
+            ])
+
+    def test_no_markers(self):
+        "If no markers are requested, every test is found"
+        self.assertEqual(self.test_suite.find_tests(markers=None), (4, None))
+
+    def test_single_marker(self):
+        "Only tests with the marker are found"
+        self.assertEqual(self.test_suite.find_tests(markers={'slow'}), (2, ['app1']))
+        self.assertEqual(
+            self.test_suite.find_tests(markers={'db'}),
+            (2, ['app1.TestCase.test_method2', 'app2.TestCase.test_method1'])
+        )
+
+    def test_any_marker(self):
+        "Tests with any of the markers are found"
+        self.assertEqual(
+            self.test_suite.find_tests(markers={'slow', 'db'}),
+            (3, ['app1', 'app2.TestCase.test_method1'])
+        )
+
+    def test_markers_and_labels(self):
+        "Markers are combined with labels"
+        self.assertEqual(
+            self.test_suite.find_tests(labels=['app2'], markers={'db'}),
+            (1, ['app2.TestCase.test_method1'])
+        )
+
+
+class FindStatusTests(unittest.TestCase):
+    "Check that tests can be selected by the status of their last run."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                'app1.TestCase.test_method1',
+                'app1.TestCase.test_method2',
+                'app2.TestCase.test_method1',
+                'app2.TestCase.test_method2',
+            ])
+        for path, status in [
+                    ('app1.TestCase.test_method1', TestMethod.STATUS_FAIL),
+                    ('app1.TestCase.test_method2', TestMethod.STATUS_FAIL),
+                    ('app2.TestCase.test_method1', TestMethod.STATUS_PASS),
+                    ('app2.TestCase.test_method2', TestMethod.STATUS_ERROR),
+                ]:
+            self.test_suite.put_test(path).set_result(
+                description='', status=status, output='', error=None, duration=0.1
+            )
+
+    def test_status(self):
+        "Only tests with a matching status are found"
+        self.assertEqual(
+            self.test_suite.find_tests(status={TestMethod.STATUS_PASS}),
+            (1, ['app2.TestCase.test_method1'])
+        )
+
+    def test_failing(self):
+        "Containers are selected by the status of their tests"
+        self.assertEqual(
+            self.test_suite.find_tests(status=TestMethod.FAILING_STATES),
+            (3, ['app1', 'app2.TestCase.test_method2'])
+        )
+
+
+class OrderedTestsTests(unittest.TestCase):
+    "Check that tests are ordered so that likely failures run first."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                'app1.TestCase.test_method1',
+                'app1.TestCase.test_method2',
+                'app2.TestCase.test_method1',
+                'app2.TestCase.test_method2',
+            ])
+
+    def set_result(self, path, status, duration):
+        self.test_suite.put_test(path).set_result(
+            description='', status=status, output='', error=None, duration=duration
+        )
+
+    def test_failures_first(self):
+        "Tests that failed run first, then tests in order of duration"
+        self.set_result('app1.TestCase.test_method1', TestMethod.STATUS_PASS, 3.0)
+        self.set_result('app1.TestCase.test_method2', TestMethod.STATUS_PASS, 1.0)
+        self.set_result('app2.TestCase.test_method1', TestMethod.STATUS_PASS, 2.0)
+        self.set_result('app2.TestCase.test_method2', TestMethod.STATUS_FAIL, 4.0)
+
+        self.assertEqual(self.test_suite.ordered_tests(), [
+            'app2.TestCase.test_method2',
+            'app1.TestCase.test_method2',
+            'app2.TestCase.test_method1',
+            'app1.TestCase.test_method1',
+        ])
+
+    def test_labels(self):
+        "Only the tests targeted by the labels are returned"
+        self.set_result('app1.TestCase.test_method1', TestMethod.STATUS_ERROR, 1.0)
+
+        self.assertEqual(
+            self.test_suite.ordered_tests(['app2', 'app1.TestCase.test_method1']),
+            [
+                'app1.TestCase.test_method1',
+                'app2.TestCase.test_method1',
+                'app2.TestCase.test_method2',
+            ]
+        )
+
+    def test_modified_files(self):
+        "Tests in files modified since the last run are run after failures"
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                # The source file of each test is found from its module.
+                for filename in ('old.py', 'new.py', 'failed.py'):
+                    with open(filename, 'w'):
+                        pass
+
+                self.test_suite = TestSuite()
+                self.test_suite.refresh([
+                        'old.TestCase.test_method',
+                        'new.TestCase.test_method',
+                        'failed.TestCase.test_method',
+                    ])
+                self.set_result('failed.TestCase.test_method', TestMethod.STATUS_FAIL, 1.0)
+                self.set_result('new.TestCase.test_method', TestMethod.STATUS_PASS, 2.0)
+                self.set_result('old.TestCase.test_method', TestMethod.STATUS_PASS, 1.0)
+
+                self.test_suite.last_run = time.time() - 60
+                for filename in ('old.py', 'failed.py'):
+                    os.utime(filename, (self.test_suite.last_run - 60,) * 2)
+
+                self.assertEqual(self.test_suite.ordered_tests(), [
+                    'failed.TestCase.test_method',
+                    'new.TestCase.test_method',
+                    'old.TestCase.test_method',
+                ])
+            finally:
+                os.chdir(cwd)
+
+
+class TestTreeTests(unittest.TestCase):
+    "Check that the tree of tests is only populated on demand."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+            'app1.TestCase.test_method{}'.format(i)
+            for i in range(10)
+        ] + [
+            'app2.TestCase.test_method1',
+        ])
+
+    def labels(self, row):
+        return [
+            child.label[1] if isinstance(child, TestTreeMore) else child.name
+            for child in row
+        ]
+
+    def test_lazy(self):
+        "Rows are only created for children that have been requested"
+        tree = TestTree(self.test_suite)
+        self.assertEqual(tree._row_count, 0)
+
+        self.assertEqual(self.labels(tree), ['app1', 'app2'])
+        self.assertEqual(tree._row_count, 2)
+
+        self.assertEqual(tree[0].path, 'app1')
+        self.assertEqual(len(tree[0][0]), 10)
+        self.assertEqual(tree._row_count, 13)
+
+    def test_paging(self):
+        "Children beyond the page size are hidden behind a placeholder"
+        tree = TestTree(self.test_suite, page_size=4)
+        case = tree[0][0]
+        self.assertEqual(self.labels(case), [
+            'test_method0', 'test_method1', 'test_method2', 'test_method3', '6 more...'
+        ])
+
+        tree.show_more(case[-1])
+        self.assertEqual(len(case), 9)
+        self.assertEqual(case[-1].count, 2)
+
+        tree.show_more(case[-1])
+        self.assertEqual(len(case), 10)
+        self.assertEqual(case[-1].name, 'test_method9')
+
+    def test_max_rows(self):
+        "No more than max_rows rows are created without being requested"
+        tree = TestTree(self.test_suite, max_rows=5)
+        case = tree[0][0]
+        # app1, app2, and app1.TestCase use up 3 of the 5 rows.
+        self.assertEqual(self.labels(case), ['test_method0', 'test_method1', '8 more...'])
+        self.assertEqual(tree._row_count, 5)
+
+    def test_insert_and_remove(self):
+        "Rows follow the tests that are added to and removed from the suite"
+        tree = TestTree(self.test_suite)
+        app2 = tree[1]
+        self.assertEqual(self.labels(app2[0]), ['test_method1'])
+
+        self.test_suite.put_test('app2.TestCase.test_method0')
+        self.assertEqual(self.labels(app2[0]), ['test_method0', 'test_method1'])
+
+        self.test_suite.del_test('app2.TestCase.test_method0')
+        self.assertEqual(self.labels(app2[0]), ['test_method1'])
+
+        self.test_suite.del_test('app2.TestCase.test_method1')
+        self.assertEqual(self.labels(tree), ['app1'])
+
+    def test_filter(self):
+        "A filtered tree only shows the matching tests, and the nodes containing them"
+        tree = TestTree(self.test_suite)
+        tree.set_filter({'app1.TestCase.test_method3', 'app1.TestCase.test_method5'})
+        self.assertEqual(self.labels(tree), ['app1'])
+        self.assertEqual(self.labels(tree[0][0]), ['test_method3', 'test_method5'])
+
+        # Containers are only shown once a matching test is added.
+        tree.set_filter({'app3.TestCase.test_method1'})
+        self.assertEqual(self.labels(tree), [])
+        self.test_suite.put_test('app3.TestCase.test_method1')
+        self.assertEqual(self.labels(tree), ['app3'])
+
+        tree.set_filter(None)
+        self.assertEqual(self.labels(tree), ['app1', 'app2', 'app3'])
+
+
+class ProblemsTests(unittest.TestCase):
+    "Check that the problem tree only contains failing tests."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                'app1.TestCase.test_method1',
+                'app1.TestCase.test_method2',
+                'app1.OtherCase.test_method1',
+                'app2.TestCase.test_method1',
+            ])
+        self.problems = TestSuiteProblems(self.test_suite)
+
+    def set_status(self, path, status):
+        self.test_suite.put_test(path).set_result(
+            description='', status=status, output='', error=None, duration=0.1
+        )
+
+    def paths(self):
+        return sorted(test.path for test in self.problems.iter_tests())
+
+    def test_failures(self):
+        "Tests are added when they fail, and removed when they pass"
+        self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_PASS)
+        self.assertEqual(self.paths(), [])
+
+        self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_FAIL)
+        self.set_status('app1.TestCase.test_method2', TestMethod.STATUS_ERROR)
+        self.set_status('app2.TestCase.test_method1', TestMethod.STATUS_UNEXPECTED_SUCCESS)
+        self.assertEqual(self.paths(), [
+            'app1.TestCase.test_method1',
+            'app1.TestCase.test_method2',
+            'app2.TestCase.test_method1',
+        ])
+        self.assertEqual(
+            self.problems['app1']['TestCase']['test_method2'].status,
+            TestMethod.STATUS_ERROR
+        )
+
+        # A node is removed once it contains no failing tests.
+        self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_PASS)
+        self.assertEqual(list(self.problems['app1']['TestCase']._child_labels), ['test_method2'])
+
+        self.set_status('app1.TestCase.test_method2', TestMethod.STATUS_PASS)
+        self.set_status('app2.TestCase.test_method1', TestMethod.STATUS_SKIP)
+        self.assertEqual(self.paths(), [])
+        self.assertEqual(len(self.problems), 0)
+        self.assertEqual(self.problems.failing_counts, {})
+
+    def test_result_updated(self):
+        "The result of a test that is still failing is updated"
+        self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_FAIL)
+        self.set_status('app1.TestCase.test_method1', TestMethod.STATUS_ERROR)
+        self.assertEqual(
+            self.problems['app1']['TestCase']['test_method1'].status,
+            TestMethod.STATUS_ERROR
+        )
+        self.assertEqual(self.problems.failing_counts[self.problems['app1']], 1)
+
+
+class SearchTests(unittest.TestCase):
+    "Check that tests can be found by searching."
+    def setUp(self):
+        self.test_suite = TestSuite()
+        self.test_suite.refresh([
+                'app1.DeepNestedTests.test_stuff',
+                'app1.DeepNestedTests.test_things',
+                'app1.OtherTests.test_stuff',
+                '{"id": "app2.ModelTests.test_save", "description": "Saving a widget"}',
+            ])
+
+    def test_search_tokens(self):
+        self.assertEqual(
+            search_tokens('test_module.DeepNestedTests'),
+            ['test', 'module', 'deep', 'nested', 'tests']
+        )
+        self.assertEqual(search_tokens('HTTPServer2'), ['httpserver2'])
+
+    def test_empty_query(self):
+        self.assertIsNone(self.test_suite.index.search(''))
+        self.assertIsNone(self.test_suite.index.search(' .. '))
+
+    def test_prefix(self):
+        "Tokens of the query match the start of tokens of the test"
+        self.assertEqual(self.test_suite.index.search('stuf'), {
+            'app1.DeepNestedTests.test_stuff',
+            'app1.OtherTests.test_stuff',
+        })
+        self.assertEqual(self.test_suite.index.search('xyz'), set())
+
+    def test_containers(self):
+        "Matching a container matches every test it contains"
+        self.assertEqual(self.test_suite.index.search('nested'), {
+            'app1.DeepNestedTests.test_stuff',
+            'app1.DeepNestedTests.test_things',
+        })
+
+    def test_all_terms(self):
+        "Every term must match the test, or a node containing it"
+        self.assertEqual(
+            self.test_suite.index.search('deep stuff'),
+            {'app1.DeepNestedTests.test_stuff'}
+        )
+        self.assertEqual(self.test_suite.index.search('app2 stuff'), set())
+
+    def test_description(self):
+        "Tests can be found by their description"
+        self.assertEqual(self.test_suite.index.search('widget'), {'app2.ModelTests.test_save'})
+
+    def test_removed(self):
+        "Removed tests are no longer found"
+        self.test_suite.del_test('app1.OtherTests.test_stuff')
+        self.assertEqual(
+            self.test_suite.index.search('stuff'),
+            {'app1.DeepNestedTests.test_stuff'}
+        )
+        self.assertEqual(self.test_suite.index.search('other'), set())
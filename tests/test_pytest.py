@@ -32,7 +32,7 @@ class DiscoveryTests(unittest.TestCase):
         found = set()
         for line in runner.stdout.decode('utf-8').split('\n'):
             if line:
-                found.add(line)
+                found.add(json.loads(line)['id'])
 
         self.assertEqual(
             found,
@@ -66,6 +66,61 @@ class DiscoveryTests(unittest.TestCase):
             }
         )
 
+    def test_discovery_records(self):
+        suite = PyTestTestSuite()
+        runner = subprocess.run(
+            suite.discover_commandline(),
+            stdin=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+        )
+
+        records = {}
+        for line in runner.stdout.decode('utf-8').split('\n'):
+            if line:
+                record = json.loads(line)
+                records[record['id']] = record
+
+        self.assertEqual(
+            records['tests/test_outcomes.py::test_skipped_item'],
+            {
+                'id': 'tests/test_outcomes.py::test_skipped_item',
+                'file': 'tests/test_outcomes.py',
+                'line': 8,
+                'markers': ['skip'],
+                'skip': 'tra-la-la',
+            }
+        )
+        self.assertEqual(
+            records['tests/submodule/subsubmodule/test_deep_nesting.py::test_stuff'],
+            {
+                'id': 'tests/submodule/subsubmodule/test_deep_nesting.py::test_stuff',
+                'file': 'tests/submodule/subsubmodule/test_deep_nesting.py',
+                'line': 2,
+            }
+        )
+
+    def discover(self, suite):
+        runner = subprocess.run(
+            suite.discover_commandline(),
+            stdin=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+        )
+        return {
+            json.loads(line)['id']
+            for line in runner.stdout.decode('utf-8').split('\n')
+            if line
+        }
+
+    def test_static_discovery(self):
+        "Static discovery finds the same tests as importing the test files"
+        suite = PyTestTestSuite()
+        suite.static_discovery = True
+        self.assertEqual(self.discover(suite), self.discover(PyTestTestSuite()))
+
 
 class ExecutorTests(unittest.TestCase):
     def setUp(self):
@@ -75,11 +130,14 @@ class ExecutorTests(unittest.TestCase):
     def tearDown(self):
         os.chdir(self._cwd)
 
-    def execute(self, *args):
+    def execute(self, *args, maxfail=None, profile=False, resources=False):
         suite = PyTestTestSuite()
+        suite.maxfail = maxfail
+        suite.record_resources = resources
+        # Labels are passed to the executor on stdin.
         runner = subprocess.run(
-            suite.execute_commandline(list(args)),
-            stdin=None,
+            suite.execute_commandline('-' if args else None, profile=profile),
+            input='\n'.join(args).encode('utf-8'),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             shell=False,
@@ -87,6 +145,8 @@ class ExecutorTests(unittest.TestCase):
 
         found = set()
         results = {}
+        self.profiles = []
+        self.usages = []
         for line in runner.stdout.decode('utf-8').split('\n'):
             try:
                 payload = json.loads(line)
@@ -95,6 +155,10 @@ class ExecutorTests(unittest.TestCase):
                 elif 'status' in payload:
                     count = results.setdefault(payload['status'], 0)
                     results[payload['status']] = count + 1
+                    if 'profile' in payload:
+                        self.profiles.append(payload['profile'])
+                    if 'resources' in payload:
+                        self.usages.append(payload['resources'])
                 else:
                     self.fail("Unknown payload line: '{}'".format(payload))
             except json.JSONDecodeError:
@@ -136,6 +200,49 @@ class ExecutorTests(unittest.TestCase):
 
         self.assertEqual(results, {'OK': 20, 'F': 2, 'E': 1, 'x': 1, 'u': 1, 's': 1})
 
+    def test_maxfail(self):
+        found, results = self.execute(maxfail=1)
+
+        # The run stops after the first failure or error.
+        self.assertEqual(results.get('F', 0) + results.get('E', 0), 1)
+        all_found, all_results = self.execute()
+        self.assertLess(len(found), len(all_found))
+
+    def test_profile(self):
+        found, results = self.execute(
+            'tests/submodule/test_nesting.py::test_stuff',
+            profile=True,
+        )
+
+        self.assertEqual(results, {'OK': 1})
+        # Each function in the profile is summarized in a row.
+        [profile] = self.profiles
+        self.assertTrue(profile)
+        for row in profile:
+            self.assertEqual(len(row), 6)
+
+        # Tests aren't profiled unless requested.
+        self.execute('tests/submodule/test_nesting.py::test_stuff')
+        self.assertEqual(self.profiles, [])
+
+    def test_resources(self):
+        found, results = self.execute(
+            'tests/submodule/test_nesting.py::test_stuff',
+            resources=True,
+        )
+
+        self.assertEqual(results, {'OK': 1})
+        [usage] = self.usages
+        self.assertEqual(
+            set(usage),
+            {'rss', 'peak_memory', 'wall_time', 'cpu_time', 'fds', 'threads'},
+        )
+        self.assertEqual(usage['threads'], 0)
+
+        # Resources aren't recorded unless requested.
+        self.execute('tests/submodule/test_nesting.py::test_stuff')
+        self.assertEqual(self.usages, [])
+
     def test_single_test_method(self):
         found, results = self.execute(
             'tests/submodule/test_nesting.py::test_stuff',
@@ -309,6 +416,65 @@ class SuiteSplitTests(unittest.TestCase):
             ]
         )
 
+    def test_split_parametrized(self):
+        suite = PyTestTestSuite()
+        parts = suite.split_test_id('tests/test_module.py::TestClass::test_stuff[1-2]')
+
+        self.assertEqual(
+            parts,
+            [
+                (TestModule, 'tests'),
+                (TestModule, 'test_module.py'),
+                (TestCase, 'TestClass'),
+                (TestCase, 'test_stuff'),
+                (TestMethod, '[1-2]'),
+            ]
+        )
+
+    def test_split_parametrized_separators(self):
+        "Parameter ids can contain path and node separators."
+        suite = PyTestTestSuite()
+        parts = suite.split_test_id('tests/test_module.py::test_stuff[a/b::c[d]]')
+
+        self.assertEqual(
+            parts,
+            [
+                (TestModule, 'tests'),
+                (TestModule, 'test_module.py'),
+                (TestCase, 'test_stuff'),
+                (TestMethod, '[a/b::c[d]]'),
+            ]
+        )
+
+    def test_parametrized_tree(self):
+        "Parametrizations are grouped under their test function."
+        suite = PyTestTestSuite()
+        suite.refresh([
+            'tests/test_module.py::test_stuff[1]',
+            'tests/test_module.py::test_stuff[2]',
+            'tests/test_module.py::test_things',
+        ])
+
+        module = suite['tests']['test_module.py']
+        self.assertEqual(module._child_labels, ['test_stuff', 'test_things'])
+        self.assertEqual(module['test_stuff'].path, 'tests/test_module.py::test_stuff')
+        self.assertEqual(
+            [test.path for test in module['test_stuff']],
+            [
+                'tests/test_module.py::test_stuff[1]',
+                'tests/test_module.py::test_stuff[2]',
+            ]
+        )
+
+        # Selecting every parametrization selects the function.
+        self.assertEqual(
+            suite.find_tests(labels=[
+                'tests/test_module.py::test_stuff[1]',
+                'tests/test_module.py::test_stuff[2]',
+            ]),
+            (2, ['tests/test_module.py::test_stuff'])
+        )
+
 
 class SuiteJoinTests(unittest.TestCase):
     def test_join_method_unittest(self):
@@ -349,3 +515,11 @@ class SuiteJoinTests(unittest.TestCase):
             suite.join_path(suite, TestModule, 'tests'),
             'tests'
         )
+
+    def test_join_parametrization(self):
+        suite = PyTestTestSuite()
+        parent = TestCase(None, 'tests/module.py::test_stuff', 'test_stuff')
+        self.assertEqual(
+            suite.join_path(parent, TestMethod, '[1-2]'),
+            'tests/module.py::test_stuff[1-2]'
+        )
@@ -1,8 +1,17 @@
+import cProfile
+import io
 import json
 import os
 import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 
+from cricket.pipes import PipedTestRunner
+from cricket.static_discovery import analyze_unittest
+from cricket.unittest.discoverer import consume, discover_in_parallel, discover_unit, discovery_units
+from cricket.unittest.executor import unroll_test_suite
 from cricket.unittest.model import UnittestTestSuite
 from cricket.model import TestModule, TestCase, TestMethod
 
@@ -32,7 +41,7 @@ class DiscoveryTests(unittest.TestCase):
         found = set()
         for line in runner.stdout.decode('utf-8').split('\n'):
             if line:
-                found.add(line)
+                found.add(json.loads(line)['id'])
 
         self.assertEqual(
             found,
@@ -67,6 +76,208 @@ class DiscoveryTests(unittest.TestCase):
             }
         )
 
+    def test_discovery_records(self):
+        suite = UnittestTestSuite()
+        runner = subprocess.run(
+            suite.discover_commandline(),
+            stdin=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+        )
+
+        records = {}
+        for line in runner.stdout.decode('utf-8').split('\n'):
+            if line:
+                record = json.loads(line)
+                records[record['id']] = record
+
+        self.assertEqual(
+            records['tests.test_outcomes.GoodTests.test_skipped_item'],
+            {
+                'id': 'tests.test_outcomes.GoodTests.test_skipped_item',
+                'file': 'tests/test_outcomes.py',
+                'line': 8,
+                'skip': 'tra-la-la',
+            }
+        )
+        self.assertEqual(
+            records['tests.submodule.subsubmodule.test_deep_nesting.DeepNestedTests.test_stuff'],
+            {
+                'id': 'tests.submodule.subsubmodule.test_deep_nesting.DeepNestedTests.test_stuff',
+                'file': 'tests/submodule/subsubmodule/test_deep_nesting.py',
+                'line': 5,
+            }
+        )
+
+    def discover(self, suite):
+        runner = subprocess.run(
+            suite.discover_commandline(),
+            stdin=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+        )
+        return {
+            json.loads(line)['id']
+            for line in runner.stdout.decode('utf-8').split('\n')
+            if line
+        }
+
+    def test_static_discovery(self):
+        "Static discovery finds the same tests as importing the test files"
+        suite = UnittestTestSuite()
+        suite.static_discovery = True
+        self.assertEqual(self.discover(suite), self.discover(UnittestTestSuite()))
+
+
+class StaticAnalysisTests(unittest.TestCase):
+    "Check which unittest modules can be analyzed without importing them."
+    def analyze(self, source):
+        return analyze_unittest(source, 'pkg/test_child.py', 'pkg.test_child')
+
+    def test_framework_bases(self):
+        "The TestCase classes of unittest and Django don't add any tests"
+        records, needs_import = self.analyze(
+            'import unittest\n'
+            'import django.test\n'
+            'from django.test import SimpleTestCase\n'
+            'class A(unittest.TestCase):\n'
+            '    def test_a(self): pass\n'
+            'class B(django.test.TransactionTestCase):\n'
+            '    def test_b(self): pass\n'
+            'class C(SimpleTestCase):\n'
+            '    def test_c(self): pass\n'
+        )
+        self.assertFalse(needs_import)
+        self.assertEqual([record['id'] for record in records], [
+            'pkg.test_child.A.test_a',
+            'pkg.test_child.B.test_b',
+            'pkg.test_child.C.test_c',
+        ])
+
+    def test_base_from_another_module(self):
+        "A test case inheriting from a TestCase defined elsewhere must be imported"
+        records, needs_import = self.analyze(
+            'from pkg.base import MixinTestCase\n'
+            'class ChildTests(MixinTestCase):\n'
+            '    def test_own(self): pass\n'
+        )
+        self.assertTrue(needs_import)
+        self.assertEqual(records, [])
+
+    def test_qualified_base_from_another_module(self):
+        "A base class is only known if it is reached through unittest or django.test"
+        records, needs_import = self.analyze(
+            'import pkg.base\n'
+            'class ChildTests(pkg.base.TestCase):\n'
+            '    def test_own(self): pass\n'
+        )
+        self.assertTrue(needs_import)
+
+
+def _discover_fake_unit(unit):
+    "A stand-in for discover_unit(), importable by worker processes."
+    return ['{}.Tests.test_{}'.format(unit, n) for n in range(2)]
+
+
+class ParallelDiscoveryTests(unittest.TestCase):
+    "Check that a project can be split into units that are discovered independently."
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmpdir.name)
+        self._path = list(sys.path)
+        self._modules = set(sys.modules)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmpdir.cleanup()
+        sys.path[:] = self._path
+        for name in set(sys.modules) - self._modules:
+            del sys.modules[name]
+
+    def write(self, filename, content=''):
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as f:
+            f.write(content)
+
+    def test_discovery_units(self):
+        "Top-level packages and test modules are units"
+        self.write(os.path.join('pkg_b', '__init__.py'))
+        self.write(os.path.join('pkg_a', '__init__.py'))
+        self.write(os.path.join('not_a_package', 'test_stuff.py'))
+        self.write('test_top.py')
+        self.write('helpers.py')
+        self.write('notes.txt')
+
+        self.assertEqual(discovery_units(), ['pkg_a', 'pkg_b', 'test_top'])
+        self.assertEqual(discovery_units(pattern='*.py'), ['helpers', 'pkg_a', 'pkg_b', 'test_top'])
+
+    def test_discover_unit(self):
+        "The tests in a package, or a top-level module, can be discovered"
+        source = (
+            'import unittest\n'
+            'class Tests(unittest.TestCase):\n'
+            '    def test_first(self):\n'
+            '        pass\n'
+            '    def test_second(self):\n'
+            '        pass\n'
+        )
+        self.write(os.path.join('cricket_unit_pkg', '__init__.py'))
+        self.write(os.path.join('cricket_unit_pkg', 'test_things.py'), source)
+        self.write('test_cricket_unit.py', source)
+        sys.path.insert(0, os.getcwd())
+
+        self.assertEqual([json.loads(record)['id'] for record in discover_unit('cricket_unit_pkg')], [
+            'cricket_unit_pkg.test_things.Tests.test_first',
+            'cricket_unit_pkg.test_things.Tests.test_second',
+        ])
+        self.assertEqual([json.loads(record)['id'] for record in discover_unit('test_cricket_unit')], [
+            'test_cricket_unit.Tests.test_first',
+            'test_cricket_unit.Tests.test_second',
+        ])
+
+    def test_discover_in_parallel(self):
+        "Every unit is discovered"
+        self.assertEqual(
+            sorted(discover_in_parallel(_discover_fake_unit, ['app1', 'app2', 'app3'])),
+            [
+                'app1.Tests.test_0', 'app1.Tests.test_1',
+                'app2.Tests.test_0', 'app2.Tests.test_1',
+                'app3.Tests.test_0', 'app3.Tests.test_1',
+            ]
+        )
+
+    def test_single_unit(self):
+        "A single unit is discovered in this process"
+        initialized = []
+
+        self.assertEqual(
+            list(discover_in_parallel(
+                _discover_fake_unit, ['app1'],
+                initializer=initialized.append, initargs=('options',)
+            )),
+            ['app1.Tests.test_0', 'app1.Tests.test_1']
+        )
+        self.assertEqual(initialized, ['options'])
+
+    def test_serial_fallback(self):
+        "If a process pool can't be started, units are discovered in this process"
+        initialized = []
+
+        with mock.patch('cricket.unittest.discoverer.ProcessPoolExecutor', side_effect=OSError):
+            found = list(discover_in_parallel(
+                _discover_fake_unit, ['app1', 'app2'],
+                initializer=initialized.append, initargs=('options',)
+            ))
+
+        self.assertEqual(found, [
+            'app1.Tests.test_0', 'app1.Tests.test_1',
+            'app2.Tests.test_0', 'app2.Tests.test_1',
+        ])
+        self.assertEqual(initialized, ['options'])
+
 
 class ExecutorTests(unittest.TestCase):
     def setUp(self):
@@ -76,11 +287,14 @@ class ExecutorTests(unittest.TestCase):
     def tearDown(self):
         os.chdir(self._cwd)
 
-    def execute(self, *args):
+    def execute(self, *args, maxfail=None, profile=False, resources=False):
         suite = UnittestTestSuite()
+        suite.maxfail = maxfail
+        suite.record_resources = resources
+        # Labels are passed to the executor on stdin.
         runner = subprocess.run(
-            suite.execute_commandline(list(args)),
-            stdin=None,
+            suite.execute_commandline('-' if args else None, profile=profile),
+            input='\n'.join(args).encode('utf-8'),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             shell=False,
@@ -88,6 +302,8 @@ class ExecutorTests(unittest.TestCase):
 
         found = set()
         results = {}
+        self.profiles = []
+        self.usages = []
         for line in runner.stdout.decode('utf-8').split('\n'):
             try:
                 payload = json.loads(line)
@@ -96,6 +312,10 @@ class ExecutorTests(unittest.TestCase):
                 elif 'status' in payload:
                     count = results.setdefault(payload['status'], 0)
                     results[payload['status']] = count + 1
+                    if 'profile' in payload:
+                        self.profiles.append(payload['profile'])
+                    if 'resources' in payload:
+                        self.usages.append(payload['resources'])
                 else:
                     self.fail("Unknown payload line: '{}'".format(payload))
             except json.JSONDecodeError:
@@ -138,6 +358,49 @@ class ExecutorTests(unittest.TestCase):
 
         self.assertEqual(results, {'OK': 23, 'F': 5, 'E': 1, 'x': 1, 'u': 1, 's': 1})
 
+    def test_maxfail(self):
+        found, results = self.execute(maxfail=1)
+
+        # The run stops after the first failure or error.
+        self.assertEqual(results.get('F', 0) + results.get('E', 0), 1)
+        all_found, all_results = self.execute()
+        self.assertLess(len(found), len(all_found))
+
+    def test_profile(self):
+        found, results = self.execute(
+            'tests.submodule.test_nesting.NestedTests.test_stuff',
+            profile=True,
+        )
+
+        self.assertEqual(results, {'OK': 1})
+        # Each function in the profile is summarized in a row.
+        [profile] = self.profiles
+        self.assertTrue(profile)
+        for row in profile:
+            self.assertEqual(len(row), 6)
+
+        # Tests aren't profiled unless requested.
+        self.execute('tests.submodule.test_nesting.NestedTests.test_stuff')
+        self.assertEqual(self.profiles, [])
+
+    def test_resources(self):
+        found, results = self.execute(
+            'tests.submodule.test_nesting.NestedTests.test_stuff',
+            resources=True,
+        )
+
+        self.assertEqual(results, {'OK': 1})
+        [usage] = self.usages
+        self.assertEqual(
+            set(usage),
+            {'rss', 'peak_memory', 'wall_time', 'cpu_time', 'fds', 'threads'},
+        )
+        self.assertEqual(usage['threads'], 0)
+
+        # Resources aren't recorded unless requested.
+        self.execute('tests.submodule.test_nesting.NestedTests.test_stuff')
+        self.assertEqual(self.usages, [])
+
     def test_single_test_method(self):
         found, results = self.execute(
             'tests.submodule.test_nesting.NestedTests.test_stuff',
@@ -236,6 +499,56 @@ class ExecutorTests(unittest.TestCase):
         self.assertEqual(results, {'OK': 3})
 
 
+class PipedTestRunnerTests(unittest.TestCase):
+    def run_tests(self, *test_classes, **kwargs):
+        "Run test classes with a PipedTestRunner, and return the results it reports."
+        suite = unittest.TestSuite(
+            unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
+            for test_class in test_classes
+        )
+        stream = io.StringIO()
+        stdout = sys.stdout
+        try:
+            PipedTestRunner(stream=stream, **kwargs).run(suite)
+        finally:
+            sys.stdout = stdout
+
+        results = []
+        for line in stream.getvalue().splitlines():
+            if line.startswith('{'):
+                body = json.loads(line)
+                if 'status' in body:
+                    results.append(body)
+        return results
+
+    def test_setup_class_error(self):
+        "A test class that can't be set up is reported, and later tests are still profiled"
+        class BrokenTests(unittest.TestCase):
+            @classmethod
+            def setUpClass(cls):
+                raise ValueError('Broken')
+
+            def test_method(self):
+                pass
+
+        class WorkingTests(unittest.TestCase):
+            def test_method(self):
+                pass
+
+        results = self.run_tests(BrokenTests, WorkingTests, BrokenTests, profile=True, resources=True)
+
+        self.assertEqual([result['status'] for result in results], ['E', 'OK', 'E'])
+        for result in results:
+            self.assertIn('profile', result)
+            self.assertIn('resources', result)
+
+        # No profiler has been left running.
+        self.assertIsNone(sys.getprofile())
+        profiler = cProfile.Profile()
+        profiler.enable()
+        profiler.disable()
+
+
 class SuiteSplitTests(unittest.TestCase):
     def test_split_minimal(self):
         suite = UnittestTestSuite()
@@ -298,3 +611,32 @@ class SuiteJoinTests(unittest.TestCase):
             suite.join_path(suite, TestModule, 'tests'),
             'tests'
         )
+
+
+class FlattenTests(unittest.TestCase):
+    def setUp(self):
+        def test():
+            pass
+
+        self.tests = [
+            unittest.FunctionTestCase(test, description=str(i))
+            for i in range(5)
+        ]
+        self.suite = unittest.TestSuite([
+            unittest.TestSuite([self.tests[0], unittest.TestSuite([self.tests[1]])]),
+            unittest.TestSuite(),
+            self.tests[2],
+            unittest.TestSuite([unittest.TestSuite([unittest.TestSuite(self.tests[3:])])]),
+        ])
+
+    def test_consume(self):
+        self.assertEqual(list(consume(self.suite)), self.tests)
+
+    def test_consume_deep_nesting(self):
+        suite = self.tests[0]
+        for i in range(5000):
+            suite = unittest.TestSuite([suite])
+        self.assertEqual(list(consume(suite)), [self.tests[0]])
+
+    def test_unroll_test_suite(self):
+        self.assertEqual(list(unroll_test_suite(self.suite)), self.tests)
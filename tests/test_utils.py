@@ -1,6 +1,23 @@
+import asyncio
+import contextlib
+import cProfile
+import os
+import tempfile
+import threading
+import tracemalloc
 import unittest
-from cricket.executor import parse_status_and_error
+from types import SimpleNamespace
+from unittest import mock
+
+from cricket.executor import Executor, RemainingTimeEstimator, format_duration, parse_status_and_error
+from cricket.impact import ImpactIndex
+from cricket.instrumentation import (
+    ResourceMonitor, format_resource, format_size, resident_set_size, worst_offenders
+)
 from cricket.model import TestMethod
+from cricket.pipes import PipedTestRunner
+from cricket.profiling import aggregate, function_label, hotspots, profile_summary
+from cricket.watch import Watcher, modified_files
 
 
 class TestErrorAndStatus(unittest.TestCase):
@@ -51,3 +68,331 @@ class TestErrorAndStatus(unittest.TestCase):
                     'output': '',
                 })
                 self.assertIsNone(error)
+
+
+class TestModifiedFiles(unittest.TestCase):
+    def test_no_changes(self):
+        snapshot = {'a.py': 1.0, 'b.py': 2.0}
+        self.assertEqual(modified_files(snapshot, dict(snapshot)), set())
+
+    def test_modified_added_and_deleted(self):
+        before = {'same.py': 1.0, 'modified.py': 1.0, 'deleted.py': 1.0}
+        after = {'same.py': 1.0, 'modified.py': 2.0, 'added.py': 1.0}
+        self.assertEqual(
+            modified_files(before, after),
+            {'modified.py', 'added.py', 'deleted.py'}
+        )
+
+
+class TestWatcherScan(unittest.TestCase):
+    def test_scan(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for dirname in ('pkg', '__pycache__', '.git'):
+                os.mkdir(os.path.join(tmpdir, dirname))
+            for filename in ('top.py', 'pkg/mod.py', 'pkg/data.txt', '__pycache__/x.py', '.git/y.py'):
+                with open(os.path.join(tmpdir, filename), 'w'):
+                    pass
+
+            snapshot = Watcher(on_change=None, path=tmpdir).scan()
+
+        self.assertEqual(
+            sorted(snapshot),
+            [os.path.join('pkg', 'mod.py'), 'top.py']
+        )
+
+
+class TestImpactIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ImpactIndex()
+        self.index.tests = {
+            'tests.test_a.ATests.test_one': {'app/a.py', 'app/util.py'},
+            'tests.test_b.BTests.test_one': {'app/b.py', 'app/util.py'},
+        }
+
+    def test_affected_tests(self):
+        test_paths = [
+            'tests.test_a.ATests.test_one',
+            'tests.test_b.BTests.test_one',
+            'tests.test_c.CTests.test_one',
+        ]
+        # A test that isn't in the index is always affected.
+        self.assertEqual(
+            self.index.affected_tests(test_paths, changed_files={'app/a.py'}),
+            ['tests.test_a.ATests.test_one', 'tests.test_c.CTests.test_one']
+        )
+        self.assertEqual(
+            self.index.affected_tests(test_paths, changed_files={'app/util.py'}),
+            test_paths
+        )
+        self.assertEqual(
+            self.index.affected_tests(test_paths, changed_files=set()),
+            ['tests.test_c.CTests.test_one']
+        )
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.index.filename = os.path.join(tmpdir, '.cricket', 'impact.json')
+            self.index.timestamp = 1500000000
+            self.index.save()
+
+            loaded = ImpactIndex.load(self.index.filename)
+
+        self.assertEqual(loaded.tests, self.index.tests)
+        self.assertEqual(loaded.timestamp, 1500000000)
+
+    def test_load_missing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = ImpactIndex.load(os.path.join(tmpdir, 'impact.json'))
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.timestamp)
+
+
+class TestFormatDuration(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(format_duration(5.5), '5s')
+        self.assertEqual(format_duration(90), '1 min')
+        self.assertEqual(format_duration(600), '10 mins')
+        self.assertEqual(format_duration(3600), '1 hour')
+        self.assertEqual(format_duration(5400), '1 hour')
+        self.assertEqual(format_duration(3 * 3600 + 59), '3 hours')
+
+
+class TestRemainingTimeEstimator(unittest.TestCase):
+    def make_tests(self, *durations):
+        return [
+            SimpleNamespace(path='test_{}'.format(i), duration=duration)
+            for i, duration in enumerate(durations)
+        ]
+
+    def test_history(self):
+        "Tests are expected to take as long as they did last time"
+        estimator = RemainingTimeEstimator(self.make_tests(1.0, 60.0, 2.0))
+        self.assertEqual(estimator.estimate(0), (63.0, 1.0))
+
+        # The slow test is still to come.
+        estimator.record('test_0', 1.0)
+        self.assertEqual(estimator.estimate(1.0), (62.0, 1.0))
+
+    def test_speed(self):
+        "Known durations are scaled by the speed of this run"
+        estimator = RemainingTimeEstimator(self.make_tests(9.0, 10.0))
+        estimator.record('test_0', 19.0)
+        remaining, confidence = estimator.estimate(19.0)
+        self.assertAlmostEqual(remaining, 20.0)
+        self.assertEqual(confidence, 1.0)
+
+    def test_unknown(self):
+        "Tests without a history are expected to take as long as the tests run so far"
+        estimator = RemainingTimeEstimator(self.make_tests(None, None, None, 4.0))
+        remaining, confidence = estimator.estimate(0)
+        self.assertEqual(remaining, 16.0)
+        self.assertEqual(confidence, 0.25)
+
+        estimator.record('test_0', 1.0)
+        remaining, confidence = estimator.estimate(2.0)
+        self.assertAlmostEqual(remaining, 4.0 + 2 * 2.0)
+        self.assertAlmostEqual(confidence, 0.5)
+
+        estimator.record('test_1', 2.0)
+        estimator.record('test_2', 2.0)
+        estimator.record('test_3', 4.0)
+        self.assertEqual(estimator.estimate(10.0), (0.0, 1.0))
+
+
+class ExitedProcess:
+    "A test runner process that has exited, but hasn't been waited on yet."
+    def __init__(self, output):
+        self.stdout = asyncio.StreamReader()
+        self.stdout.feed_data(output)
+        self.stdout.feed_eof()
+        self.returncode = None
+
+    def terminate(self):
+        raise ProcessLookupError()
+
+    async def wait(self):
+        self.returncode = 0
+        return self.returncode
+
+
+class TestExecutorProcess(unittest.TestCase):
+    def execute(self, output, stopped=False, maxfail=None):
+        "Run an executor over the output of a test runner that has already exited."
+        test_suite = SimpleNamespace(
+            maxfail=maxfail,
+            execute_commandline=lambda labels_file, profile: ['runtests'],
+            batch=contextlib.nullcontext,
+        )
+        executor = Executor(test_suite)
+        executor.stopped = stopped
+        executor.result_count = {TestMethod.STATUS_FAIL: 1}
+        proc = ExitedProcess(output)
+
+        async def create_subprocess_exec(*args, **kwargs):
+            return proc
+
+        loop = asyncio.new_event_loop()
+        try:
+            with mock.patch('cricket.executor.asyncio.create_subprocess_exec', create_subprocess_exec):
+                loop.run_until_complete(executor._execute(None, False))
+        finally:
+            loop.close()
+        return proc
+
+    def test_stopped(self):
+        "A runner that exits while it is being stopped is still waited on"
+        proc = self.execute(b'', stopped=True)
+        self.assertEqual(proc.returncode, 0)
+
+    def test_maxfail(self):
+        "A runner that exits once the maximum number of failures is reached is still waited on"
+        output = '\n'.join([
+            PipedTestRunner.START_TEST_RESULTS,
+            '{"path": "tests.A.test_a", "start_time": 0}',
+        ]).encode('utf-8')
+        proc = self.execute(output, maxfail=1)
+        self.assertEqual(proc.returncode, 0)
+
+
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+
+class TestProfiling(unittest.TestCase):
+    def test_profile_summary(self):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        _busy(10000)
+        profiler.disable()
+
+        summary = profile_summary(profiler, limit=3)
+
+        # At most `limit` rows by own time, and `limit` by cumulative time.
+        self.assertLessEqual(len(summary), 6)
+        functions = [row[2] for row in summary]
+        self.assertIn('_busy', functions)
+        # The profiler itself isn't reported.
+        self.assertFalse([f for f in functions if 'disable' in f])
+        # Rows are in order of decreasing cumulative time.
+        cumulative = [row[5] for row in summary]
+        self.assertEqual(cumulative, sorted(cumulative, reverse=True))
+        # Paths are relative to the current directory.
+        [row] = [row for row in summary if row[2] == '_busy']
+        self.assertEqual(row[0], os.path.relpath(__file__))
+        self.assertEqual(row[3], 1)
+
+    def test_aggregate(self):
+        combined = aggregate([
+            [['a.py', 1, 'f', 1, 0.5, 1.0], ['~', 0, 'len', 10, 0.1, 0.1]],
+            [['a.py', 1, 'f', 2, 0.25, 0.5]],
+        ])
+
+        self.assertEqual(sorted(combined), [
+            ['a.py', 1, 'f', 3, 0.75, 1.5],
+            ['~', 0, 'len', 10, 0.1, 0.1],
+        ])
+
+    def test_aggregate_does_not_modify_profiles(self):
+        profile = [['a.py', 1, 'f', 1, 0.5, 1.0]]
+        aggregate([profile, profile])
+        self.assertEqual(profile, [['a.py', 1, 'f', 1, 0.5, 1.0]])
+
+    def test_hotspots(self):
+        profile = [
+            ['a.py', 1, 'f', 1, 0.1, 3.0],
+            ['a.py', 5, 'g', 1, 0.3, 0.3],
+            ['a.py', 9, 'h', 1, 0.2, 0.2],
+        ]
+
+        self.assertEqual([row[2] for row in hotspots(profile, limit=2)], ['g', 'h'])
+
+    def test_function_label(self):
+        self.assertEqual(function_label(['a.py', 12, 'f', 1, 0.1, 0.1]), 'f (a.py:12)')
+        self.assertEqual(
+            function_label(['~', 0, "<built-in method builtins.len>", 1, 0.1, 0.1]),
+            "<built-in method builtins.len>",
+        )
+
+
+class TestResourceMonitor(unittest.TestCase):
+    def setUp(self):
+        # Starting a monitor starts tracing memory allocations.
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+
+    def test_usage(self):
+        monitor = ResourceMonitor()
+        monitor.start()
+
+        data = bytearray(1024 * 1024)
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+        with tempfile.TemporaryFile():
+            usage = monitor.usage()
+            if usage['fds'] is not None:
+                self.assertGreaterEqual(usage['fds'], 1)
+
+        self.assertGreaterEqual(usage['peak_memory'], len(data))
+        self.assertEqual(usage['threads'], 1)
+        self.assertGreaterEqual(usage['wall_time'], 0)
+        self.assertGreaterEqual(usage['cpu_time'], 0)
+
+    def test_restart(self):
+        monitor = ResourceMonitor()
+        monitor.start()
+        data = bytearray(1024 * 1024)
+        del data
+
+        # Starting the monitor resets the peak.
+        monitor.start()
+        self.assertLess(monitor.usage()['peak_memory'], 1024 * 1024)
+
+    def test_resident_set_size(self):
+        self.assertGreater(resident_set_size(), 0)
+
+        # If /proc isn't available, the peak size is used.
+        with mock.patch('builtins.open', side_effect=OSError):
+            self.assertGreater(resident_set_size(), 0)
+
+        with mock.patch('builtins.open', side_effect=OSError):
+            with mock.patch('cricket.instrumentation.resource', None):
+                self.assertIsNone(resident_set_size())
+
+
+class TestFormatResource(unittest.TestCase):
+    def test_format_size(self):
+        self.assertEqual(format_size(0), '0 B')
+        self.assertEqual(format_size(1023), '1023 B')
+        self.assertEqual(format_size(1536), '1.5 KiB')
+        self.assertEqual(format_size(-3 * 1024 * 1024), '-3.0 MiB')
+        self.assertEqual(format_size(5 * 1024 ** 3), '5.0 GiB')
+        self.assertEqual(format_size(5 * 1024 ** 4), '5120.0 GiB')
+
+    def test_format_resource(self):
+        self.assertEqual(format_resource('rss', 2048), '2.0 KiB')
+        self.assertEqual(format_resource('peak_memory', 100), '100 B')
+        self.assertEqual(format_resource('wall_time', 1.23456), '1.235s')
+        self.assertEqual(format_resource('fds', -1), '-1')
+        self.assertEqual(format_resource('threads', 2), '2')
+        self.assertEqual(format_resource('rss', None), '-')
+
+
+class TestWorstOffenders(unittest.TestCase):
+    def test_order(self):
+        tests = [
+            SimpleNamespace(path='a', resources={'rss': 10}),
+            SimpleNamespace(path='b', resources=None),
+            SimpleNamespace(path='c', resources={'rss': None}),
+            SimpleNamespace(path='d', resources={'rss': 300}),
+            SimpleNamespace(path='e', resources={'rss': -5}),
+        ]
+
+        # Tests without a measurement come last; tests that weren't
+        # measured at all aren't included.
+        self.assertEqual(
+            [test.path for test in worst_offenders(tests, 'rss')],
+            ['d', 'a', 'e', 'c'],
+        )
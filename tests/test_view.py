@@ -0,0 +1,272 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from cricket.model import TestMethod
+from cricket.pytest.model import PyTestTestSuite
+from cricket.unittest.model import UnittestTestSuite
+from cricket.view import Cricket, coverage
+
+
+class RunQueueTests(unittest.TestCase):
+    "Check that run requests are queued behind the run in progress."
+    def setUp(self):
+        # The app isn't started; only the state used by the run queue
+        # is set up. Runs are recorded rather than executed, and each
+        # run lasts until self.finish is set.
+        self.app = Cricket.__new__(Cricket)
+        self.app.executor = None
+        self.app.run_queue = []
+        self.app.queue_running = False
+        self.app.run_status = SimpleNamespace(text='')
+        self.app.run = self.record_run
+        self.app.stop = self.stop_run
+
+        # Discovery has already finished.
+        self.loop = asyncio.new_event_loop()
+        self.app.discovery = self.loop.create_future()
+        self.app.discovery.set_result(None)
+        self.finish = asyncio.Event(**self._event_loop_kwargs())
+        self.runs = []
+        self.quiet = []
+        self.stopped = 0
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _event_loop_kwargs(self):
+        # Before Python 3.10, an Event is bound to a loop when it is created.
+        try:
+            asyncio.Event(loop=self.loop)
+        except TypeError:
+            return {}
+        return {'loop': self.loop}
+
+    async def record_run(self, active=True, status=None, labels=None, quiet=False, **kwargs):
+        self.runs.append({'active': active, 'status': status, 'labels': labels})
+        self.quiet.append(quiet)
+        await self.finish.wait()
+
+    async def stop_run(self):
+        # Stopping ends the run in progress.
+        self.stopped += 1
+        self.finish.set()
+
+    def requests(self, *requests):
+        """Make a series of run requests, starting with a run of every test.
+
+        The first run is still in progress when the others are requested;
+        it finishes once every request has been made.
+        """
+        async def make_requests():
+            first = asyncio.ensure_future(self.app.request_run())
+            # Let the first run start.
+            await asyncio.sleep(0)
+            for request in requests:
+                await self.app.request_run(**request)
+            self.queued = list(self.app.run_queue)
+            self.finish.set()
+            await first
+
+        self.loop.run_until_complete(make_requests())
+
+    def test_idle(self):
+        "A request made when no run is in progress runs immediately"
+        self.finish.set()
+        self.loop.run_until_complete(self.app.request_run(labels={'app1'}))
+
+        self.assertEqual(self.runs, [{'active': True, 'status': None, 'labels': {'app1'}}])
+        self.assertFalse(self.app.queue_running)
+
+    def test_discovery(self):
+        "Requests made during discovery are run once discovery has finished"
+        self.finish.set()
+        self.app.discovery = self.loop.create_future()
+
+        async def discover():
+            request = asyncio.ensure_future(self.app.request_run(labels={'app1'}))
+            await asyncio.sleep(0)
+            self.assertEqual(self.runs, [])
+            self.app.discovery.set_result(None)
+            await request
+
+        self.loop.run_until_complete(discover())
+
+        self.assertEqual(self.runs, [{'active': True, 'status': None, 'labels': {'app1'}}])
+
+    def test_queue(self):
+        "Requests made during a run are run in order once it has finished"
+        self.requests(
+            {'labels': {'app1'}},
+            {'status': TestMethod.FAILING_STATES},
+        )
+
+        self.assertEqual(self.runs, [
+            {'active': True, 'status': None, 'labels': None},
+            {'active': True, 'status': None, 'labels': {'app1'}},
+            {'active': True, 'status': TestMethod.FAILING_STATES, 'labels': None},
+        ])
+        self.assertEqual(self.app.run_status.text, '2 run(s) queued.')
+        self.assertEqual(self.app.run_queue, [])
+        self.assertFalse(self.app.queue_running)
+
+    def test_merge(self):
+        "Requests that select tests the same way are merged into one run"
+        self.requests(
+            {'labels': {'app1', 'app2.TestCase'}},
+            {'labels': {'app2.TestCase', 'app3'}},
+        )
+
+        self.assertEqual(self.runs, [
+            {'active': True, 'status': None, 'labels': None},
+            {'active': True, 'status': None, 'labels': {'app1', 'app2.TestCase', 'app3'}},
+        ])
+
+    def test_merge_every_test(self):
+        "A request for every test absorbs any queued requests for labels"
+        self.requests(
+            {'labels': {'app1'}},
+            {'labels': None},
+            {'labels': {'app2'}},
+        )
+
+        self.assertEqual(self.runs, [
+            {'active': True, 'status': None, 'labels': None},
+            {'active': True, 'status': None, 'labels': None},
+        ])
+
+    def test_duplicate(self):
+        "Repeating a queued request doesn't queue another run"
+        self.requests(
+            {'labels': {'app1'}},
+            {'labels': {'app1'}},
+            {'labels': {'app1'}},
+        )
+
+        self.assertEqual([queued['labels'] for queued in self.queued], [{'app1'}])
+        self.assertEqual(len(self.runs), 2)
+
+    def test_merge_quiet(self):
+        "A quiet request merged with a request from the user isn't quiet"
+        self.requests(
+            {'labels': {'app1'}, 'quiet': True},
+            {'labels': {'app2'}},
+            {'status': TestMethod.FAILING_STATES, 'quiet': True},
+        )
+
+        self.assertEqual(self.runs, [
+            {'active': True, 'status': None, 'labels': None},
+            {'active': True, 'status': None, 'labels': {'app1', 'app2'}},
+            {'active': True, 'status': TestMethod.FAILING_STATES, 'labels': None},
+        ])
+        self.assertEqual(self.quiet, [False, False, True])
+
+    def test_replace(self):
+        "A replacing request cancels the current run, and anything queued"
+        self.requests(
+            {'labels': {'app1'}},
+            {'labels': {'app2'}, 'replace': True},
+        )
+
+        self.assertEqual(self.stopped, 1)
+        self.assertEqual(self.runs, [
+            {'active': True, 'status': None, 'labels': None},
+            {'active': True, 'status': None, 'labels': {'app2'}},
+        ])
+
+    def test_cancel_runs(self):
+        "Cancelling discards the queue, and stops the current run"
+        async def cancel():
+            first = asyncio.ensure_future(self.app.request_run())
+            await asyncio.sleep(0)
+            await self.app.request_run(labels={'app1'})
+            await self.app.cancel_runs()
+            await first
+
+        self.loop.run_until_complete(cancel())
+
+        self.assertEqual(self.stopped, 1)
+        self.assertEqual(self.runs, [{'active': True, 'status': None, 'labels': None}])
+        self.assertFalse(self.app.queue_running)
+
+
+class RunAffectedTests(unittest.TestCase):
+    "Check that affected tests can only be run if the coverage of each test is recorded."
+    def setUp(self):
+        self.app = Cricket.__new__(Cricket)
+
+    @unittest.skipIf(coverage is None, "coverage isn't installed")
+    def test_unittest(self):
+        self.app.test_suite = UnittestTestSuite()
+        self.assertTrue(self.app.can_run_affected())
+
+    def test_pytest(self):
+        self.app.test_suite = PyTestTestSuite()
+        self.assertFalse(self.app.can_run_affected())
+
+
+class WaitForCoverageTests(unittest.TestCase):
+    "Check that coverage data that can't be merged is reported."
+    def setUp(self):
+        self.app = Cricket.__new__(Cricket)
+        self.app.run_status = SimpleNamespace(text='')
+        self.failures = []
+
+        async def wait():
+            return self.failures
+
+        self.app.coverage_merger = SimpleNamespace(wait=wait)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_merged(self):
+        self.loop.run_until_complete(self.app.wait_for_coverage())
+        self.assertEqual(self.app.run_status.text, '')
+
+    def test_failures(self):
+        self.failures = ['.coverage.host.pid1.abc: file is not a database', 'disk full']
+        self.loop.run_until_complete(self.app.wait_for_coverage())
+        self.assertEqual(
+            self.app.run_status.text,
+            'Unable to merge coverage data: .coverage.host.pid1.abc: file is not a database; disk full'
+        )
+
+
+class SuiteEndTests(unittest.TestCase):
+    "Check how the results of a run are reported."
+    def setUp(self):
+        self.app = Cricket.__new__(Cricket)
+        self.app.executor = SimpleNamespace(
+            stopped=False,
+            maxfail_reached=False,
+            any_failed=0,
+            total_count=1,
+            result_count={TestMethod.STATUS_PASS: 1},
+        )
+        self.app.run_status = SimpleNamespace(text='')
+        self.app.run_summary = SimpleNamespace(text='')
+        self.app.resources_window = None
+        self.app.watcher = object()
+
+        patcher = mock.patch.object(Cricket, 'main_window', mock.Mock())
+        self.main_window = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_result_dialog(self):
+        "A run started by the user reports its results, even in watch mode"
+        self.app.quiet_run = False
+        self.app.executor_suite_end()
+
+        self.main_window.info_dialog.assert_called_once_with('Result', message='1 passed')
+
+    def test_quiet(self):
+        "A quiet run doesn't interrupt the user"
+        self.app.quiet_run = True
+        self.app.executor_suite_end()
+
+        self.assertEqual(self.app.run_status.text, 'Finished.')
+        self.main_window.info_dialog.assert_not_called()
+        self.main_window.error_dialog.assert_not_called()